@@ -725,7 +725,9 @@ class ToggleDoor(Interaction):
             spr = self.target.components.get(comp.ClosedSprite)
         if spr is not None:
             self.target.components[comp.Sprite] = spr
-        maps.update_map_light(self.target.relation_tag[comp.Map], True)
+        map_entity = self.target.relation_tag[comp.Map]
+        map_entity.components.pop(comp.OpaqueCells, None)
+        maps.update_map_light(map_entity, True)
         entities.update_fov(self.actor)
         aname = self.actor.components.get(comp.Name)
         if aname is not None:
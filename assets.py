@@ -1,4 +1,6 @@
+import io
 import os
+from collections import OrderedDict
 from functools import lru_cache
 
 import pygame as pg
@@ -43,6 +45,59 @@ def frames(name: str, pos: tuple[int, int], max_count: int = 2) -> list[pg.Surfa
     return res
 
 
+# Surfaces made by sprite(), least recently used first, and the bytes they hold
+sprite_cache: OrderedDict[tuple, pg.Surface] = OrderedDict()
+sprite_bytes = 0
+
+
+def sprite(
+    name: str,
+    pos: tuple[int, int],
+    frame: int,
+    angle: int,
+    tint: tuple[int, int, int] | None,
+    flip: bool,
+) -> pg.Surface:
+    """A frame rotated, tinted and flipped, made once and shared by every entity.
+
+    The least recently used variants are dropped once they hold more than
+    consts.SPRITE_CACHE_BYTES.
+    """
+    global sprite_bytes
+    key = (name, pos, frame, angle, tint, flip)
+    if key in sprite_cache:
+        sprite_cache.move_to_end(key)
+        return sprite_cache[key]
+    if flip:
+        surf = pg.transform.flip(
+            sprite(name, pos, frame, angle, tint, False), True, False
+        )
+    elif tint is not None:
+        surf = sprite(name, pos, frame, angle, None, False).copy()
+        surf.fill(tint, special_flags=pg.BLEND_MULT)
+    elif angle != 0:
+        surf = pg.transform.rotate(sprite(name, pos, frame, 0, None, False), angle)
+    else:
+        return frames(name, pos, frame + 1)[frame]
+    sprite_cache[key] = surf
+    sprite_bytes += surface_bytes(surf)
+    while sprite_bytes > consts.SPRITE_CACHE_BYTES and len(sprite_cache) > 1:
+        sprite_bytes -= surface_bytes(sprite_cache.popitem(last=False)[1])
+    return surf
+
+
+def surface_bytes(surf: pg.Surface) -> int:
+    return surf.get_bytesize() * surf.width * surf.height
+
+
+@lru_cache
+def blank(size: tuple[int, int]) -> pg.Surface:
+    """A transparent surface, shared, so never draw into it."""
+    surf = pg.Surface(size).convert_alpha()
+    surf.fill("#00000000")
+    return surf
+
+
 @lru_cache
 def font(name: str = consts.FONTNAME, size: int = consts.FONTSIZE) -> pg.Font:
     path = consts.GAME_PATH / "fonts" / f"{name}.ttf"
@@ -53,3 +108,13 @@ def font(name: str = consts.FONTNAME, size: int = consts.FONTSIZE) -> pg.Font:
 def sfx(name: str) -> pg.mixer.Sound:
     path = consts.GAME_PATH / "sfx" / f"{name}.ogg"
     return pg.mixer.Sound(path)
+
+
+def encode_png(surface: pg.Surface) -> bytes:
+    buffer = io.BytesIO()
+    pg.image.save(surface, buffer, "image.png")
+    return buffer.getvalue()
+
+
+def decode_png(data: bytes) -> pg.Surface:
+    return pg.image.load(io.BytesIO(data), "image.png")
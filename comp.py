@@ -1,6 +1,6 @@
 import datetime
 from collections import deque
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, auto
 from typing import Protocol
 
@@ -38,6 +38,72 @@ Seed = ("Seed", int)
 Depth = ("Depth", int)
 Tiles = ("Tiles", NDArray[np.int8])
 Explored = ("Explored", NDArray[np.bool_])
+# Cells taken by opaque entities, rebuilt after one of them moves
+OpaqueCells = ("OpaqueCells", NDArray[np.bool_])
+
+
+@dataclass
+class RoomGraph:
+    """Rooms, caves and corridors a level was generated from, and how they connect."""
+
+    # Index of the area each cell is in, -1 outside of all of them
+    area: NDArray[np.int16]
+    kinds: list[str]
+    centroids: list[tuple[int, int]]
+    # Indices of the areas touching each area
+    adjacency: list[list[int]]
+    # Door cells, with the areas on either side
+    doors: dict[tuple[int, int], tuple[int, int]]
+
+    def area_at(self, xy: tuple[int, int]) -> int:
+        return int(self.area[xy])
+
+    def neighbors(self, xy: tuple[int, int]) -> list[int]:
+        i = self.area_at(xy)
+        return self.adjacency[i] if i >= 0 else []
+
+
+Rooms = ("Rooms", RoomGraph)
+
+
+@dataclass
+class MapWindow:
+    """Values over a rectangle of a map, zero anywhere outside of it."""
+
+    origin: tuple[int, int]
+    values: NDArray
+
+    @property
+    def slices(self) -> tuple[slice, slice]:
+        x, y = self.origin
+        w, h = self.values.shape
+        return slice(x, x + w), slice(y, y + h)
+
+    def __getitem__(self, xy: tuple[int, int]):
+        x, y = xy[0] - self.origin[0], xy[1] - self.origin[1]
+        if 0 <= x < self.values.shape[0] and 0 <= y < self.values.shape[1]:
+            return self.values[x, y]
+        return self.values.dtype.type(0)
+
+    def full(self, shape: tuple[int, int]) -> NDArray:
+        grid = np.zeros(shape, self.values.dtype)
+        grid[self.slices] = self.values
+        return grid
+
+    def view(self, window: tuple[slice, slice]) -> NDArray:
+        """Values over a window of the map, without building the full map."""
+        wx, wy = window
+        grid = np.zeros((wx.stop - wx.start, wy.stop - wy.start), self.values.dtype)
+        x, y = self.origin
+        w, h = self.values.shape
+        x0, x1 = max(wx.start, x), min(wx.stop, x + w)
+        y0, y1 = max(wy.start, y), min(wy.stop, y + h)
+        if x0 < x1 and y0 < y1:
+            grid[x0 - wx.start : x1 - wx.start, y0 - wy.start : y1 - wy.start] = (
+                self.values[x0 - x : x1 - x, y0 - y : y1 - y]
+            )
+        return grid
+
 
 # Actor components
 Name = ("Name", str)
@@ -55,10 +121,11 @@ MaxHP = ("MaxHP", int)
 HP = ("HP", int)
 Hunger = ("Hunger", int)
 FOVRadius = ("FOVRadius", int)
-FOV = ("FOV", NDArray[np.bool_])
+FOV = ("FOV", MapWindow)
 Initiative = ("Initiative", float)
 LightRadius = ("LightRadius", int)
 Lightsource = ("Lightsource", NDArray[np.int8])
+Light = ("Light", MapWindow)
 Speed = ("Speed", int)
 TempInventory = ("TempInventory", dict[str, str])
 TempEquipment = ("TempEquipment", list[str])
@@ -100,6 +167,7 @@ LastPlayed = ("LastPlayed", datetime.datetime)
 PlayedTime = ("PlayedTime", float)
 MaxDepth = ("MaxDepth", int)
 PlayerSteps = ("PlayerSteps", float)
+MapShape = ("MapShape", tuple[int, int])
 
 
 class EquipSlot(Enum):
@@ -124,6 +192,90 @@ class Position:
 AITarget = ("AITarget", Position)
 
 
+@dataclass(frozen=True)
+class SpawnTable:
+    kinds: tuple[ecs.Entity, ...]
+    prob: NDArray[np.float64]
+    alias: NDArray[np.intp]
+
+    def sample(self, seed: np.random.RandomState) -> ecs.Entity | None:
+        if len(self.kinds) < 1:
+            return None
+        # Alias method: one uniform draw picks the bucket and the coin flip
+        u = seed.random() * len(self.kinds)
+        i = int(u)
+        if u - i >= self.prob[i]:
+            i = int(self.alias[i])
+        return self.kinds[i]
+
+
+SpawnTables = ("SpawnTables", dict[tuple[int, tuple[str, ...]], SpawnTable])
+
+
+@ecs.callbacks.register_component_changed(component=SpawnWeight)
+@ecs.callbacks.register_component_changed(component=SpawnWeightDecay)
+@ecs.callbacks.register_component_changed(component=NativeDepth)
+@ecs.callbacks.register_component_changed(component=MinDepth)
+@ecs.callbacks.register_component_changed(component=MaxDepth)
+def on_spawn_data_changed(entity: ecs.Entity, old: object, new: object) -> None:
+    """Drop compiled spawn tables when template spawn data changes."""
+    if old == new or entity == entity.registry[None]:
+        return
+    entity.registry[None].components.pop(SpawnTables, None)
+
+
+@dataclass(frozen=True)
+class Blueprint:
+    hp_dice: str | None
+    inventory: tuple[tuple[ecs.Entity, str], ...]
+    equipment: tuple[tuple[ecs.Entity, str | None], ...]
+    equipped: tuple[tuple[EquipSlot, int], ...]
+    lit: bool
+
+
+Blueprints = ("Blueprints", dict[ecs.Entity, Blueprint])
+
+
+@ecs.callbacks.register_component_changed(component=HPDice)
+@ecs.callbacks.register_component_changed(component=TempInventory)
+@ecs.callbacks.register_component_changed(component=TempEquipment)
+@ecs.callbacks.register_component_changed(component=SpawnCount)
+@ecs.callbacks.register_component_changed(component=EquipSlot)
+@ecs.callbacks.register_component_changed(component=LightRadius)
+def on_blueprint_data_changed(entity: ecs.Entity, old: object, new: object) -> None:
+    """Drop prebuilt blueprints when creature or item template data changes."""
+    if old == new:
+        return
+    entity.registry[None].components.pop(Blueprints, None)
+
+
+@dataclass
+class SaveChunks:
+    """Stable ids for anonymous entities and levels still waiting in a save file."""
+
+    path: str | None = None
+    unloaded: set[int] = field(default_factory=set)
+    saved: set[int] = field(default_factory=set)
+    dirty: set[int] = field(default_factory=set)
+    next_id: int = 0
+    ids: dict[object, int] = field(default_factory=dict)
+    objects: dict[int, object] = field(default_factory=dict)
+
+    def id_of(self, uid: object) -> int:
+        if uid not in self.ids:
+            self.ids[uid] = self.next_id
+            self.objects[self.next_id] = uid
+            self.next_id += 1
+        return self.ids[uid]
+
+    def object_of(self, i: int) -> object:
+        if i not in self.objects:
+            uid = object()
+            self.objects[i] = uid
+            self.ids[uid] = i
+        return self.objects[i]
+
+
 # See https://python-tcod.readthedocs.io/en/latest/tutorial/part-02.html#ecs-components
 @ecs.callbacks.register_component_changed(component=Position)
 def on_position_changed(
@@ -132,6 +284,21 @@ def on_position_changed(
     """Mirror position components as a tag."""
     if old == new:  # New position is equivalent to its previous value
         return  # Ignore and return
+    chunks = entity.registry[None].components.get(SaveChunks)
+    if chunks is not None:  # Mark levels whose save chunks are out of date
+        if old is not None:
+            chunks.dirty.add(old.depth)
+        if new is not None:
+            chunks.dirty.add(new.depth)
+    if Opaque in entity.tags:  # Opaque cells of both maps are out of date
+        for pos in (old, new):
+            if pos is not None:
+                entity.registry[(Map, pos.depth)].components.pop(OpaqueCells, None)
+    if Lit in entity.tags or Light in entity.components:  # So is their light
+        for pos in (old, new):
+            if pos is not None:
+                entity.registry[(Map, pos.depth)].components.pop(Lightsource, None)
+        entity.components.pop(Light, None)  # Recomputed at the new position
     if old is not None:  # Position component removed or changed
         entity.tags.discard(old)  # Remove old position from tags
         if Map in entity.relation_tag:
@@ -139,6 +306,18 @@ def on_position_changed(
     if new is not None:  # Position component added or changed
         entity.tags.add(new)  # Add new position to tags
         entity.relation_tag[Map] = entity.registry[(Map, new.depth)]
+    changes = entity.registry[None].components.get(SpriteChanges)
+    if changes is not None and Sprite in entity.components:  # Sprite moved
+        changes.add(entity)
+
+
+@ecs.callbacks.register_component_changed(component=Light)
+def on_light_changed(
+    entity: ecs.Entity, old: MapWindow | None, new: MapWindow | None
+) -> None:
+    """Drop the light composited over the map the entity is on."""
+    if Map in entity.relation_tag:
+        entity.relation_tag[Map].components.pop(Lightsource, None)
 
 
 @dataclass(frozen=True)
@@ -148,6 +327,20 @@ class Sprite:
     angle: int = 0
 
 
+# Entities whose sprite appeared, moved or went away, drained by the renderer
+SpriteChanges = ("SpriteChanges", set[ecs.Entity])
+
+
+@ecs.callbacks.register_component_changed(component=Sprite)
+def on_sprite_changed(entity: ecs.Entity, old: Sprite | None, new: Sprite | None):
+    """Tell the renderer when an entity gains or loses its sprite."""
+    if (old is None) == (new is None):
+        return
+    changes = entity.registry[None].components.get(SpriteChanges)
+    if changes is not None:
+        changes.add(entity)
+
+
 OpenSprite = ("OpenSprite", Sprite)
 ClosedSprite = ("ClosedSprite", Sprite)
 LockedSprite = ("LockedSprite", Sprite)
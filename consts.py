@@ -10,7 +10,25 @@ GAME_PATH = pathlib.Path(__file__).parent
 SAVE_PATH = pathlib.Path(pg.system.get_pref_path(GAME_ID, GAME_ID))
 
 SCREEN_SHAPE = (640, 480)
+THUMBNAIL_SHAPE = (320, 240)
 FPS = 60
+# Redraw only the parts of the in-game screen that changed
+DIRTY_RECTS = True
+# Light the map by multiplying one lightmap over untinted tiles and sprites
+LIGHTMAP = True
+# Interpolate the lightmap between cells instead of lighting whole cells
+SMOOTH_LIGHTMAP = False
+# Bytes of rotated, tinted and flipped sprites kept for reuse
+SPRITE_CACHE_BYTES = 16 * 2**20
+# Sprite rotations are rounded to this many degrees, so they share surfaces
+SPRITE_ANGLE_STEP = 5
+
+AUTOSAVE_TURNS = 20
+SAVE_JOURNAL_LIMIT = 2**20
+# Generated levels, keyed by their seed and a hash of the code and data
+LEVEL_CACHE_PATH = SAVE_PATH / "levels"
+# Off in play, where world seeds rarely repeat, tools that revisit seeds set it
+LEVEL_CACHE_SIZE = 0
 
 TILE_SIZE = 16
 ENTITY_YOFFSET = TILE_SIZE // 4
@@ -47,6 +65,8 @@ MINIMAP_PLAYER_COLOR = "#597DCF"
 MINIMAP_INTERACT_COLOR = "#DBD75D"
 MINIMAP_CREATURE_COLOR = "#D34549"
 
+SAVING_TEXT_COLOR = "#FFFFFF"
+
 LOG_TEXT_COLOR = "#FFFFFF"
 POPUP_TEXT_COLOR = "#FFFFFF"
 TOOLTIP_TEXT_COLOR = "#FFFFFF"
@@ -7,8 +7,10 @@ import tcod.ecs as ecs
 import yaml  # type: ignore
 from numpy.typing import NDArray
 
+# comp first, it imports actions and everything actions needs. Pregeneration
+# workers import this module before any other
+import comp  # isort: skip
 import actions
-import comp
 import consts
 
 tiles: NDArray[np.void]
@@ -18,6 +20,9 @@ opaque: NDArray[np.bool_]
 obstacle: NDArray[np.bool_]
 transparency: NDArray[np.bool_]
 walkable: NDArray[np.bool_]
+# Base tile of every tile id, and (base tile, bitmask) -> autotiled variant
+tile_base: NDArray[np.int8]
+autotile: NDArray[np.int8]
 
 
 def load_tiles() -> None:
@@ -26,6 +31,7 @@ def load_tiles() -> None:
         data = yaml.safe_load(file)
     tile_list = []
     names: list[str] = []
+    variants: dict[int, dict[int, int]] = {}
     for k, v in data.items():
         obstacle_ = v["obstacle"] if "obstacle" in v else True
         opaque_ = v["opaque"] if "opaque" in v else True
@@ -39,9 +45,12 @@ def load_tiles() -> None:
             (obstacle_, opaque_, color, sprite, sheet, bgtile), consts.TILE_DTYPE
         )
         tile_list.append(tile)
+        base = len(names)
         names.append(k)
         if "sheet" != "" and "bitmask" in v:
+            variants[base] = {}
             for bm, sprite in v["bitmask"].items():
+                variants[base][int(bm)] = len(names)
                 names.append(f"{k}{bm}")
                 tile = np.asarray(
                     (obstacle_, opaque_, color, sprite, sheet, bgtile),
@@ -49,6 +58,7 @@ def load_tiles() -> None:
                 )
                 tile_list.append(tile)
     global tiles, tile_names, tile_id, opaque, obstacle, transparency, walkable
+    global tile_base, autotile
     tiles = np.asarray(tile_list, consts.TILE_DTYPE)
     tile_names = names
     tile_id = {s: i for i, s in enumerate(names)}
@@ -56,6 +66,12 @@ def load_tiles() -> None:
     obstacle = tiles["obstacle"]
     transparency = ~opaque
     walkable = ~obstacle
+    tile_base = np.arange(len(names), dtype=np.int8)
+    autotile = np.repeat(tile_base[:, np.newaxis], 16, axis=1)
+    for base, masks in variants.items():
+        for bm, variant in masks.items():
+            tile_base[variant] = base
+            autotile[base, bm] = variant
 
 
 def load_entity(
@@ -176,7 +192,7 @@ def load_unknowns(reg: ecs.Registry):
 def pick_unknown(reg: ecs.Registry, kind: str) -> ecs.Entity | None:
     g_key = f"unknown_{kind}"
     query = reg.Q.all_of(tags=[g_key]).none_of(tags=["unknown_used"])
-    kinds = list(query.get_entities())
+    kinds = sorted(query.get_entities(), key=lambda e: str(e.uid))
     seed = reg[None].components[np.random.RandomState]
     i = seed.randint(0, len(kinds))
     picked = kinds[i]
@@ -1,9 +1,11 @@
 import random
 import re
+from functools import lru_cache
 
 import numpy as np
 
 
+@lru_cache
 def dice_expand(expression: str, sub: str) -> str:
     return re.sub(
         r"(\d*)d(\d+)",
@@ -40,3 +42,19 @@ def dice_roll(
     else:
         locals = locals | {"dice": dice}
     return eval(dice_expand(expression, "dice(%s)"), None, locals)
+
+
+def dice_rolls(
+    expression: str,
+    seed: random.Random | np.random.RandomState,
+    count: int,
+    locals: dict | None = None,
+) -> np.ndarray:
+    if not isinstance(seed, np.random.RandomState):
+        return np.asarray(
+            [dice_roll(expression, seed, locals) for _ in range(count)]
+        )
+    dice = lambda x: seed.randint(1, x + 1, count)
+    locals = (locals or {}) | {"dice": dice, "min": np.minimum, "max": np.maximum}
+    res = eval(dice_expand(expression, "dice(%s)"), None, locals)
+    return np.broadcast_to(res, (count,))
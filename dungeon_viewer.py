@@ -1,25 +1,52 @@
 #!/usr/bin/env python3
+"""Browse generated levels, one world seed at a time or as a gallery of seeds.
 
+The gallery generates every seed in a worker process and shows the levels of
+each seed as minimaps, one row per seed, as soon as they are done. The whole
+sheet can be exported to PNG, also without opening a window with --export.
+"""
+
+import argparse
+import multiprocessing
 import os
+import pathlib
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
 
+import numpy as np
 import pygame as pg
+from numpy.typing import NDArray
 
+import assets
 import comp
 import consts
+import db
 import entities
 import game_interface
+import game_logic
 import items
 import keybinds
 import map_renderer
 import maps
 import ui_elements
 
+# Pixels per map cell in the gallery sheet, and space around thumbnails
+GALLERY_SCALE = 2
+GALLERY_MARGIN = 8
+# Generated levels kept on disk, seeds are viewed again and again here
+LEVEL_CACHE_SIZE = 256
+
 
 class DungeonViewerState(game_interface.State):
-    def __init__(self, parent: game_interface.GameInterface | game_interface.State):
+    def __init__(
+        self,
+        parent: game_interface.GameInterface | game_interface.State,
+        seed: int | None = None,
+        depth: int = 0,
+    ):
         super().__init__(parent)
         self.logic = self.interface.logic
-        self.new_world()
+        self.new_world(seed)
         self.ui_group: pg.sprite.Group = pg.sprite.Group()
         self.minimap = ui_elements.Minimap(self.ui_group, self.logic)
         self.map_renderer = map_renderer.MapRenderer(self.interface)
@@ -34,21 +61,22 @@ class DungeonViewerState(game_interface.State):
                 "FPS": lambda: int(self.interface.clock.get_fps()),
                 "Global Seed": lambda: self.logic.reg[None].components[comp.Seed],
                 "Map Seed": lambda: self.logic.map.components[comp.Seed],
+                "Sprite KB": lambda: assets.sprite_bytes // 1024,
             },
         )
+        self.set_depth(depth)
 
-    def new_world(self):
-        self.logic.new_game()
-        self.logic.map.components[comp.Explored] |= True
-        self.logic.map.components[comp.Lightsource] += 10
-        self.logic.player.components[comp.FOV] |= True
+    def new_world(self, seed: int | None = None):
+        # Levels of a world seed viewed before come from the level cache
+        self.logic.new_game(seed)
+        self.reveal_map()
         self.logic.player.tags |= {comp.HideSprite}
         self.logic.active = False
 
     def set_depth(self, depth: int):
         if depth < 0:
             return
-        if depth != self.map_renderer.depth:
+        if depth != self.logic.player.components[comp.Position].depth:
             self.logic.player.components[comp.Position] = comp.Position(
                 self.map_renderer.center, depth
             )
@@ -70,9 +98,17 @@ class DungeonViewerState(game_interface.State):
                 items.identify(e)
         # Display everything at full light
         entities.update_fov(self.logic.player)
-        self.logic.map.components[comp.Explored] |= True
-        self.logic.map.components[comp.Lightsource] += 10
-        self.logic.player.components[comp.FOV] |= True
+        self.reveal_map()
+
+    def reveal_map(self):
+        map_entity = self.logic.map
+        map_entity.components[comp.Explored] |= True
+        if comp.Lightsource not in map_entity.components:
+            maps.update_map_light(map_entity)
+        map_entity.components[comp.Lightsource] += 10
+        shape = map_entity.components[comp.Tiles].shape
+        fov = comp.MapWindow((0, 0), np.full(shape, True))
+        self.logic.player.components[comp.FOV] = fov
 
     def update(self):
         super().update()
@@ -98,6 +134,9 @@ class DungeonViewerState(game_interface.State):
                 self.set_depth(self.map_renderer.depth - 1)
             elif event.key == pg.K_F5:
                 self.new_world()
+            elif event.key == pg.K_g:
+                seed = self.logic.reg[None].components[comp.Seed]
+                self.interface.push(SeedGalleryState(self, seed))
 
         elif event.type == pg.MOUSEBUTTONUP and event.button == 1:
             self.map_renderer.center = self.map_renderer.screen_to_grid(*event.pos)
@@ -107,8 +146,213 @@ class DungeonViewerState(game_interface.State):
             self.map_renderer.cursor = self.map_renderer.screen_to_grid(*event.pos)
 
 
+def init_worker():
+    os.chdir(consts.GAME_PATH)
+    consts.LEVEL_CACHE_SIZE = LEVEL_CACHE_SIZE
+    db.load_tiles()
+
+
+def world_thumbnails(seed: int, depths: range) -> list[NDArray[np.uint8]]:
+    """Minimap colours of a range of levels of a world seed, fully explored."""
+    logic = game_logic.GameLogic()
+    logic.new_world(seed)
+    thumbnails = []
+    # Levels are laid out from the stairs of the one above, so start at the top
+    for depth in range(depths.stop):
+        map_entity = maps.get_map(logic.reg, depth)
+        if depth not in depths:
+            continue
+        map_entity.components[comp.Explored] |= True
+        shape = map_entity.components[comp.Tiles].shape
+        window = (slice(0, shape[0]), slice(0, shape[1]))
+        fov = np.full(shape, True)
+        thumbnails.append(ui_elements.minimap_colors(map_entity, window, fov))
+    return thumbnails
+
+
+def depth_range(text: str) -> range:
+    """Depths from the command line, A:B like a slice or N for 0:N."""
+    try:
+        start, _, stop = text.rpartition(":")
+        depths = range(int(start or 0), int(stop))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a depth range: {text!r}") from None
+    if depths.start < 0 or len(depths) < 1:
+        raise argparse.ArgumentTypeError(f"empty depth range: {text!r}")
+    return depths
+
+
+class SeedGallery:
+    """Sheet of level thumbnails, one row per seed, filled in as workers finish."""
+
+    def __init__(self, font: pg.Font, first_seed: int, seeds: int, depths: range):
+        self.font = font
+        self.first_seed = first_seed
+        self.seeds = seeds
+        self.depths = depths
+        map_w, map_h = consts.MAP_SHAPE
+        self.cell = (
+            map_w * GALLERY_SCALE + GALLERY_MARGIN,
+            map_h * GALLERY_SCALE + GALLERY_MARGIN,
+        )
+        self.label_width = font.size(str(first_seed + seeds - 1))[0] + GALLERY_MARGIN
+        self.header_height = font.get_height() + GALLERY_MARGIN
+        self.sheet = pg.Surface(
+            (
+                self.label_width + len(depths) * self.cell[0],
+                self.header_height + seeds * self.cell[1],
+            )
+        )
+        self.sheet.fill(consts.BACKGROUND_COLOR)
+        for column, depth in enumerate(depths):
+            self.draw_text(f"Depth {depth}", self.cell_rect(0, column).x, 0)
+        for row in range(seeds):
+            self.draw_text(str(first_seed + row), 0, self.cell_rect(row, 0).y)
+        context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(None, context, initializer=init_worker)
+        self.pending: dict[Future, int] = {
+            self.executor.submit(world_thumbnails, first_seed + row, depths): row
+            for row in range(seeds)
+        }
+
+    def draw_text(self, text: str, x: int, y: int):
+        image = self.font.render(text, False, consts.LOG_TEXT_COLOR)
+        self.sheet.blit(image, (x, y))
+
+    def cell_rect(self, row: int, column: int) -> pg.Rect:
+        x = self.label_width + column * self.cell[0]
+        y = self.header_height + row * self.cell[1]
+        w, h = self.cell
+        return pg.Rect(x, y, w - GALLERY_MARGIN, h - GALLERY_MARGIN)
+
+    @property
+    def done(self) -> bool:
+        return len(self.pending) < 1
+
+    def poll(self):
+        """Draw the thumbnails of every seed finished since the last call."""
+        for future in [f for f in self.pending if f.done()]:
+            row = self.pending.pop(future)
+            if future.cancelled():
+                continue
+            error = future.exception()
+            if error is not None:
+                print(f"Seed {self.first_seed + row} failed:")
+                traceback.print_exception(error)
+                rect = self.cell_rect(row, 0)
+                self.draw_text("failed", rect.x, rect.y)
+                continue
+            for column, colors in enumerate(future.result()):
+                image = pg.surfarray.make_surface(colors)
+                image = pg.transform.scale_by(image, GALLERY_SCALE)
+                # Maps of another size are cut or padded to the cell
+                self.sheet.blit(image, self.cell_rect(row, column), image.get_rect())
+
+    def seed_at(self, x: int, y: int) -> tuple[int, int] | None:
+        """World seed and depth of the thumbnail at a position of the sheet."""
+        row = (y - self.header_height) // self.cell[1]
+        column = (x - self.label_width) // self.cell[0]
+        if x < self.label_width or y < self.header_height:
+            return None
+        if not (0 <= row < self.seeds and 0 <= column < len(self.depths)):
+            return None
+        return self.first_seed + row, self.depths[column]
+
+    def export(self, path: str | pathlib.Path):
+        pg.image.save(self.sheet, path)
+        print(f"Gallery written to {path}")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SeedGalleryState(game_interface.State):
+    def __init__(
+        self,
+        parent: game_interface.GameInterface | game_interface.State,
+        first_seed: int = 1,
+        seeds: int = 8,
+        depths: range = range(4),
+    ):
+        super().__init__(parent)
+        self.seeds = seeds
+        self.depths = depths
+        self.gallery = SeedGallery(self.interface.font, first_seed, seeds, depths)
+
+    @property
+    def view_scale(self) -> float:
+        """Scale the sheet is shown at, shrunk to fit the screen."""
+        w, h = self.gallery.sheet.get_size()
+        screen_w, screen_h = self.interface.screen.get_size()
+        return min(1, screen_w / w, screen_h / h)
+
+    def set_page(self, first_seed: int):
+        self.gallery.close()
+        font = self.interface.font
+        self.gallery = SeedGallery(font, max(1, first_seed), self.seeds, self.depths)
+
+    def update(self):
+        super().update()
+        self.gallery.poll()
+
+    def render(self, screen: pg.Surface):
+        screen.fill(consts.BACKGROUND_COLOR)
+        screen.blit(pg.transform.scale_by(self.gallery.sheet, self.view_scale))
+
+    def handle_event(self, event: pg.Event):
+        if event.type == pg.KEYUP:
+            if event.key == pg.K_ESCAPE:
+                self.gallery.close()
+                self.interface.pop()
+            elif event.key == pg.K_PAGEDOWN:
+                self.set_page(self.gallery.first_seed + self.seeds)
+            elif event.key == pg.K_PAGEUP:
+                self.set_page(self.gallery.first_seed - self.seeds)
+            elif event.key == pg.K_F12:
+                first = self.gallery.first_seed
+                last = first + self.seeds - 1
+                self.gallery.export(consts.SAVE_PATH / f"gallery_{first}-{last}.png")
+
+        elif event.type == pg.MOUSEBUTTONUP and event.button == 1:
+            scale = self.view_scale
+            found = self.gallery.seed_at(
+                int(event.pos[0] / scale), int(event.pos[1] / scale)
+            )
+            if found is not None:
+                seed, depth = found
+                self.interface.push(DungeonViewerState(self, seed, depth))
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("seed", type=int, nargs="?", help="world seed")
+    parser.add_argument(
+        "--gallery", type=int, metavar="N", help="show N seeds from seed on"
+    )
+    parser.add_argument(
+        "--depths",
+        type=depth_range,
+        default=range(4),
+        metavar="A:B",
+        help="levels A to B - 1 of each seed, or the first N with a single number",
+    )
+    parser.add_argument("--export", metavar="PNG", help="write the gallery and exit")
+    args = parser.parse_args()
+    export = pathlib.Path(args.export).absolute() if args.export else None
     os.chdir(consts.GAME_PATH)
+    consts.LEVEL_CACHE_SIZE = LEVEL_CACHE_SIZE
     interface = game_interface.GameInterface()
-    interface.push(DungeonViewerState(interface))
-    interface.run()
+    seeds = args.gallery or (8 if export else None)
+    if seeds is None:
+        interface.push(DungeonViewerState(interface, args.seed))
+        interface.run()
+    elif export is not None:
+        gallery = SeedGallery(interface.font, args.seed or 1, seeds, args.depths)
+        while not gallery.done:
+            pg.time.wait(100)
+            gallery.poll()
+        gallery.export(export)
+        gallery.close()
+    else:
+        interface.push(SeedGalleryState(interface, args.seed or 1, seeds, args.depths))
+        interface.run()
@@ -127,29 +127,29 @@ def update_fov(actor: ecs.Entity):
         return
     map_entity = actor.relation_tag[comp.Map]
     update_entity_light(actor)
-    maps.update_map_light(map_entity)
+    if comp.Lightsource not in map_entity.components:
+        maps.update_map_light(map_entity)
     light = map_entity.components[comp.Lightsource]
-    #
-    transparency = maps.transparency_matrix(map_entity)
-    # Actor can see its own position
+    # Nothing further than radius can be seen, only compute that window
     xy = actor.components[comp.Position].xy
-    transparency[xy] = True
+    window = funcs.window(light.shape, xy, radius)
+    origin = (window[0].start, window[1].start)
+    x, y = xy[0] - origin[0], xy[1] - origin[1]
+    transparency = maps.transparency_matrix(map_entity, window=window)
+    # Actor can see its own position
+    transparency[x, y] = True
     # Update player FOV
     fov = tcod.map.compute_fov(
-        transparency, xy, radius, algorithm=tcod.constants.FOV_SYMMETRIC_SHADOWCAST
+        transparency, (x, y), radius, algorithm=tcod.constants.FOV_SYMMETRIC_SHADOWCAST
     )
-    fov &= light > 0
-    for dx in {-1, 0, 1}:
-        for dy in {-1, 0, 1}:
-            if maps.is_in_bounds(fov, (xy[0] + dx, xy[1] + dy)):
-                fov[xy[0] + dx, xy[1] + dy] = True
-    actor.components[comp.FOV] = fov
+    fov &= light[window] > 0
+    fov[max(0, x - 1) : x + 2, max(0, y - 1) : y + 2] = True
+    actor.components[comp.FOV] = comp.MapWindow(origin, fov)
     # Set map as explored if this is a player
     if comp.Player in actor.tags:
         if comp.Explored not in map_entity.components:
-            map_entity.components[comp.Explored] = fov.copy()
-        else:
-            map_entity.components[comp.Explored] |= fov
+            map_entity.components[comp.Explored] = np.full(light.shape, False)
+        map_entity.components[comp.Explored][window] |= fov
         creatures = enemies_in_fov(actor)
         for e in creatures:
             if comp.Seen not in e.tags:
@@ -189,31 +189,43 @@ def is_in_fov(
 def update_entity_light(entity: ecs.Entity):
     radius = light_radius(entity)
     if radius < 1 or comp.Lit not in entity.tags:
-        if comp.Lightsource in entity.components:
-            entity.components.pop(comp.Lightsource)
+        if comp.Light in entity.components:
+            entity.components.pop(comp.Light)
         return
     map_entity = entity.relation_tag[comp.Map]
     grid = map_entity.components[comp.Tiles]
-    transparency = maps.transparency_matrix(map_entity)
-    x, y = entity.components[comp.Position].xy
+    # One cell past the radius, so lit walls see their neighbours
+    xy = entity.components[comp.Position].xy
+    window = funcs.window(grid.shape, xy, radius + 1)
+    origin = (window[0].start, window[1].start)
+    x, y = xy[0] - origin[0], xy[1] - origin[1]
+    transparency = maps.transparency_matrix(map_entity, window=window)
     fov1 = tcod.map.compute_fov(transparency, (x, y), radius, light_walls=False)
     fov2 = tcod.map.compute_fov(transparency, (x, y), radius, light_walls=True)
     fov = fov1 | (fov2 & (funcs.moore(fov1 & transparency) > 0))
-    grid_x, grid_y = np.indices(grid.shape)
+    grid_x, grid_y = np.indices(transparency.shape)
     dist = ((grid_x - x) ** 2 + (grid_y - y) ** 2) ** 0.5
     light = np.astype(
         fov * (1 + radius - dist) / (1 + radius) * consts.MAX_LIGHT_RADIUS, np.int8
     )
-    entity.components[comp.Lightsource] = light
+    entity.components[comp.Light] = comp.MapWindow(origin, light)
 
 
 def enemies_in_fov(actor: ecs.Entity) -> set[ecs.Entity]:
     map_ = actor.relation_tag[comp.Map]
     if comp.Trap in actor.tags:
-        query = actor.registry.Q.all_of(
-            components=[comp.Position, comp.HP],
-            relations=[(comp.Map, map_)],
-        )
+        # Traps have no FOV radius and only notice their neighbours
+        pos = actor.components[comp.Position]
+        query = [
+            e
+            for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            for e in actor.registry.Q.all_of(
+                components=[comp.Position, comp.HP],
+                tags=[pos + (dx, dy)],
+                relations=[(comp.Map, map_)],
+            )
+        ]
     elif comp.Player not in actor.tags:
         query = actor.registry.Q.all_of(
             components=[comp.Position, comp.HP],
@@ -319,34 +331,92 @@ def enemy_action(actor: ecs.Entity) -> actions.Action:
     return actions.WaitAction(actor)
 
 
-def spawn_creature(
-    map_entity: ecs.Entity, pos: tuple[int, int], kind: str | ecs.Entity
-) -> ecs.Entity:
+def creature_blueprint(kind: ecs.Entity) -> comp.Blueprint:
+    cache = kind.registry[None].components.setdefault(comp.Blueprints, {})
+    if kind in cache:
+        return cache[kind]
+    reg = kind.registry
+    inventory = tuple(
+        (reg[("items", k)], str(v))
+        for k, v in kind.components.get(comp.TempInventory, {}).items()
+    )
+    equipment = tuple(
+        (reg[("items", k)], reg[("items", k)].components.get(comp.SpawnCount))
+        for k in kind.components.get(comp.TempEquipment, [])
+    )
+    # Resolve the equip sequence once, as items.equip would do it per spawn
+    slots: dict[comp.EquipSlot, int] = {}
+    for i, (item_kind, _) in enumerate(equipment):
+        slot = item_kind.components[comp.EquipSlot]
+        if slot in slots and slot == comp.EquipSlot.Main_Hand:
+            slots[comp.EquipSlot.Ready] = slots[slot]
+        slots[slot] = i
+    lit = any(comp.LightRadius in k.components for k, _ in equipment)
+    blueprint = comp.Blueprint(
+        kind.components.get(comp.HPDice),
+        inventory,
+        equipment,
+        tuple(slots.items()),
+        lit,
+    )
+    cache[kind] = blueprint
+    return blueprint
+
+
+def spawn_creatures(
+    map_entity: ecs.Entity,
+    positions: list[tuple[int, int]],
+    kind: str | ecs.Entity,
+) -> list[ecs.Entity]:
     if isinstance(kind, str):
         kind = map_entity.registry[("creatures", kind)]
-    entity = kind.instantiate()
+    n = len(positions)
+    if n < 1:
+        return []
+    blueprint = creature_blueprint(kind)
     depth = map_entity.components[comp.Depth]
     seed = map_entity.components[np.random.RandomState]
-    if comp.HPDice in kind.components:
-        maxhp = dice.dice_roll(kind.components[comp.HPDice], seed)  # type: ignore
-        entity.components[comp.MaxHP] = int(maxhp)
-    if comp.MaxHP in entity.components:
-        entity.components[comp.HP] = entity.components[comp.MaxHP]
-    entity.components[comp.Position] = comp.Position(pos, depth)
-    entity.components[comp.Initiative] = 0
-    if comp.TempInventory in kind.components:
-        for k, v in kind.components[comp.TempInventory].items():
-            q = max(0, int(dice.dice_roll(v, seed)))
-            if q > 0:
-                items.add_item(entity, k, q)
-    if comp.TempEquipment in kind.components:
-        for k in kind.components[comp.TempEquipment]:
-            item = items.add_item(entity, k, 1)
-            if comp.SpawnCount in item.components:
-                count = dice.dice_roll(item.components[comp.SpawnCount], seed)
-                item.components[comp.Count] = count
-            items.equip(entity, item)
-    return entity
+    # Roll every dice expression once for the whole batch
+    if blueprint.hp_dice is not None:
+        maxhp = dice.dice_rolls(blueprint.hp_dice, seed, n)
+    quantities = [dice.dice_rolls(v, seed, n) for _, v in blueprint.inventory]
+    counts = [
+        None if expr is None else dice.dice_rolls(expr, seed, n)
+        for _, expr in blueprint.equipment
+    ]
+    spawned = []
+    for i, pos in enumerate(positions):
+        entity = kind.instantiate()
+        if blueprint.hp_dice is not None:
+            entity.components[comp.MaxHP] = int(maxhp[i])
+        if comp.MaxHP in entity.components:
+            entity.components[comp.HP] = entity.components[comp.MaxHP]
+        entity.components[comp.Position] = comp.Position(pos, depth)
+        entity.components[comp.Initiative] = 0
+        for (item_kind, _), q in zip(blueprint.inventory, quantities):
+            if q[i] > 0:
+                items.add_item(entity, item_kind, int(q[i]))
+        equipment = []
+        for (item_kind, _), count in zip(blueprint.equipment, counts):
+            item = items.add_item(entity, item_kind, 1)
+            if count is not None:
+                item.components[comp.Count] = int(count[i])
+            equipment.append(item)
+        for slot, j in blueprint.equipped:
+            entity.relation_tag[slot] = equipment[j]
+        if blueprint.lit:
+            # Light is computed lazily by maps.update_map_light
+            entity.tags |= {comp.Lit}
+        spawned.append(entity)
+    if blueprint.lit:
+        map_entity.components.pop(comp.Lightsource, None)
+    return spawned
+
+
+def spawn_creature(
+    map_entity: ecs.Entity, pos: tuple[int, int], kind: str | ecs.Entity
+) -> ecs.Entity:
+    return spawn_creatures(map_entity, [pos], kind)[0]
 
 
 def hunger(actor: ecs.Entity) -> int:
@@ -1,24 +1,132 @@
+import functools
+
 import numpy as np
-import scipy.signal  # type: ignore
 from numpy.typing import NDArray
 
 
 def moore(array: NDArray[np.bool_], diagonals: bool = True) -> NDArray[np.int8]:
-    if diagonals:
-        mask = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.int8)
-    else:
-        mask = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]], dtype=np.int8)
-    return scipy.signal.convolve(array, mask, mode="same", method="direct")
+    """Count the set neighbours of each cell, summing shifted views of the array."""
+    w, h = array.shape
+    padded = np.zeros((w + 2, h + 2), np.int8)
+    padded[1:-1, 1:-1] = array
+    count = np.zeros(array.shape, np.int8)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            if (dx or dy) and (diagonals or not (dx and dy)):
+                count += padded[1 + dx : 1 + dx + w, 1 + dy : 1 + dy + h]
+    return count
+
+
+# Bit set in a cell's mask when the neighbour at (x + dx, y + dy) has its value
+BITMASK_BITS = {(0, -1): 1, (-1, 0): 2, (1, 0): 4, (0, 1): 8}
+BITMASK_DIAGONAL_BITS = {
+    (1, -1): 1,
+    (0, -1): 2,
+    (-1, -1): 4,
+    (-1, 0): 8,
+    (1, 0): 16,
+    (1, 1): 32,
+    (0, 1): 64,
+    (-1, 1): 128,
+}
 
 
 def bitmask(array: NDArray, diagonals=False) -> NDArray[np.int16 | np.int8]:
-    mask: NDArray[np.int8 | np.int16]
-    if diagonals:
-        mask = np.array([[32, 64, 128], [16, 0, 8], [1, 2, 4]], dtype=np.int16).T
-    else:
-        mask = np.array([[0, 8, 0], [4, 0, 2], [0, 1, 0]], dtype=np.int8).T
-    grid = np.zeros(array.shape, dtype=mask.dtype)
-    for k in np.unique(array):
-        bmk = scipy.signal.convolve((array == k), mask, mode="same", method="direct")
-        grid[array == k] = bmk[array == k]
+    bits = BITMASK_DIAGONAL_BITS if diagonals else BITMASK_BITS
+    grid = np.zeros(array.shape, dtype=np.int16 if diagonals else np.int8)
+    w, h = array.shape
+    for (dx, dy), bit in bits.items():
+        # Compare every cell with its neighbour in one pass, borders count as different
+        dst = (slice(max(0, -dx), w - max(0, dx)), slice(max(0, -dy), h - max(0, dy)))
+        src = (slice(max(0, dx), w + min(0, dx)), slice(max(0, dy), h + min(0, dy)))
+        grid[dst] |= np.where(array[dst] == array[src], bit, 0).astype(grid.dtype)
     return grid
+
+
+def window(
+    shape: tuple[int, int], center: tuple[int, int], radius: int
+) -> tuple[slice, slice]:
+    """Slices of the square of cells within radius of center, clipped to shape."""
+    x, y = center
+    return (
+        slice(max(0, x - radius), min(shape[0], x + radius + 1)),
+        slice(max(0, y - radius), min(shape[1], y + radius + 1)),
+    )
+
+
+def alias_table(
+    weights: NDArray[np.float64] | list[float],
+) -> tuple[NDArray[np.float64], NDArray[np.intp]]:
+    # Vose's alias method: each bucket keeps its own index with probability
+    # prob[i] and falls back to alias[i] otherwise
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(weights)
+    if n < 1 or not np.sum(weights) > 0:
+        raise ValueError("alias table needs at least one positive weight")
+    scaled = weights * n / np.sum(weights)
+    prob = np.ones(n, dtype=np.float64)
+    alias = np.arange(n, dtype=np.intp)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1 - scaled[s]
+        if scaled[l] < 1:
+            small.append(l)
+        else:
+            large.append(l)
+    return prob, alias
+
+
+@functools.cache
+def disk(radius: int) -> NDArray[np.bool_]:
+    """Cells within radius of the centre of a (2 * radius + 1) square."""
+    dx, dy = np.indices((2 * radius + 1, 2 * radius + 1)) - radius
+    return dx**2 + dy**2 <= radius**2
+
+
+class DiskSampler:
+    """Random cells of a mask, with every pick blocking a disk around it.
+
+    Candidates are kept in a list with swap removal and blocking only touches
+    the window under the disk, so a pick costs O(radius**2) however large the
+    map is.
+    """
+
+    def __init__(self, available: NDArray[np.bool_], radius: int):
+        self.shape = available.shape
+        self.radius = radius
+        self.cells = np.flatnonzero(available)
+        # Position of every cell in self.cells, -1 once it is no candidate
+        self.index = np.full(available.shape, -1, dtype=np.intp)
+        self.index.flat[self.cells] = np.arange(len(self.cells))
+        self.count = len(self.cells)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> tuple[int, int]:
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        x, y = divmod(int(self.cells[i]), self.shape[1])
+        return x, y
+
+    def exclude(self, xy: tuple[int, int], radius: int | None = None):
+        """Remove every candidate within radius of xy, defaulting to the sampler's."""
+        r = self.radius if radius is None else radius
+        x, y = xy
+        w, h = self.shape
+        x0, x1 = max(0, x - r), min(w, x + r + 1)
+        y0, y1 = max(0, y - r), min(h, y + r + 1)
+        stamp = disk(r)[x0 - x + r : x1 - x + r, y0 - y + r : y1 - y + r]
+        window = self.index[x0:x1, y0:y1]
+        cells, index = self.cells, self.index.reshape(-1)
+        for i in sorted(window[stamp & (window >= 0)].tolist(), reverse=True):
+            # Highest positions first, so a moved candidate is never one to drop
+            self.count -= 1
+            last = cells[self.count]
+            cells[i] = last
+            index[last] = i
+        window[stamp] = -1
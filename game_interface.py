@@ -6,6 +6,7 @@ import assets
 import consts
 import db
 import game_logic
+import procgen
 
 
 class State:
@@ -22,8 +23,8 @@ class State:
     def handle_event(self, event: pg.Event):
         pass
 
-    def render(self, screen: pg.Surface):
-        pass
+    def render(self, screen: pg.Surface) -> list[pg.Rect] | None:
+        """Draw the state, returning the regions drawn or None for all of it."""
 
 
 class GameInterface:
@@ -36,6 +37,7 @@ class GameInterface:
         self.font = assets.font(consts.FONTNAME, consts.FONTSIZE)
         self.logic = game_logic.GameLogic()
         self.state_stack: list[State] = []
+        self.rendered_state: State | None = None
         self.sfx_volume = 60
         self.bgm_volume = 60
         self.master_volume = 60
@@ -76,9 +78,14 @@ class GameInterface:
         self.state.update()
 
     def render(self):
+        rects = None
         if self.state is not None:
-            self.state.render(self.screen)
-        pg.display.flip()
+            rects = self.state.render(self.screen)
+        self.rendered_state = self.state
+        if rects is None:
+            pg.display.flip()
+        else:
+            pg.display.update(rects)
 
     def run(self):
         self.running = True
@@ -87,6 +94,8 @@ class GameInterface:
             self.handle_events()
             self.update()
             self.render()
+        self.logic.wait_for_save()
+        procgen.shutdown_pregeneration()
         pg.quit()
 
     def play_sfx(self, sfx: str):
@@ -5,6 +5,8 @@ import glob
 import os
 import pickle
 import random
+import threading
+import zipfile
 from collections import deque
 from typing import TYPE_CHECKING, Callable
 
@@ -19,10 +21,14 @@ import entities
 import items
 import maps
 import procgen
+import saves
 
 if TYPE_CHECKING:
     import actions
 
+SAVE_INDEX = "index"
+SAVE_LOCK = threading.RLock()
+
 
 def push_action(reg: ecs.Registry, action: actions.Action):
     reg[None].components[comp.ActionQueue].appendleft(action)
@@ -36,6 +42,49 @@ def log(reg: ecs.Registry, message: str, append: bool = False):
         log.append(message)
 
 
+def index_entry(metadata: dict) -> dict:
+    # Older saves carry a full-resolution "screenshot" array, which is dropped
+    return {k: v for k, v in metadata.items() if k != "screenshot"}
+
+
+def save_path(filename: str) -> str:
+    return str(consts.SAVE_PATH / f"{filename}.zip")
+
+
+def write_savefile(filename: str, chunks: dict[str, bytes], metadata: dict):
+    # Metadata given as functions is left to the save thread, like PNG encoding
+    metadata = {k: v() if callable(v) else v for k, v in metadata.items()}
+    path = save_path(filename)
+    chunks[saves.METADATA_CHUNK] = pickle.dumps(metadata, pickle.HIGHEST_PROTOCOL)
+    saves.write_save(path, chunks)
+    with SAVE_LOCK:
+        index = GameLogic.read_save_index()
+        index[filename] = index_entry(metadata)
+        GameLogic.write_save_index(index)
+    print(f"Game saved at {path}")
+
+
+def migrate_savefile(old_path: str):
+    """Rewrite a save from before per-level chunks in the current format, once."""
+    with open(old_path, "rb") as f:
+        metadata = pickle.load(f)
+        reg = pickle.load(f)
+    if not isinstance(reg, ecs.Registry):
+        raise pickle.UnpicklingError(f"{old_path} holds no game")
+    filename = os.path.splitext(os.path.basename(old_path))[0]
+    i = 1
+    while os.path.exists(save_path(filename)):
+        i += 1
+        filename = f"game{i}"
+    reg[None].components[comp.Filename] = filename
+    chunks = saves.snapshot(reg, save_path(filename))
+    metadata = index_entry(metadata)
+    chunks[saves.METADATA_CHUNK] = pickle.dumps(metadata, pickle.HIGHEST_PROTOCOL)
+    saves.write_save(save_path(filename), chunks)
+    os.remove(old_path)
+    print(f"Converted {old_path} to {save_path(filename)}")
+
+
 class GameLogic:
     def __init__(self) -> None:
         self.continuous_action: actions.Action | None
@@ -44,6 +93,7 @@ class GameLogic:
         self.callbacks: dict[
             type[actions.Action], list[Callable[[actions.Action], None]]
         ] = {}
+        self.save_thread: threading.Thread | None = None
         self.clear()
 
     def clear(self) -> None:
@@ -52,7 +102,8 @@ class GameLogic:
         self.input_action = None
         self.last_action = None
         self.frame_count = 0
-        self.visual_metadata: dict = {}
+        self.last_save_turn = 0
+        self.visual_metadata: Callable[[], dict] | None = None
 
     @property
     def map(self) -> ecs.Entity:
@@ -74,13 +125,16 @@ class GameLogic:
         else:
             self.callbacks[action].append(callback)
 
-    def new_world(self, seed: int | None = None) -> None:
+    def new_world(
+        self, seed: int | None = None, shape: tuple[int, int] | None = None
+    ) -> None:
         if seed is None:
             random.seed()
             seed = random.randint(1, 999999)
         print(f"World seed: {seed}")
         self.reg = ecs.Registry()
         self.frame_count = 0
+        self.last_save_turn = 0
         self.input_action = None
         self.last_action = None
         self.continuous_action = None
@@ -93,6 +147,8 @@ class GameLogic:
         self.reg[None].components[comp.PlayerKills] = 0
         self.reg[None].components[comp.PlayerSteps] = 0
         self.reg[None].components[comp.Seed] = seed
+        if shape is not None:
+            self.reg[None].components[comp.MapShape] = shape
         self.reg[None].components[random.Random] = random.Random(seed)
         self.reg[None].components[np.random.RandomState] = np.random.RandomState(seed)
         db.load_unknowns(self.reg)
@@ -102,8 +158,8 @@ class GameLogic:
         db.load_data(self.reg, "props")
         maps.get_map(self.reg, 0)
 
-    def new_game(self) -> None:
-        self.new_world()
+    def new_game(self, seed: int | None = None) -> None:
+        self.new_world(seed)
         self.init_player()
         self.next_turn()
         self.active = True
@@ -122,45 +178,69 @@ class GameLogic:
             "depth": self.player.components[comp.Position].depth,
         }
 
-    def save_game(self, extra_metadata: dict | None = None):
+    def save_game(self, extra_metadata: dict | None = None, background: bool = False):
+        self.wait_for_save()
         if comp.Filename in self.reg[None].components:
             filename = self.reg[None].components[comp.Filename]
         else:
             i = 1
             filename = f"game{i}"
-            while os.path.exists(consts.SAVE_PATH / f"{filename}.pickle"):
+            while os.path.exists(save_path(filename)):
                 i += 1
                 filename = f"game{i}"
             self.reg[None].components[comp.Filename] = filename
-        path = consts.SAVE_PATH / f"{filename}.pickle"
         #
-        metadata = self.metadata() | self.visual_metadata
+        metadata = self.metadata()
+        if self.visual_metadata is not None:
+            metadata |= self.visual_metadata()
         if extra_metadata is not None:
             metadata |= extra_metadata
-        with open(path, "wb") as f:
-            pickle.dump(metadata, f)
-            pickle.dump(self.reg, f)
-        print(f"Game saved at {path}")
+        # Snapshot on the main thread, so the registry can keep changing
+        chunks = saves.snapshot(self.reg, save_path(filename))
+        self.last_save_turn = self.turn_count
+        args = (filename, chunks, metadata)
+        if background:
+            self.save_thread = threading.Thread(
+                target=write_savefile, args=args, daemon=True
+            )
+            self.save_thread.start()
+        else:
+            write_savefile(*args)
+
+    def autosave(self):
+        if self.is_saving:
+            return
+        self.save_game(background=True)
+
+    def autosave_due(self) -> bool:
+        return self.turn_count - self.last_save_turn >= consts.AUTOSAVE_TURNS
+
+    @property
+    def is_saving(self) -> bool:
+        return self.save_thread is not None and self.save_thread.is_alive()
+
+    def wait_for_save(self):
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
 
     def file_metadata(self, filename: str) -> dict:
-        path = consts.SAVE_PATH / f"{filename}.pickle"
-        with open(path, "rb") as f:
-            metadata = pickle.load(f)
-        return metadata
+        index = self.read_save_index()
+        if filename in index:
+            return index[filename]
+        return index_entry(saves.read_metadata(save_path(filename)))
 
     def load_game(self, filename: str):
+        self.wait_for_save()
         self.clear()
-        path = consts.SAVE_PATH / f"{filename}.pickle"
-        with open(path, "rb") as f:
-            metadata = pickle.load(f)  # Discard header
-            data = pickle.load(f)
-        assert isinstance(data, ecs.Registry)
-        self.reg = data
+        # Only the player's level is read now, the rest as maps.get_map needs them
+        self.reg = saves.load_registry(save_path(filename))
         self.reg[None].components[comp.Filename] = filename
         last_played = self.reg[None].components[comp.LastPlayed]
         now = datetime.datetime.now(last_played.tzinfo)
         self.reg[None].components[comp.LastPlayed] = now
 
+        self.last_save_turn = self.turn_count
         self.frame_count = 0
         self.input_action = None
         self.last_action = None
@@ -169,14 +249,71 @@ class GameLogic:
 
     @staticmethod
     def delete_game(filename: str):
-        path = consts.SAVE_PATH / f"{filename}.pickle"
-        os.remove(path)
+        os.remove(save_path(filename))
+        if os.path.exists(saves.journal_path(save_path(filename))):
+            os.remove(saves.journal_path(save_path(filename)))
+        with SAVE_LOCK:
+            index = GameLogic.read_save_index()
+            index.pop(filename, None)
+            GameLogic.write_save_index(index)
 
     @staticmethod
     def list_savefiles() -> list[str]:
-        files = glob.glob(str(consts.SAVE_PATH / "game*.pickle"))
-        files = sorted(files, key=lambda f: -os.stat(f).st_mtime)
-        return [os.path.splitext(os.path.basename(f))[0] for f in files]
+        index = GameLogic.read_save_index()
+        return sorted(index.keys(), key=lambda f: index[f]["last_played"], reverse=True)
+
+    @staticmethod
+    def read_save_index() -> dict[str, dict]:
+        path = consts.SAVE_PATH / f"{SAVE_INDEX}.pickle"
+        index: dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    index = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                index = {}
+        # Reconcile with the files on disk, reading headers only for new saves
+        with SAVE_LOCK:
+            for old_path in glob.glob(str(consts.SAVE_PATH / "game*.pickle")):
+                try:
+                    migrate_savefile(old_path)
+                except (
+                    OSError,
+                    EOFError,
+                    pickle.UnpicklingError,
+                    AttributeError,
+                    ImportError,
+                    KeyError,
+                    TypeError,
+                    ValueError,
+                ) as e:
+                    # Left where it is, saved by a version this one can't read
+                    print(f"Incompatible save {old_path}: {e!r}")
+            files = glob.glob(str(consts.SAVE_PATH / "game*.zip"))
+            names = {os.path.splitext(os.path.basename(f))[0] for f in files}
+            changed = False
+            for filename in index.keys() - names:
+                index.pop(filename)
+                changed = True
+            for filename in names - index.keys():
+                try:
+                    metadata = saves.read_metadata(save_path(filename))
+                    index[filename] = index_entry(metadata)
+                except (OSError, KeyError, zipfile.BadZipFile, pickle.UnpicklingError):
+                    continue
+                changed = True
+            if changed:
+                GameLogic.write_save_index(index)
+        return index
+
+    @staticmethod
+    def write_save_index(index: dict[str, dict]):
+        path = consts.SAVE_PATH / f"{SAVE_INDEX}.pickle"
+        tmp_path = consts.SAVE_PATH / f"{SAVE_INDEX}.pickle.tmp"
+        with SAVE_LOCK:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(index, f)
+            os.replace(tmp_path, path)
 
     def init_player(self):
         map_entity = maps.get_map(self.reg, 0)
@@ -342,3 +479,4 @@ class GameLogic:
         for _ in range(100):
             if not self.act():
                 break
+        procgen.pregenerate(self.map)
@@ -1,3 +1,5 @@
+from typing import Callable
+
 import pygame as pg
 
 import assets
@@ -16,6 +18,7 @@ SCROLLBAR_COLOR = "#DFEFD7"
 SCROLLBAR_SIZE = 2
 SCROLLBAR_PADDING = 1
 TITLE_FGCOLOR = "#FFFFFF"
+DIRTY_RECT_COLOR = "#FF00FF"
 
 
 def get_screen_scale() -> int:
@@ -30,6 +33,86 @@ def scaled_mouse_pos() -> tuple[int, int]:
     return (mouse_pos[0] // scale, mouse_pos[1] // scale)
 
 
+class DirtyRects:
+    """Screen regions that changed since the previous frame, and their redraw.
+
+    A sprite counts as changed when its image or rect is not the one drawn
+    last time, or when it set its dirty flag after drawing into its image.
+    """
+
+    def __init__(self, size: tuple[int, int]):
+        self.screen_rect = pg.Rect((0, 0), size)
+        self.drawn: dict[pg.sprite.Sprite, tuple[pg.Surface, pg.Rect]] = {}
+        self.overlay = False
+        # Drawn over by the overlay, to be cleaned up on the next frame
+        self.painted: list[pg.Rect] = []
+
+    def collect(
+        self, sprites: list[pg.sprite.Sprite], rects: list[pg.Rect], full: bool
+    ) -> list[pg.Rect]:
+        dirty = rects + self.painted
+        self.painted = []
+        drawn = {}
+        for sprite in sprites:
+            image, rect = sprite.image, sprite.rect.copy()
+            drawn[sprite] = (image, rect)
+            last = self.drawn.pop(sprite, None)
+            changed = getattr(sprite, "dirty", False)
+            if last is None:
+                dirty.append(rect)
+            elif changed or last[0] is not image or last[1] != rect:
+                dirty += [rect, last[1]]
+            if changed:
+                sprite.dirty = False
+        # Sprites that are gone leave their last rect behind
+        dirty += [rect for _, rect in self.drawn.values()]
+        self.drawn = drawn
+        if full:
+            return [self.screen_rect.copy()]
+        merged: list[pg.Rect] = []
+        for rect in dirty:
+            rect = rect.clip(self.screen_rect)
+            if rect.width < 1 or rect.height < 1:
+                continue
+            i = rect.collidelist(merged)
+            while i >= 0:
+                rect = rect.union(merged.pop(i))
+                i = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def draw(
+        self,
+        surface: pg.Surface,
+        rects: list[pg.Rect],
+        background: Callable[[pg.Surface], None],
+        sprites: list[pg.sprite.Sprite],
+    ):
+        sprite_rects = [s.rect for s in sprites]
+        clip = surface.get_clip()
+        for rect in rects:
+            surface.set_clip(rect)
+            background(surface)
+            for i in rect.collidelistall(sprite_rects):
+                surface.blit(sprites[i].image, sprite_rects[i])
+        surface.set_clip(clip)
+
+    def draw_overlay(self, surface: pg.Surface, rects: list[pg.Rect]) -> pg.Rect:
+        """Outline the redrawn regions and print how much of the screen they are."""
+        area = sum(rect.width * rect.height for rect in rects)
+        ratio = area / (self.screen_rect.width * self.screen_rect.height)
+        for rect in rects:
+            pg.draw.rect(surface, DIRTY_RECT_COLOR, rect, 1)
+        text = assets.font().render(
+            f"Redrawn {ratio:.1%}", False, DIRTY_RECT_COLOR, "#000000"
+        )
+        corner = self.screen_rect.move(-8, -20).bottomright
+        text_rect = text.get_rect(bottomright=corner)
+        surface.blit(text, text_rect)
+        self.painted = rects + [text_rect]
+        return text_rect
+
+
 class Box(pg.sprite.Sprite):
     def __init__(
         self, group: pg.sprite.Group, surface: pg.Surface | None, title: str = ""
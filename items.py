@@ -112,20 +112,38 @@ def drop_all(actor: ecs.Entity):
         drop(e)
 
 
-def spawn_item(
-    map_entity: ecs.Entity, pos: tuple[int, int], kind: str | ecs.Entity, count: int = 1
-) -> ecs.Entity:
+def spawn_items(
+    map_entity: ecs.Entity,
+    positions: list[tuple[int, int]],
+    kind: str | ecs.Entity,
+    counts: list[int] | None = None,
+) -> list[ecs.Entity]:
     if isinstance(kind, str):
         kind = map_entity.registry[("items", kind)]
+    if counts is None:
+        counts = [1] * len(positions)
     depth = map_entity.components[comp.Depth]
     max_stack = kind.components.get(comp.MaxStack, 1)
-    while count > 0:
-        stack_count = min(count, max_stack)
-        entity = kind.instantiate()
-        entity.components[comp.Position] = comp.Position(pos, depth)
-        entity.components[comp.Count] = stack_count
-        count -= stack_count
-    return entity
+    spawned = []
+    for pos, count in zip(positions, counts):
+        if count < 1:
+            continue
+        position = comp.Position(pos, depth)
+        while count > 0:
+            stack_count = min(count, max_stack)
+            entity = kind.instantiate()
+            entity.components[comp.Count] = stack_count
+            entity.components[comp.Position] = position
+            count -= stack_count
+        spawned.append(entity)
+    return spawned
+
+
+def spawn_item(
+    map_entity: ecs.Entity, pos: tuple[int, int], kind: str | ecs.Entity, count: int = 1
+) -> ecs.Entity | None:
+    spawned = spawn_items(map_entity, [pos], kind, [count])
+    return spawned[0] if spawned else None
 
 
 def add_item(actor: ecs.Entity, kind: str | ecs.Entity, count: int = 1):
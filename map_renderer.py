@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import random
+from functools import lru_cache
 from typing import TYPE_CHECKING
 
 import numpy as np
@@ -12,19 +13,25 @@ import comp
 import consts
 import db
 import entities
+import maps
 import ui_elements
 
 if TYPE_CHECKING:
     from game_interface import GameInterface
 
 
-TILE_LAYER = 0
 TILE_UI_LAYER = 1
 ENTITY_LAYER = 2
 ITEM_LAYER = 3
 INTERACTION_LAYER = 4
 ACTOR_LAYER = 5
 UI_LAYER = 6
+# Layers drawn before the lightmap is multiplied over the map
+LIT_LAYERS = (ENTITY_LAYER, ITEM_LAYER, INTERACTION_LAYER, ACTOR_LAYER)
+# Map cells per side of the surfaces the tile layer is drawn into
+CHUNK_TILES = 16
+# Cells around the screen whose entity sprites are still updated and drawn
+SPRITE_MARGIN = 2
 
 
 def light_tint(light_level: int) -> tuple[int, int, int]:
@@ -36,6 +43,31 @@ def light_tint(light_level: int) -> tuple[int, int, int]:
     return (i, i, i)
 
 
+@lru_cache
+def tile_surfaces() -> dict[int, list[pg.Surface]]:
+    """Every tile, then tinted for each light level, shared by all renderers."""
+    surfaces: dict[int, list[pg.Surface]] = {}
+    for i, tile in enumerate(db.tiles):
+        color = tile[2]
+        sprite = tuple(tile[3])
+        sheet = tile[4]
+        surf = pg.Surface((consts.TILE_SIZE, consts.TILE_SIZE)).convert_alpha()
+        surf.fill(color)
+        if tile[5] > 0:
+            bgtile = tile[5]
+            surf.blit(surfaces[bgtile][0], (0, 0))
+        if sheet != "":
+            src = assets.tile(sheet, (int(sprite[0]), int(sprite[1])))
+            surf.blit(src, (0, 0))
+        surfaces[i] = [surf]
+        for j in range(consts.MAX_LIGHT_RADIUS + 1):
+            tint = light_tint(consts.MAX_LIGHT_RADIUS - j)
+            darksurf = surf.copy()
+            darksurf.fill(tint, special_flags=pg.BLEND_MULT)
+            surfaces[i].append(darksurf)
+    return surfaces
+
+
 class EntitySprite(pg.sprite.Sprite):
     def __init__(self, group: MapRenderer, entity: ecs.Entity):
         super().__init__()
@@ -47,7 +79,9 @@ class EntitySprite(pg.sprite.Sprite):
             layer = ITEM_LAYER
         else:
             layer = ENTITY_LAYER
-        group.add(self, layer=layer)
+        # Added to the group by the renderer once it is in view
+        self.layer = layer
+        self.chunk: tuple[int, int] | None = None
         self.group = group
         self.entity = entity
         self.is_in_fov: bool | None = None
@@ -58,30 +92,22 @@ class EntitySprite(pg.sprite.Sprite):
         self.spr: comp.Sprite | None = None
         self.hpbar: ui_elements.MapHPBar | None = None
         self.tooltip: ui_elements.MapHPBar | None = None
-        self.tiles: list[list[pg.Surface]] = []
-        self.blank_surface = pg.Surface(
-            (consts.TILE_SIZE, consts.TILE_SIZE)
-        ).convert_alpha()
-        self.blank_surface.fill("#00000000")
+        self.blank_surface = assets.blank((consts.TILE_SIZE, consts.TILE_SIZE))
         self.image = self.blank_surface
         self.rect: pg.Rect
         self.frame = 0
+        self.frame_count = 1
         self.angle = -1
         self.frame_offset = random.randint(0, consts.FPS)
         self.sprite_changed = True
-        self.prepare_surfaces()
 
-    def prepare_surfaces(self) -> None:
+    def read_sprite(self) -> None:
         spr = self.entity.components[comp.Sprite]
-        angle = (
-            self.entity.components.get(comp.SpriteRotation, spr.angle) - spr.angle
-        ) % 360
-        if (
-            spr == self.spr
-            and angle == self.angle
-            and self.tiles is not None
-            and len(self.tiles) > 0
-        ):
+        angle = self.entity.components.get(comp.SpriteRotation, spr.angle) - spr.angle
+        # Rounded, so that every shot doesn't add rotated surfaces of its own
+        step = consts.SPRITE_ANGLE_STEP
+        angle = int(round(angle / step) * step) % 360
+        if spr == self.spr and angle == self.angle:
             return
         self.sprite_changed = True
         self.angle = angle
@@ -90,31 +116,30 @@ class EntitySprite(pg.sprite.Sprite):
             max_frames = 2
         else:
             max_frames = 1
-        frames = assets.frames(spr.sheet, tuple(spr.tile), max_frames)
-        if angle != 0:
-            frames = [pg.transform.rotate(f, angle) for f in frames]
-        self.tiles = [frames]
-        for j in range(consts.MAX_LIGHT_RADIUS + 1):
-            tint = light_tint(consts.MAX_LIGHT_RADIUS - j)
-            darkframes: list[pg.Surface] = []
-            for surf in frames:
-                darksurf = surf.copy()
-                darksurf.fill(tint, special_flags=pg.BLEND_MULT)
-                darkframes.append(darksurf)
-            self.tiles.append(darkframes)
-        self.flip_tiles = [
-            [pg.transform.flip(a, True, False) for a in b] for b in self.tiles
-        ]
+        self.frame_count = len(assets.frames(spr.sheet, tuple(spr.tile), max_frames))
+
+    def surface(self, frame: int, tint: tuple[int, int, int] | None, flip: bool):
+        assert self.spr is not None
+        sheet, tile = self.spr.sheet, tuple(self.spr.tile)
+        return assets.sprite(sheet, tile, frame, self.angle, tint, flip)
+
+    def show(self) -> None:
+        self.group.add(self, layer=self.layer)
+
+    def hide(self) -> None:
+        self.kill()
+        for child in (self.hpbar, self.tooltip):
+            if child is not None:
+                child.kill()
+        self.hpbar = None
+        self.tooltip = None
+        # Compared against a stale state once it is shown again
+        self.sprite_changed = True
 
     def update(self) -> None:
-        if (
-            not comp.Position in self.entity.components
-            or not comp.Sprite in self.entity.components
-            or self.entity.components[comp.Position].depth != self.group.depth
-            or self.entity.registry != self.group.logic.reg
-        ):
-            self.kill()
-            self.group.entity_sprites.pop(self.entity)
+        if comp.Sprite not in self.entity.components:
+            # Inherited sprites go with the IsA relation, which no callback sees
+            self.group.remove_sprite(self)
             return
         pos = self.entity.components[comp.Position]
         is_in_fov = self.group.fov[pos.xy]
@@ -125,8 +150,8 @@ class EntitySprite(pg.sprite.Sprite):
             and not comp.HideSprite in self.entity.tags
             and not comp.Hidden in self.entity.tags
         )
-        if visible or self.image is None:
-            self.prepare_surfaces()
+        if visible or self.spr is None:
+            self.read_sprite()
         self.x, self.y = pos.xy
         x, y = self.group.grid_to_screen(*pos.xy)
         if comp.HP in self.entity.components:
@@ -138,8 +163,8 @@ class EntitySprite(pg.sprite.Sprite):
             )
         dx, dy = self.entity.components.get(comp.Direction, (0, 0))
         flip = ((dx > 0) or (dx >= 0 and dy > 0)) and (self.angle != 0)
-        frame = ((self.group.frame_counter + self.frame_offset) // 30) % len(
-            self.tiles[0]
+        frame = ((self.group.frame_counter + self.frame_offset) // 30) % (
+            self.frame_count
         )
         self.update_tooltip()
         if (
@@ -161,15 +186,18 @@ class EntitySprite(pg.sprite.Sprite):
         self.visible = visible
         self.frame = frame
         self.light = light
-        if visible:
+        if visible and consts.LIGHTMAP:
+            if not is_in_fov:
+                self.image = self.surface(0, None, False)
+            else:
+                self.image = self.surface(self.frame, None, flip)
+        elif visible:
             if not is_in_fov:
-                self.image = self.tiles[-1][0]
+                self.image = self.surface(0, light_tint(0), False)
+            elif light > consts.MAX_LIGHT_RADIUS:
+                self.image = self.surface(self.frame, None, flip)
             else:
-                id = max(0, len(self.tiles) - light - 1)
-                if flip:
-                    self.image = self.flip_tiles[id][self.frame]
-                else:
-                    self.image = self.tiles[id][self.frame]
+                self.image = self.surface(self.frame, light_tint(light), flip)
         else:
             self.image = self.blank_surface
 
@@ -193,53 +221,167 @@ class EntitySprite(pg.sprite.Sprite):
             self.tooltip = None
 
 
-class TileSprite(pg.sprite.Sprite):
-    def __init__(self, group: MapRenderer, x: int, y: int):
-        super().__init__()
-        group.add(self, layer=TILE_LAYER)
+class TileLayer:
+    """Map tiles baked into surfaces of CHUNK_TILES square, drawn as a few blits.
+
+    The look of every cell, its tile and how lit it is, is kept in an array.
+    Only the cells in view whose look changed are redrawn into their chunk.
+    """
+
+    def __init__(self, group: MapRenderer):
         self.group = group
-        self.x, self.y = x, y
-        self.depth = 0
-        self.is_explored = False
-        self.is_in_fov = False
-        self.light = -1
-        self.tile_id: int | None = None
-        self.image = group.void_surface
-        x, y = self.group.grid_to_screen(self.x, self.y)
-        self.rect = pg.Rect(x, y, consts.TILE_SIZE, consts.TILE_SIZE)
+        self.map_entity: ecs.Entity | None = None
+        self.chunks: dict[tuple[int, int], pg.Surface] = {}
+        # Screen regions whose cells were redrawn by the last update
+        self.redrawn: list[pg.Rect] = []
+        # Look drawn at each cell, an index into looks, -1 for void
+        self.drawn = np.full((0, 0), -1, np.int16)
+        self.looks_per_tile = consts.MAX_LIGHT_RADIUS + 2
+        self.looks = [
+            surf for i in range(len(db.tiles)) for surf in group.tile_surfaces[i]
+        ]
+        # The last look, so that -1 is void
+        self.looks.append(group.void_surface)
 
-    def update(self) -> None:
-        x, y = self.group.grid_to_screen(self.x, self.y)
-        rect = pg.Rect(x, y, consts.TILE_SIZE, consts.TILE_SIZE)
-        tile_id = int(self.group.tiles[self.x, self.y])
-        is_explored = self.group.explored[self.x, self.y]
-        is_in_fov = self.group.fov[self.x, self.y]
-        light = max(0, min(consts.MAX_LIGHT_RADIUS, self.group.light[self.x, self.y]))
-        if self.depth != self.group.depth:
-            is_explored = False
-            self.image = self.group.void_surface
-        if (
-            is_explored == self.is_explored
-            and is_in_fov == self.is_in_fov
-            and tile_id == self.tile_id
-            and rect == self.rect
-            and self.depth == self.group.depth
-            and light == self.light
-        ):
+    def reset(self, map_entity: ecs.Entity):
+        self.map_entity = map_entity
+        self.chunks.clear()
+        self.drawn = np.full(map_entity.components[comp.Tiles].shape, -1, np.int16)
+
+    def update(self):
+        group = self.group
+        self.redrawn = []
+        if group.logic.map is not self.map_entity:
+            self.reset(group.logic.map)
+        cx, cy = group.chunk_window()
+        if len(cx) < 1 or len(cy) < 1:
             return
-        self.light = light
-        self.depth = self.group.depth
-        self.tile_id = tile_id
-        self.is_explored = is_explored
-        self.is_in_fov = is_in_fov
-        self.rect = rect
-        if not is_explored:
-            self.group.void_surface
-        elif not is_in_fov:
-            self.image = self.group.tile_surfaces[tile_id][-1]
+        window = group.cell_window(cx, cy)
+        n = self.looks_per_tile
+        tiles = group.tiles[window].astype(np.int16)
+        if consts.LIGHTMAP:
+            # Untinted, the lightmap is multiplied over them
+            lit = np.zeros_like(tiles)
         else:
-            id = max(0, len(self.group.tile_surfaces[tile_id]) - light - 1)
-            self.image = self.group.tile_surfaces[tile_id][id]
+            light = np.clip(group.light[window], 0, consts.MAX_LIGHT_RADIUS)
+            lit = np.where(group.fov.view(window), n - 1 - light, n - 1)
+        looks = np.where(group.explored[window], tiles * n + lit, -1)
+        drawn = self.drawn[window]
+        changed = np.argwhere(looks != drawn)
+        if len(changed) < 1:
+            return
+        x0, y0 = window[0].start, window[1].start
+        drawn[changed[:, 0], changed[:, 1]] = looks[changed[:, 0], changed[:, 1]]
+        blits: dict[tuple[int, int], list[tuple[pg.Surface, tuple[int, int]]]] = {}
+        size = consts.TILE_SIZE
+        for (x, y), look in zip(
+            (changed + (x0, y0)).tolist(), looks[changed[:, 0], changed[:, 1]].tolist()
+        ):
+            key = (x // CHUNK_TILES, y // CHUNK_TILES)
+            xy = ((x % CHUNK_TILES) * size, (y % CHUNK_TILES) * size)
+            blits.setdefault(key, []).append((self.looks[look], xy))
+        for key, cells in blits.items():
+            if key not in self.chunks:
+                chunk = pg.Surface((CHUNK_TILES * size, CHUNK_TILES * size))
+                chunk.fill(consts.BACKGROUND_COLOR)
+                self.chunks[key] = chunk
+            self.chunks[key].fblits(cells)
+            x, y = group.grid_to_screen(key[0] * CHUNK_TILES, key[1] * CHUNK_TILES)
+            rects = [pg.Rect(xy, (size, size)) for _, xy in cells]
+            self.redrawn.append(rects[0].unionall(rects[1:]).move(x, y))
+
+    def draw(self, surface: pg.Surface):
+        cx, cy = self.group.chunk_window()
+        for x in cx:
+            for y in cy:
+                chunk = self.chunks.get((x, y))
+                if chunk is not None:
+                    xy = self.group.grid_to_screen(x * CHUNK_TILES, y * CHUNK_TILES)
+                    surface.blit(chunk, xy)
+
+
+class Lightmap:
+    """How lit each map cell is, multiplied over the tiles and sprites drawn.
+
+    Cell brightness is upscaled into surfaces of CHUNK_TILES square, optionally
+    smoothed between cells. Only the chunks whose cells changed are rebuilt.
+    """
+
+    def __init__(self, group: MapRenderer):
+        self.group = group
+        self.map_entity: ecs.Entity | None = None
+        self.chunks: dict[tuple[int, int], pg.Surface] = {}
+        # Screen regions whose brightness changed in the last update
+        self.redrawn: list[pg.Rect] = []
+        # Brightness of each cell, by light level, untinted above the maximum
+        self.levels = np.array(
+            [light_tint(i)[0] for i in range(consts.MAX_LIGHT_RADIUS + 1)] + [255],
+            np.uint8,
+        )
+        self.values = np.zeros((0, 0), np.uint8)
+
+    def reset(self, map_entity: ecs.Entity):
+        self.map_entity = map_entity
+        self.chunks.clear()
+        shape = map_entity.components[comp.Tiles].shape
+        self.values = np.full(shape, self.levels[0], np.uint8)
+
+    def update(self):
+        group = self.group
+        self.redrawn = []
+        if group.logic.map is not self.map_entity:
+            self.reset(group.logic.map)
+        cx, cy = group.chunk_window()
+        keys = {(x, y) for x in cx for y in cy}
+        # Chunks out of view are rebuilt from fresh values when they come back
+        self.chunks = {k: v for k, v in self.chunks.items() if k in keys}
+        if len(keys) < 1:
+            return
+        # Smoothed chunks blend in the cells bordering them
+        window = group.cell_window(cx, cy, 1)
+        light = np.clip(group.light[window], 0, consts.MAX_LIGHT_RADIUS + 1)
+        values = np.where(group.fov.view(window), self.levels[light], self.levels[0])
+        drawn = self.values[window]
+        changed = np.argwhere(values != drawn)
+        drawn[...] = values
+        margin = 1 if consts.SMOOTH_LIGHTMAP else 0
+        size = consts.TILE_SIZE
+        stale = keys - self.chunks.keys()
+        x0, y0 = window[0].start, window[1].start
+        for x, y in (changed + (x0, y0)).tolist():
+            rect = pg.Rect(group.grid_to_screen(x, y), (size, size))
+            self.redrawn.append(rect.inflate(2 * margin * size, 2 * margin * size))
+            for i in range(x - margin, x + margin + 1):
+                for j in range(y - margin, y + margin + 1):
+                    stale.add((i // CHUNK_TILES, j // CHUNK_TILES))
+        for key in stale & keys:
+            self.chunks[key] = self.build(key)
+
+    def build(self, key: tuple[int, int]) -> pg.Surface:
+        size = consts.TILE_SIZE
+        x, y = key[0] * CHUNK_TILES, key[1] * CHUNK_TILES
+        if not consts.SMOOTH_LIGHTMAP:
+            cells = self.values[x : x + CHUNK_TILES, y : y + CHUNK_TILES]
+            surf = pg.surfarray.make_surface(np.dstack((cells, cells, cells)))
+            return pg.transform.scale_by(surf, size).convert()
+        # A border of cells so that chunks blend into their neighbours
+        w, h = self.values.shape
+        x1, y1 = min(w, x + CHUNK_TILES), min(h, y + CHUNK_TILES)
+        cells = np.pad(
+            self.values[max(0, x - 1) : x1 + 1, max(0, y - 1) : y1 + 1],
+            ((int(x == 0), int(x1 == w)), (int(y == 0), int(y1 == h))),
+            mode="edge",
+        )
+        surf = pg.surfarray.make_surface(np.dstack((cells, cells, cells)))
+        cw, ch = cells.shape
+        surf = pg.transform.smoothscale(surf, (cw * size, ch * size))
+        rect = pg.Rect(size, size, (cw - 2) * size, (ch - 2) * size)
+        return surf.subsurface(rect).convert()
+
+    def draw(self, surface: pg.Surface):
+        for (x, y), chunk in self.chunks.items():
+            xy = self.group.grid_to_screen(x * CHUNK_TILES, y * CHUNK_TILES)
+            surface.blit(chunk, xy, special_flags=pg.BLEND_MULT)
 
 
 class MapRenderer(pg.sprite.LayeredUpdates):
@@ -249,56 +391,112 @@ class MapRenderer(pg.sprite.LayeredUpdates):
         self.logic = interface.logic
         self.frame_counter = 0
         self.shape = pg.display.get_surface().size
-        self.tile_sprite_map: dict[tuple[int, int], TileSprite] = {}
-        self.tile_surfaces: dict[int, list[pg.Surface]] = {}
-        self.dark_surfaces: dict[int, pg.Surface] = {}
-        self.dark_tint = consts.UNEXPLORED_TINT
-        self.tile_sprites: dict[tuple[int, int], TileSprite] = {}
         self.entity_sprites: dict[ecs.Entity, EntitySprite] = {}
+        # Entity sprites by chunk, and those in view that are in the group
+        self.buckets: dict[tuple[int, int], set[EntitySprite]] = {}
+        self.shown: set[EntitySprite] = set()
+        self.sprite_map: ecs.Entity | None = None
+        self.sprite_changes: set[ecs.Entity] = set()
         self.center: tuple[int, int] = (0, 0)
         self.cursor: tuple[int, int] | None = None
+        # Whether the camera or the map changed since the previous update
+        self.moved = True
+        self.view: tuple[tuple[int, int], ecs.Entity] | None = None
         self.create_surfaces()
-        self.create_tile_sprites()
-        self.create_entity_sprites()
+        self.tile_layer = TileLayer(self)
+        self.lightmap = Lightmap(self)
         self.cursor_sprite = ui_elements.MapCursor(self)
 
     def create_surfaces(self) -> None:
         self.void_surface = pg.Surface((consts.TILE_SIZE, consts.TILE_SIZE))
         self.void_surface.fill(consts.BACKGROUND_COLOR)
-        for i, tile in enumerate(db.tiles):
-            color = tile[2]
-            sprite = tuple(tile[3])
-            sheet = tile[4]
-            surf = pg.Surface((consts.TILE_SIZE, consts.TILE_SIZE)).convert_alpha()
-            surf.fill(color)
-            if tile[5] > 0:
-                bgtile = tile[5]
-                surf.blit(self.tile_surfaces[bgtile][0], (0, 0))
-            if sheet != "":
-                src = assets.tile(sheet, (int(sprite[0]), int(sprite[1])))
-                surf.blit(src, (0, 0))
-            self.tile_surfaces[i] = [surf]
-            for j in range(consts.MAX_LIGHT_RADIUS + 1):
-                tint = light_tint(consts.MAX_LIGHT_RADIUS - j)
-                darksurf = surf.copy()
-                darksurf.fill(tint, special_flags=pg.BLEND_MULT)
-                self.tile_surfaces[i].append(darksurf)
-
-    def create_tile_sprites(self) -> None:
-        shape = self.logic.map.components[comp.Tiles].shape
-        for x in range(shape[0]):
-            for y in range(shape[1]):
-                if (x, y) not in self.tile_sprites:
-                    self.tile_sprites[(x, y)] = TileSprite(self, x, y)
-
-    def create_entity_sprites(self) -> None:
-        query = self.logic.reg.Q.all_of(
-            components=[comp.Position, comp.Sprite],
-            relations=[(comp.Map, self.logic.map)],
+        self.tile_surfaces = tile_surfaces()
+
+    def sync_entity_sprites(self) -> None:
+        """Create, move and drop the sprites of entities that changed."""
+        reg = self.logic.reg
+        map_ = self.logic.map
+        changes = reg[None].components.get(comp.SpriteChanges)
+        if map_ == self.sprite_map and changes is self.sprite_changes:
+            for e in changes:
+                self.place_sprite(e)
+            changes.clear()
+            return
+        # New map, or changes went to another renderer: start over from a query
+        for sprite in list(self.entity_sprites.values()):
+            self.remove_sprite(sprite)
+        self.sprite_map = map_
+        self.sprite_changes.clear()
+        reg[None].components[comp.SpriteChanges] = self.sprite_changes
+        query = reg.Q.all_of(
+            components=[comp.Position, comp.Sprite], relations=[(comp.Map, map_)]
         )
         for e in query:
-            if e not in self.entity_sprites:
-                self.entity_sprites[e] = EntitySprite(self, e)
+            self.place_sprite(e)
+
+    def place_sprite(self, entity: ecs.Entity) -> None:
+        sprite = self.entity_sprites.get(entity)
+        pos = entity.components.get(comp.Position)
+        if (
+            pos is None
+            or pos.depth != self.depth
+            or comp.Sprite not in entity.components
+        ):
+            if sprite is not None:
+                self.remove_sprite(sprite)
+            return
+        x, y = pos.xy
+        chunk = (x // CHUNK_TILES, y // CHUNK_TILES)
+        if sprite is None:
+            sprite = EntitySprite(self, entity)
+            self.entity_sprites[entity] = sprite
+        elif sprite.chunk == chunk:
+            return
+        else:
+            self.buckets[sprite.chunk].discard(sprite)
+        sprite.chunk = chunk
+        self.buckets.setdefault(chunk, set()).add(sprite)
+
+    def remove_sprite(self, sprite: EntitySprite) -> None:
+        sprite.hide()
+        self.shown.discard(sprite)
+        self.buckets[sprite.chunk].discard(sprite)
+        self.entity_sprites.pop(sprite.entity)
+
+    def cull_entity_sprites(self) -> None:
+        """Keep only the entity sprites near the screen in the group."""
+        cx, cy = self.chunk_window(SPRITE_MARGIN)
+        shown: set[EntitySprite] = set()
+        for x in cx:
+            for y in cy:
+                shown |= self.buckets.get((x, y), set())
+        for sprite in self.shown - shown:
+            sprite.hide()
+        for sprite in shown - self.shown:
+            sprite.show()
+        self.shown = shown
+
+    def chunk_window(self, margin: int = 0) -> tuple[range, range]:
+        """Chunks on screen or within margin cells of it."""
+        w, h = self.shape
+        x0, y0 = self.screen_to_grid(0, 0)
+        x1, y1 = self.screen_to_grid(w - 1, h - 1)
+        mw, mh = self.tiles.shape
+        x0, y0 = max(0, x0 - margin), max(0, y0 - margin)
+        x1, y1 = min(mw - 1, x1 + margin), min(mh - 1, y1 + margin)
+        return (
+            range(x0 // CHUNK_TILES, x1 // CHUNK_TILES + 1),
+            range(y0 // CHUNK_TILES, y1 // CHUNK_TILES + 1),
+        )
+
+    def cell_window(
+        self, cx: range, cy: range, margin: int = 0
+    ) -> tuple[slice, slice]:
+        """Map cells of a window of chunks and margin cells around it."""
+        w, h = self.tiles.shape
+        x0, x1 = cx.start * CHUNK_TILES - margin, cx.stop * CHUNK_TILES + margin
+        y0, y1 = cy.start * CHUNK_TILES - margin, cy.stop * CHUNK_TILES + margin
+        return (slice(max(0, x0), min(w, x1)), slice(max(0, y0), min(h, y1)))
 
     def grid_to_screen(self, i: int, j: int) -> tuple[int, int]:
         pi, pj = self.center
@@ -313,7 +511,6 @@ class MapRenderer(pg.sprite.LayeredUpdates):
         return (int(i), int(j))
 
     def update(self, *args, **kwargs):
-        self.create_entity_sprites()
         self.frame_counter += 1
         player = self.logic.player
         map_ = self.logic.map
@@ -321,11 +518,52 @@ class MapRenderer(pg.sprite.LayeredUpdates):
         self.tiles = map_.components[comp.Tiles]
         self.fov = player.components[comp.FOV]
         self.explored = map_.components[comp.Explored]
+        if comp.Lightsource not in map_.components:
+            maps.update_map_light(map_)
         self.light = map_.components[comp.Lightsource]
-        self.walkable = db.walkable[self.tiles]
+        self.moved = self.view != (self.center, map_)
+        self.view = (self.center, map_)
+        self.sync_entity_sprites()
+        self.cull_entity_sprites()
+        self.tile_layer.update()
+        if consts.LIGHTMAP:
+            self.lightmap.update()
         super().update(*args, **kwargs)
 
+    def unlit_sprites(self) -> list[pg.sprite.Sprite]:
+        """Sprites drawn over the lightmap, all of them without one."""
+        if not consts.LIGHTMAP:
+            return self.sprites()
+        return [
+            s for s in self.sprites() if self.get_layer_of_sprite(s) not in LIT_LAYERS
+        ]
+
+    def draw_lit(self, surface: pg.Surface):
+        """Tiles and the sprites lit with them, within the clip of surface."""
+        self.tile_layer.draw(surface)
+        if not consts.LIGHTMAP:
+            return
+        clip = surface.get_clip()
+        lit = [
+            s
+            for layer in LIT_LAYERS
+            for s in self.get_sprites_from_layer(layer)
+            if clip.colliderect(s.rect)
+        ]
+        surface.fblits([(s.image, s.rect) for s in lit])
+        self.lightmap.draw(surface)
+
+    def draw(self, surface: pg.Surface, *args, **kwargs):
+        # Tiles go below every sprite
+        self.draw_lit(surface)
+        if not consts.LIGHTMAP:
+            return super().draw(surface, *args, **kwargs)
+        unlit = self.unlit_sprites()
+        surface.fblits([(s.image, s.rect) for s in unlit])
+        return [s.rect for s in unlit]
+
     def move_center(self, direction: tuple[int, int]):
-        x = min(max(0, self.center[0] + direction[0]), consts.MAP_SHAPE[0])
-        y = min(max(0, self.center[1] + direction[1]), consts.MAP_SHAPE[1])
+        shape = self.logic.map.components[comp.Tiles].shape
+        x = min(max(0, self.center[0] + direction[0]), shape[0])
+        y = min(max(0, self.center[1] + direction[1]), shape[1])
         self.center = (x, y)
@@ -12,10 +12,12 @@ import comp
 import db
 import entities
 import procgen
+import saves
 
 
 def get_map(reg: ecs.Registry, depth: int, generate: bool = True) -> ecs.Entity:
     map_entity = reg[(comp.Map, depth)]
+    saves.load_level(reg, depth)
     if generate and comp.Depth not in map_entity.components:
         map_entity.components[comp.Depth] = depth
         procgen.generate(map_entity)
@@ -118,23 +120,33 @@ def cost_matrix(
 
 
 def transparency_matrix(
-    map_entity: ecs.Entity, entities: bool = True
+    map_entity: ecs.Entity,
+    entities: bool = True,
+    window: tuple[slice, slice] | None = None,
 ) -> NDArray[np.bool_]:
     grid = map_entity.components[comp.Tiles]
-    transparency = db.transparency[grid]
-    # Find opaque entities
+    if window is None:
+        window = (slice(0, grid.shape[0]), slice(0, grid.shape[1]))
+    transparency = db.transparency[grid[window]]
     if entities:
-        query = map_entity.registry.Q.all_of(
-            components=[comp.Position],
-            tags=[comp.Opaque],
-            relations=[(comp.Map, map_entity)],
-        )
-        for e in query:
-            xy = e.components[comp.Position].xy
-            transparency[xy] = False
+        if comp.OpaqueCells not in map_entity.components:
+            update_opaque_cells(map_entity)
+        transparency &= ~map_entity.components[comp.OpaqueCells][window]
     return transparency
 
 
+def update_opaque_cells(map_entity: ecs.Entity):
+    opaque = np.full(map_entity.components[comp.Tiles].shape, False)
+    query = map_entity.registry.Q.all_of(
+        components=[comp.Position],
+        tags=[comp.Opaque],
+        relations=[(comp.Map, map_entity)],
+    )
+    for e in query:
+        opaque[e.components[comp.Position].xy] = True
+    map_entity.components[comp.OpaqueCells] = opaque
+
+
 def astar_path(
     actor: ecs.Entity,
     target: tuple[int, int] | comp.Position | ecs.Entity,
@@ -172,9 +184,10 @@ def update_map_light(map_entity: ecs.Entity, update_entities: bool = False):
         traverse=[slot for slot in comp.EquipSlot] + [ecs.IsA, comp.ConditionTurns],
     )
     for e in query:
-        if update_entities or comp.Lightsource not in e.components:
+        if update_entities or comp.Light not in e.components:
             entities.update_entity_light(e)
-        if comp.Lightsource in e.components:
-            elight = e.components[comp.Lightsource]
-            light[elight > light] = elight[elight > light]
+        if comp.Light in e.components:
+            elight = e.components[comp.Light]
+            window = light[elight.slices]
+            np.maximum(window, elight.values, out=window)
     map_entity.components[comp.Lightsource] = light
@@ -1,8 +1,16 @@
 from __future__ import annotations
 
-import random
+import multiprocessing
+from concurrent.futures import (
+    BrokenExecutor,
+    CancelledError,
+    Future,
+    ProcessPoolExecutor,
+)
+from dataclasses import dataclass
 
 import numpy as np
+import scipy.ndimage  # type: ignore
 import scipy.spatial  # type: ignore
 import tcod
 import tcod.ecs as ecs
@@ -17,6 +25,7 @@ import entities
 import funcs
 import items
 import maps
+import saves
 
 
 def get_walls(grid: NDArray[np.bool_], condition: NDArray[np.bool_] | None = None):
@@ -27,17 +36,18 @@ def get_walls(grid: NDArray[np.bool_], condition: NDArray[np.bool_] | None = Non
     return walls
 
 
-def get_spawn_table(
-    map_entity: ecs.Entity, tags: list[str]
-) -> tuple[list[ecs.Entity], list[float]]:
-    depth = map_entity.components[comp.Depth]
-    kinds = list(
-        map_entity.registry.Q.all_of(components=[comp.SpawnWeight], tags=tags)
+def compile_spawn_table(
+    reg: ecs.Registry, depth: int, tags: list[str]
+) -> comp.SpawnTable:
+    # Sorted, as query order changes between runs and would change the levels
+    kinds = sorted(
+        reg.Q.all_of(components=[comp.SpawnWeight], tags=tags)
         .none_of(
             components=[comp.Position, comp.Initiative],
             relations=[(comp.Inventory, ...), (comp.Map, ...)],
         )
-        .get_entities()
+        .get_entities(),
+        key=lambda e: str(e.uid),
     )
     kinds = [
         e
@@ -51,23 +61,34 @@ def get_spawn_table(
         ** ((e.components.get(comp.NativeDepth, depth) - depth) ** 2)
         for e in kinds
     ]
-    total = np.sum(weights)
-    probs = [w / total for w in weights]
-    return kinds, probs
+    # Kinds that can never be picked, all of them leave the table empty
+    kinds = [e for e, w in zip(kinds, weights) if w > 0]
+    weights = [w for w in weights if w > 0]
+    if len(kinds) < 1:
+        return comp.SpawnTable((), np.zeros(0), np.zeros(0, np.intp))
+    prob, alias = funcs.alias_table(weights)
+    return comp.SpawnTable(tuple(kinds), prob, alias)
+
+
+def get_spawn_table(map_entity: ecs.Entity, tags: list[str]) -> comp.SpawnTable:
+    depth = map_entity.components[comp.Depth]
+    key = (depth, tuple(sorted(tags)))
+    cache = map_entity.registry[None].components.setdefault(comp.SpawnTables, {})
+    if key not in cache:
+        cache[key] = compile_spawn_table(map_entity.registry, depth, tags)
+    return cache[key]
 
 
-def pick_creature_kind(map_entity: ecs.Entity) -> ecs.Entity:
-    kinds, probs = get_spawn_table(map_entity, ["creatures"])
+def pick_creature_kind(map_entity: ecs.Entity) -> ecs.Entity | None:
+    table = get_spawn_table(map_entity, ["creatures"])
     seed = map_entity.components[np.random.RandomState]
-    i = seed.choice(list(range(len(kinds))), p=probs)
-    return kinds[i]
+    return table.sample(seed)
 
 
-def pick_item_kind(map_entity: ecs.Entity) -> ecs.Entity:
-    kinds, probs = get_spawn_table(map_entity, ["items"])
+def pick_item_kind(map_entity: ecs.Entity) -> ecs.Entity | None:
+    table = get_spawn_table(map_entity, ["items"])
     seed = map_entity.components[np.random.RandomState]
-    i = seed.choice(list(range(len(kinds))), p=probs)
-    return kinds[i]
+    return table.sample(seed)
 
 
 def pick_item_count(map_entity: ecs.Entity, item: ecs.Entity) -> int:
@@ -83,7 +104,7 @@ def pick_item_count(map_entity: ecs.Entity, item: ecs.Entity) -> int:
 
 def spawn_enemies(map_entity: ecs.Entity, radius: int, max_count: int = 0):
     grid = map_entity.components[comp.Tiles]
-    xgrid, ygrid = np.indices(grid.shape)
+    seed = map_entity.components[np.random.RandomState]
     walkable = db.walkable[grid]
     counter = 0
     # Initialize available array from walkable points
@@ -96,6 +117,7 @@ def spawn_enemies(map_entity: ecs.Entity, radius: int, max_count: int = 0):
     for e in query:
         x, y = e.components[comp.Position].xy
         available[x, y] = False
+    sampler = funcs.DiskSampler(available, radius)
 
     # Consider radius of creatures and upstairs already on the map
     query = (
@@ -109,23 +131,25 @@ def spawn_enemies(map_entity: ecs.Entity, radius: int, max_count: int = 0):
             relations=[(comp.Map, map_entity)],
         ).get_entities()
     )
-    for e in query:
-        x, y = e.components[comp.Position].xy
-        dist2 = (xgrid - x) ** 2 + (ygrid - y) ** 2
-        available[dist2 <= radius**2] = False
+    # Sorted, the candidates left over depend on the order they are excluded in
+    for xy in sorted(e.components[comp.Position].xy for e in query):
+        sampler.exclude(xy)
+    # Positions grouped by kind, spawned in bulk at the end
+    batches: dict[ecs.Entity, list[tuple[int, int]]] = {}
     # While there are available spots and still below max_count
-    while (counter < max_count or max_count < 1) and np.sum(available) > 0:
+    while (counter < max_count or max_count < 1) and len(sampler) > 0:
         # Pick a random available point
-        all_x, all_y = np.where(available)
-        i = random.randint(0, len(all_x) - 1)
-        x, y = all_x[i], all_y[i]
-        # Spawn enemy and increase counter
+        xy = sampler[seed.randint(0, len(sampler))]
+        # Pick enemy kind and increase counter
         kind = pick_creature_kind(map_entity)
-        entities.spawn_creature(map_entity, (x, y), kind)
+        if kind is None:
+            break
+        batches.setdefault(kind, []).append(xy)
         counter += 1
         # Make all points within radius unavailable
-        dist2 = (xgrid - x) ** 2 + (ygrid - y) ** 2
-        available[dist2 <= radius**2] = False
+        sampler.exclude(xy)
+    for kind, positions in batches.items():
+        entities.spawn_creatures(map_entity, positions, kind)
 
 
 def spawn_items(
@@ -136,7 +160,7 @@ def spawn_items(
 ):
     grid = map_entity.components[comp.Tiles]
     depth = map_entity.components[comp.Depth]
-    xgrid, ygrid = np.indices(grid.shape)
+    seed = map_entity.components[np.random.RandomState]
     walkable = db.walkable[grid]
     counter = 0
     # Initialize available array from walkable points
@@ -149,22 +173,25 @@ def spawn_items(
     for e in query:
         x, y = e.components[comp.Position].xy
         available[x, y] = False
+    sampler = funcs.DiskSampler(available, radius)
+    batches: dict[ecs.Entity, tuple[list[tuple[int, int]], list[int]]] = {}
     # While there are available spots and still below max_count
-    while (counter < max_count or max_count < 1) and np.sum(available) > 0:
-        if np.sum(available) < 1:
-            break
-        all_x, all_y = np.where(available)
-        i = random.randint(0, len(all_x) - 1)
-        x, y = all_x[i], all_y[i]
+    while (counter < max_count or max_count < 1) and len(sampler) > 0:
+        xy = sampler[seed.randint(0, len(sampler))]
         #
         kind = pick_item_kind(map_entity)
+        if kind is None:
+            break
         count = pick_item_count(map_entity, kind)
         if count < 1:
             continue
-        items.spawn_item(map_entity, (x, y), kind, count)
-        dist2 = (xgrid - x) ** 2 + (ygrid - y) ** 2
-        available[dist2 <= radius**2] = False
+        positions, counts = batches.setdefault(kind, ([], []))
+        positions.append(xy)
+        counts.append(count)
+        sampler.exclude(xy)
         counter += 1
+    for kind, (positions, counts) in batches.items():
+        items.spawn_items(map_entity, positions, kind, counts)
 
 
 def respawn(map_entity: ecs.Entity):
@@ -218,15 +245,68 @@ def random_rect_room(
     return None
 
 
-def area_centroid(area: NDArray[np.bool_]) -> tuple[int, int]:
-    res = tuple(np.median(np.argwhere(area), axis=0).astype(np.int8))
-    return (int(res[0]), int(res[1]))
+@dataclass
+class Area:
+    """A connected area, as a mask over its bounding box."""
+
+    slices: tuple[slice, slice]
+    mask: NDArray[np.bool_]
+    size: int
+    centroid: tuple[int, int]
+
+    @property
+    def origin(self) -> tuple[int, int]:
+        return self.slices[0].start, self.slices[1].start
+
+    def full(self, shape: tuple[int, int]) -> NDArray[np.bool_]:
+        grid = np.full(shape, False)
+        grid[self.slices] = self.mask
+        return grid
+
+    def window(
+        self, shape: tuple[int, int], pad: int
+    ) -> tuple[tuple[slice, slice], NDArray[np.bool_]]:
+        """Bounding box grown by pad cells and clipped to shape, with the mask."""
+        x0, y0 = self.origin
+        w, h = self.mask.shape
+        wx0, wy0 = max(0, x0 - pad), max(0, y0 - pad)
+        slices = (
+            slice(wx0, min(shape[0], x0 + w + pad)),
+            slice(wy0, min(shape[1], y0 + h + pad)),
+        )
+        mask = np.full((slices[0].stop - wx0, slices[1].stop - wy0), False)
+        mask[x0 - wx0 : x0 - wx0 + w, y0 - wy0 : y0 - wy0 + h] = self.mask
+        return slices, mask
+
+    def indices(self) -> tuple[NDArray[np.intp], NDArray[np.intp]]:
+        """Map coordinates of every cell of the bounding box."""
+        x_grid, y_grid = np.indices(self.mask.shape)
+        return x_grid + self.origin[0], y_grid + self.origin[1]
+
+    def where(self, local: NDArray[np.bool_]) -> tuple[NDArray, NDArray]:
+        """Map coordinates of the cells set in a mask over the bounding box."""
+        all_x, all_y = np.where(local)
+        return all_x + self.origin[0], all_y + self.origin[1]
+
+
+def label_areas(grid: NDArray[np.bool_]) -> list[Area]:
+    """Connected areas of a grid, labelled in one pass."""
+    labels, n_areas = scipy.ndimage.label(grid)
+    sizes = np.bincount(labels.ravel(), minlength=n_areas + 1)
+    areas = []
+    for i, slices in enumerate(scipy.ndimage.find_objects(labels), 1):
+        mask = labels[slices] == i
+        x, y = np.median(np.argwhere(mask), axis=0).astype(int)
+        centroid = (int(x) + slices[0].start, int(y) + slices[1].start)
+        areas.append(Area(slices, mask, int(sizes[i]), centroid))
+    return areas
 
 
 def corridor_cost_matrix(
     walkable: NDArray[np.bool_],
     seed: np.random.RandomState | None = None,
     noise: int = 0,
+    noise_grid: NDArray[np.int_] | None = None,
 ) -> NDArray[np.int32]:
     cost = 6 - walkable
     wmoore = funcs.moore(walkable)
@@ -243,8 +323,9 @@ def corridor_cost_matrix(
         cost[~walkable & (funcs.moore(wall) > 0)] -= 2
     cost[walkable & corridor] = 1
     cost[walkable & (cost < 1)] = 1
-    if seed is not None and noise > 0:
+    if noise_grid is None and seed is not None and noise > 0:
         noise_grid = seed.randint(-noise, noise + 1, walkable.shape)
+    if noise_grid is not None:
         cost += noise_grid * ~walkable
     cost[:, 0] = 0
     cost[0, :] = 0
@@ -253,6 +334,93 @@ def corridor_cost_matrix(
     return cost
 
 
+class CorridorRouter:
+    """Route corridors over one cost field, patched locally as they are carved.
+
+    The cost of a cell depends on the walkable cells up to COST_RADIUS away, so
+    carving a corridor only recomputes a window around it.
+    """
+
+    COST_RADIUS = 4
+    # Corridors may stray this far outside the bounding box of their endpoints
+    ROUTE_MARGIN = 16
+
+    def __init__(
+        self,
+        walkable: NDArray[np.bool_],
+        seed: np.random.RandomState | None = None,
+        noise: int = 0,
+    ):
+        self.walkable = walkable.copy()
+        self.noise = noise
+        # One noise field for every corridor, so patched windows stay consistent
+        self.noise_grid = None
+        if seed is not None and noise > 0:
+            self.noise_grid = seed.randint(-noise, noise + 1, walkable.shape)
+        self.cost = corridor_cost_matrix(
+            self.walkable, noise=noise, noise_grid=self.noise_grid
+        )
+
+    def distances(
+        self, area: NDArray[np.bool_], targets: NDArray[np.bool_] | None = None
+    ) -> NDArray[np.int32]:
+        """Dijkstra map from area, shared by every corridor leading to it.
+
+        With targets, only the window around area and targets is searched.
+        """
+        dijkstra = tcod.path.maxarray(self.walkable.shape, dtype=np.int32)
+        dijkstra[area] = 0
+        window: tuple[slice, ...] = (slice(None), slice(None))
+        if targets is not None:
+            cells = np.argwhere(area | targets)
+            lo = np.maximum(cells.min(0) - self.ROUTE_MARGIN, 0)
+            hi = cells.max(0) + 1 + self.ROUTE_MARGIN
+            window = (slice(lo[0], hi[0]), slice(lo[1], hi[1]))
+        # Contiguous, so the search can write its result in place
+        sub = dijkstra[window].copy()
+        tcod.path.dijkstra2d(sub, self.cost[window], 1, 0, out=sub)
+        dijkstra[window] = sub
+        return dijkstra
+
+    def route(
+        self,
+        dijkstra: NDArray[np.int32],
+        area: NDArray[np.bool_],
+        max_size: int = 0,
+    ) -> NDArray[np.bool_]:
+        """New cells of the cheapest corridor from area down the dijkstra map."""
+        origin = np.unravel_index(
+            np.argmin(np.where(area, dijkstra, np.iinfo(np.int32).max)), area.shape
+        )
+        grid = np.full(area.shape, False)
+        path = tcod.path.hillclimb2d(dijkstra, origin, True, False)
+        grid[path[:, 0], path[:, 1]] = True
+        grid &= ~self.walkable
+        if max_size > 0 and np.sum(grid) > max_size:
+            return np.full(grid.shape, False)
+        return grid
+
+    def carve(self, path: NDArray[np.bool_]):
+        if not path.any():
+            return
+        self.walkable |= path
+        r = self.COST_RADIUS
+        w, h = path.shape
+        cells = np.argwhere(path)
+        (x0, y0), (x1, y1) = cells.min(0), cells.max(0) + 1
+        # Cells whose cost may change, and the window they are computed from
+        cx0, cx1 = max(0, x0 - r), min(w, x1 + r)
+        cy0, cy1 = max(0, y0 - r), min(h, y1 + r)
+        wx0, wx1 = max(0, cx0 - r), min(w, cx1 + r)
+        wy0, wy1 = max(0, cy0 - r), min(h, cy1 + r)
+        window = (slice(wx0, wx1), slice(wy0, wy1))
+        noise_grid = None if self.noise_grid is None else self.noise_grid[window]
+        cost = corridor_cost_matrix(self.walkable[window], None, self.noise, noise_grid)
+        self.cost[cx0:cx1, cy0:cy1] = cost[
+            cx0 - wx0 : cx1 - wx0, cy0 - wy0 : cy1 - wy0
+        ]
+
+
 def corridor(
     walkable: NDArray[np.bool_],
     area1: NDArray[np.bool_],
@@ -261,79 +429,59 @@ def corridor(
     noise: int = 0,
     max_size: int = 0,
 ) -> NDArray[np.bool_]:
-    grid = np.full(walkable.shape, False)
-    cost = corridor_cost_matrix(walkable | area1 | area2, seed, noise)
-    cost[area1] = 1
-    cost[area2] = 1
+    router = CorridorRouter(walkable | area1 | area2, seed, noise)
     if np.sum(area1) >= np.sum(area2):
-        origin = area_centroid(area2)
-        target = area1 & (funcs.moore(area1) >= 8)
-        if np.sum(target) < 1:
-            target = area1
-    else:
-        origin = area_centroid(area1)
-        target = area2 & (funcs.moore(area2) >= 8)
-        if np.sum(target) < 1:
-            target = area2
-    dijkstra = tcod.path.maxarray(grid.shape, dtype=np.int32)
-    dijkstra[target] = 0
-    tcod.path.dijkstra2d(dijkstra, cost, 1, 0, out=dijkstra)
-    path = tcod.path.hillclimb2d(dijkstra, origin, True, False)
-    for point in path:
-        grid[point[0], point[1]] = True
-    if max_size > 0 and np.sum(grid & ~walkable & ~area1 & ~area2) > max_size:
-        return np.full(grid.shape, False)
-    return grid & ~walkable & ~area1 & ~area2
+        return router.route(router.distances(area1), area2, max_size)
+    return router.route(router.distances(area2), area1, max_size)
 
 
 def delaunay_corridors(
     walkable: NDArray[np.bool_],
-    areas: list[NDArray[np.bool_]],
+    areas: list[Area],
     seed: np.random.RandomState,
     noise: int = 0,
     nomst_prob: float = 0.10,
     max_size: int = 0,
 ):
-    points = [area_centroid(area) for area in areas]
+    points = [area.centroid for area in areas]
     distmat = scipy.spatial.distance.cdist(points, points, metric="minkowski")
     mst = scipy.sparse.csgraph.minimum_spanning_tree(distmat).toarray().astype(int)
-    grid = walkable.copy()
+    router = CorridorRouter(walkable, seed, noise)
     connected = np.full(mst.shape, False)
-    for i, j in zip(*np.where(mst != 0)):
-        path = corridor(grid, areas[i], areas[j], seed, noise, max_size)
-        if max_size < 1 or np.sum(path & ~grid) <= max_size:
-            grid |= path
-            connected[i, j] = True
-            connected[j, i] = True
+    shape = walkable.shape
+
+    def connect(edges: list[tuple[int, int]]):
+        # Grouped by their larger area, each group shares one dijkstra map
+        groups: dict[int, list[int]] = {}
+        for i, j in edges:
+            if areas[i].size < areas[j].size:
+                i, j = j, i
+            groups.setdefault(i, []).append(j)
+        for i, targets in groups.items():
+            target_grid = np.full(shape, False)
+            for j in targets:
+                target_grid[areas[j].slices] |= areas[j].mask
+            dijkstra = router.distances(areas[i].full(shape), target_grid)
+            for j in targets:
+                path = router.route(dijkstra, areas[j].full(shape))
+                if max_size > 0 and np.sum(path) > max_size:
+                    continue  # Too long, a Delaunay edge may join them instead
+                router.carve(path)
+                connected[i, j] = True
+                connected[j, i] = True
+
+    connect([(int(i), int(j)) for i, j in zip(*np.where(mst != 0))])
     if nomst_prob > 0:
+        edges = []
         delaunay = scipy.spatial.Delaunay(points).simplices.tolist()
         for a, b, c in delaunay:
-            if not connected[a, b] and seed.random() <= nomst_prob:
-                path = corridor(grid, areas[a], areas[b], seed, noise, max_size)
-                if max_size < 1 or np.sum(path & ~grid) <= max_size:
-                    grid |= path
-                    connected[a, b] = True
-                    connected[b, a] = True
-            if not connected[a, c] and seed.random() <= nomst_prob:
-                path = corridor(grid, areas[a], areas[c], seed, noise, max_size)
-                if max_size < 1 or np.sum(path & ~grid) <= max_size:
-                    grid |= path
-                    connected[a, c] = True
-                    connected[c, a] = True
-            if not connected[b, c] and seed.random() <= nomst_prob:
-                path = corridor(grid, areas[b], areas[c], seed, noise, max_size)
-                if max_size < 1 or np.sum(path & ~grid) <= max_size:
-                    grid |= path
-                    connected[b, c] = True
-                    connected[c, b] = True
-    return grid & ~walkable
-
-
-def disjoint_areas(grid: NDArray[np.bool_]) -> list[NDArray[np.bool_]]:
-    areas, n_areas = scipy.ndimage.label(grid)
-    return [
-        grid & (areas == i) for i in range(n_areas + 1) if np.sum(grid[areas == i]) > 0
-    ]
+            for i, j in ((a, b), (a, c), (b, c)):
+                if (i, j) in edges or (j, i) in edges:
+                    continue
+                if not connected[i, j] and seed.random() <= nomst_prob:
+                    edges.append((i, j))
+        connect(edges)
+    return router.walkable & ~walkable
 
 
 def random_rooms(
@@ -355,17 +503,22 @@ def random_rooms(
     return room_grid
 
 
-def random_walk(condition: NDArray[np.bool_], walkers: int = 5, steps: int = 500):
+def random_walk(
+    condition: NDArray[np.bool_],
+    seed: np.random.RandomState,
+    walkers: int = 5,
+    steps: int = 500,
+):
     # Random walk algorithm
     # Repeat for each walker
     grid = np.full(condition.shape, False)
     for walkers in range(walkers):
-        x, y = (consts.MAP_SHAPE[0] // 2, consts.MAP_SHAPE[1] // 2)
+        x, y = (condition.shape[0] // 2, condition.shape[1] // 2)
         grid[x, y] = True
         # Walk each step
         for step in range(steps):
             # Choose a random direction
-            dx, dy = random.choice([(0, 1), (1, 0), (0, -1), (-1, 0)])
+            dx, dy = [(0, 1), (1, 0), (0, -1), (-1, 0)][seed.randint(0, 4)]
             # If next step is within map bounds
             if (
                 maps.is_in_bounds(grid, (x + dx * 2, y + dy * 2))
@@ -402,12 +555,9 @@ def cellular_automata(
 
 
 def prune(area: NDArray[np.bool_], min_area: int = 16) -> NDArray[np.bool_]:
-    areas, n_areas = scipy.ndimage.label(area)
-    grid = area.copy()
-    for i in range(n_areas + 1):
-        if np.sum(areas == i) < min_area:
-            grid[areas == i] = False
-    return grid
+    labels, _ = scipy.ndimage.label(area)
+    sizes = np.bincount(labels.ravel())
+    return area & (sizes >= min_area)[labels]
 
 
 def spawn_prop(
@@ -420,16 +570,23 @@ def spawn_prop(
     return entity
 
 
-def add_doors(map_entity: ecs.Entity, condition: NDArray[np.bool_] | None = None):
-    grid = map_entity.components[comp.Tiles]
-    depth = map_entity.components[comp.Depth]
-    walkable = db.walkable[grid]
+def door_cells(
+    walkable: NDArray[np.bool_], condition: NDArray[np.bool_] | None = None
+) -> NDArray[np.bool_]:
+    """Cells between two walls leading into a room."""
     bm = funcs.bitmask(walkable)
     wmoore = funcs.moore(walkable)
     rooms = walkable & (funcs.moore(wmoore >= 8) > 0)
     doors = walkable & np.isin(bm, (6, 9)) & (funcs.moore(rooms) > 0)
     if condition is not None:
         doors &= condition
+    return doors
+
+
+def add_doors(map_entity: ecs.Entity, condition: NDArray[np.bool_] | None = None):
+    grid = map_entity.components[comp.Tiles]
+    depth = map_entity.components[comp.Depth]
+    doors = door_cells(db.walkable[grid], condition)
     all_x, all_y = np.where(doors)
     for x, y in zip(all_x, all_y):
         door = spawn_prop(map_entity, "Door", (x, y))
@@ -542,19 +699,16 @@ def add_traps(
     available = walkable & (wmoore == 2) & np.isin(bm, (6, 9))
     if condition is not None:
         available &= condition
-    grid_x, grid_y = np.indices(tiles.shape)
+    sampler = funcs.DiskSampler(available, radius)
     for _ in range(max_count):
-        if np.sum(available) < 1:
+        if len(sampler) < 1:
             break
-        all_x, all_y = np.where(available)
-        i = seed.randint(0, len(all_x))
-        x, y = all_x[i], all_y[i]
-        dist2 = (grid_x - x) ** 2 + (grid_y - y) ** 2
-        available[dist2 <= radius**2] = False
-        trap = spawn_prop(map_entity, "Trap", (x, y))
+        xy = sampler[seed.randint(0, len(sampler))]
+        sampler.exclude(xy)
+        trap = spawn_prop(map_entity, "Trap", xy)
         trap.tags |= {comp.Hidden}
         if seed.randint(0, 100) <= 100 * bones_prob:
-            spawn_prop(map_entity, "Bones", (x, y))
+            spawn_prop(map_entity, "Bones", xy)
 
 
 def add_boulders(
@@ -572,68 +726,59 @@ def add_boulders(
     available = walkable & (wmoore > 4) & ~np.isin(bm, (6, 9))
     if condition is not None:
         available &= condition
-    grid_x, grid_y = np.indices(tiles.shape)
+    sampler = funcs.DiskSampler(available, radius)
     for _ in range(max_count):
-        if np.sum(available) < 1:
+        if len(sampler) < 1:
             break
-        all_x, all_y = np.where(available)
-        i = seed.randint(0, len(all_x))
-        x, y = all_x[i], all_y[i]
-        dist2 = (grid_x - x) ** 2 + (grid_y - y) ** 2
-        available[dist2 <= radius**2] = False
-        spawn_prop(map_entity, "Boulder", (x, y))
+        xy = sampler[seed.randint(0, len(sampler))]
+        sampler.exclude(xy)
+        spawn_prop(map_entity, "Boulder", xy)
 
 
-def add_upstairs_room(map_entity: ecs.Entity) -> NDArray[np.bool_]:
-    depth = map_entity.components[comp.Depth]
-    seed = map_entity.components[np.random.RandomState]
-    points = []
+def upstairs_room(
+    seed: np.random.RandomState,
+    depth: int,
+    points: list[tuple[int, int]],
+    shape: tuple[int, int] = consts.MAP_SHAPE,
+) -> tuple[NDArray[np.bool_], list[tuple[int, int]]]:
     if depth < 1:
-        x = seed.randint(
-            consts.MAX_ROOM_SIZE,
-            consts.MAP_SHAPE[0] - consts.MAX_ROOM_SIZE,
-        )
-        y = seed.randint(
-            consts.MAX_ROOM_SIZE,
-            consts.MAP_SHAPE[1] - consts.MAX_ROOM_SIZE,
-        )
+        x = seed.randint(consts.MAX_ROOM_SIZE, shape[0] - consts.MAX_ROOM_SIZE)
+        y = seed.randint(consts.MAX_ROOM_SIZE, shape[1] - consts.MAX_ROOM_SIZE)
         points = [(x, y)]
-    else:
-        prev_map = maps.get_map(map_entity.registry, depth - 1)
-        query = map_entity.registry.Q.all_of(
-            components=[comp.Position, comp.Interaction],
-            tags=[comp.Downstairs],
-            relations=[(comp.Map, prev_map)],
-        )
-        points = [e.components[comp.Position].xy for e in query]
-    rooms = np.full(consts.MAP_SHAPE, False)
+    # The level above may be larger than this one
+    points = [
+        (min(max(1, x), shape[0] - 2), min(max(1, y), shape[1] - 2)) for x, y in points
+    ]
+    rooms = np.full(shape, False)
     for point in points:
         w, h = random_room_size(seed)
-        x = min(max(1, point[0] - w // 2 + 1), consts.MAP_SHAPE[0] - w - 1)
-        y = min(max(1, point[1] - h // 2 + 1), consts.MAP_SHAPE[1] - h - 1)
-        rooms |= rect_room(consts.MAP_SHAPE, x, y, w, h)
+        x = min(max(1, point[0] - w // 2 + 1), shape[0] - w - 1)
+        y = min(max(1, point[1] - h // 2 + 1), shape[1] - h - 1)
+        rooms |= rect_room(shape, x, y, w, h)
         rooms[point] = True
-        spawn_prop(map_entity, "Upstairs", point)
     rooms[0, :] = False
     rooms[:, 0] = False
     rooms[-1, :] = False
     rooms[:, -1] = False
-    return rooms
+    return rooms, points
+
+
+def upstairs_points(reg: ecs.Registry, depth: int) -> list[tuple[int, int]]:
+    if depth < 1:
+        return []
+    prev_map = maps.get_map(reg, depth - 1)
+    query = reg.Q.all_of(
+        components=[comp.Position, comp.Interaction],
+        tags=[comp.Downstairs],
+        relations=[(comp.Map, prev_map)],
+    )
+    return sorted(tuple(int(i) for i in e.components[comp.Position].xy) for e in query)
 
 
 def update_bitmasks(grid: NDArray[np.int8]) -> NDArray[np.int8]:
-    bm = funcs.bitmask(grid)
-    for tile_name, tile_id in db.tile_id.items():
-        tile_name = db.tile_names[tile_id]
-        if tile_name[-1] in "1234567890":
-            continue
-        for j in range(16):
-            new_name = f"{tile_name}{j}"
-            if new_name in db.tile_names:
-                np.sum((grid == tile_id) & (bm == j))
-                new_id = db.tile_id[new_name]
-                grid[(grid == tile_id) & (bm == j)] = new_id
-    return grid
+    # Works on already autotiled grids too, every variant maps back to its base
+    base = db.tile_base[grid]
+    return db.autotile[base, funcs.bitmask(base)]
 
 
 def player_spawn(map_entity: ecs.Entity) -> comp.Position:
@@ -684,13 +829,17 @@ def add_chests(map_entity: ecs.Entity, room_grid: NDArray[np.bool_]):
     # Separate rooms
     rmoore = funcs.moore(room_grid)
     inroom = room_grid & (funcs.moore(rmoore == 8) > 0)
-    room_list = disjoint_areas(inroom)
-    # Count the connections of each room
-    room_connections = [
-        # Walkable tiles that are not in the room but are next to the room
-        np.sum(walkable & ~r & (funcs.moore(r) > 0))
-        for r in room_list
-    ]
+    # Walkable tiles that are not in the room but are next to it, in a window
+    # one cell around each room
+    room_list = []
+    for room in label_areas(inroom):
+        slices, local = room.window(walkable.shape, 1)
+        door_tile = walkable[slices] & ~local & (funcs.moore(local) > 0)
+        # Keep rooms with only one connection
+        if np.sum(door_tile) == 1:
+            room_list.append((room, slices, local, door_tile))
+    if len(room_list) < 1:
+        return
     # Remove all positiions with entities
     noentity = walkable.copy()
     query = map_entity.registry.Q.all_of(
@@ -700,12 +849,8 @@ def add_chests(map_entity: ecs.Entity, room_grid: NDArray[np.bool_]):
     for e in query:
         x, y = e.components[comp.Position].xy
         noentity[x, y] = False
-    # Find rooms with only one connection
-    room_list = [r for r, c in zip(room_list, room_connections) if c == 1]
-    if len(room_list) < 1:
-        return
     # Create a matrix with all locked rooms
-    locked_room_grid = room_list[0]
+    locked_room_grid = np.full(walkable.shape, False)
     # CReate a grid with upstairs position
     query = map_entity.registry.Q.all_of(
         components=[comp.Position],
@@ -717,27 +862,28 @@ def add_chests(map_entity: ecs.Entity, room_grid: NDArray[np.bool_]):
         uxy = u.components[comp.Position].xy
         upstairs_grid[uxy] = True
     # Iterate over rooms
-    for room in room_list:
-        locked_room_grid |= room
-        door_tile = walkable & ~room & (funcs.moore(room) > 0)
-        available = room & noentity & (funcs.moore(door_tile) == 0)
+    for room, slices, local, door_tile in room_list:
+        locked_room_grid[room.slices] |= room.mask
+        available = local & noentity[slices] & (funcs.moore(door_tile) == 0)
         if np.sum(available) < 1:
             continue
         # Randomize position
         all_x, all_y = np.where(available)
         i = seed.randint(0, len(all_x))
-        pos = (all_x[i], all_y[i])
+        pos = (all_x[i] + slices[0].start, all_y[i] + slices[1].start)
         # Spawn chest
         chest = spawn_prop(map_entity, "Chest", pos)
         # Populate chest with items
         n_items = (seed.randint(1, 6) + seed.randint(1, 6)) // 2
         for _ in range(n_items):
             kind = pick_item_kind(map_entity)
+            if kind is None:
+                break
             count = pick_item_count(map_entity, kind)
             items.add_item(chest, kind, count)
 
         # Don't lock the room if there is no door or if there is an upstairs
-        if np.sum(door_tile) < 1 or np.sum(room & upstairs_grid) > 0:
+        if np.sum(door_tile) < 1 or np.sum(local & upstairs_grid[slices]) > 0:
             continue
 
         # Spawn key somewhere else
@@ -745,9 +891,11 @@ def add_chests(map_entity: ecs.Entity, room_grid: NDArray[np.bool_]):
         i = seed.randint(0, len(all_x))
         key_pos = (all_x[i], all_y[i])
         key_entity = items.spawn_item(map_entity, key_pos, "Key")
+        assert key_entity is not None
 
         # Find door entity
-        door_xy = tuple(np.argwhere(door_tile).tolist()[0])
+        dx, dy = np.argwhere(door_tile)[0]
+        door_xy = (int(dx) + slices[0].start, int(dy) + slices[1].start)
         query = map_entity.registry.Q.all_of(
             components=[comp.Position, comp.Interaction],
             tags=[comp.Door, comp.Position(door_xy, depth)],
@@ -761,36 +909,189 @@ def add_chests(map_entity: ecs.Entity, room_grid: NDArray[np.bool_]):
             door_entity.components[comp.Sprite] = spr
 
 
-def generate(map_entity: ecs.Entity):
-    # Generate map
-    world_seed = map_entity.registry[None].components[np.random.RandomState]
-    seed_id = world_seed.randint(1, 999999)
+def room_graph(
+    parts: dict[str, NDArray[np.bool_]],
+    walkable: NDArray[np.bool_],
+    doors: NDArray[np.bool_],
+) -> comp.RoomGraph:
+    """Index the connected areas of every kind of part, and which of them touch."""
+    shape = walkable.shape
+    area = np.full(shape, -1, np.int16)
+    kinds: list[str] = []
+    centroids: list[tuple[int, int]] = []
+    # Cells in several parts belong to the first
+    for kind, mask in parts.items():
+        for a in label_areas(mask & (area < 0)):
+            area[a.slices][a.mask] = len(kinds)
+            kinds.append(kind)
+            centroids.append(a.centroid)
+    # Pairs of different areas next to each other, diagonals included
+    w, h = shape
+    pairs = [np.zeros((0, 2), np.int16)]
+    for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        src = area[: w - dx, max(0, -dy) : h - max(0, dy)]
+        dst = area[dx:, max(0, dy) : h + min(0, dy)]
+        touching = (src >= 0) & (dst >= 0) & (src != dst)
+        pairs.append(np.stack([src[touching], dst[touching]], 1))
+    adjacency: list[list[int]] = [[] for _ in kinds]
+    for i, j in np.unique(np.sort(np.concatenate(pairs), 1), axis=0).tolist():
+        adjacency[i].append(j)
+        adjacency[j].append(i)
+    door_areas = {}
+    for x, y in np.argwhere(doors).tolist():
+        if walkable[x - 1, y] and walkable[x + 1, y]:
+            sides = area[x - 1, y], area[x + 1, y]
+        else:
+            sides = area[x, y - 1], area[x, y + 1]
+        door_areas[(x, y)] = (int(sides[0]), int(sides[1]))
+    return comp.RoomGraph(area, kinds, centroids, adjacency, door_areas)
+
+
+@dataclass
+class Layout:
+    seed: np.random.RandomState
+    grid: NDArray[np.int8]
+    room_floor: NDArray[np.bool_]
+    upstairs: list[tuple[int, int]]
+    rooms: list[Area]
+    graph: comp.RoomGraph
+
+
+def generate_layout(
+    seed_id: int,
+    depth: int,
+    upstairs: list[tuple[int, int]],
+    shape: tuple[int, int] = consts.MAP_SHAPE,
+) -> Layout:
+    """Run the numpy stages of level generation, which need no registry."""
     seed = np.random.RandomState(seed_id)
-    map_entity.components[comp.Seed] = seed_id
-    map_entity.components[np.random.RandomState] = seed
-    depth = map_entity.components[comp.Depth]
-    if depth > 0:
-        map_entity.components[comp.XPGain] = 5 * ((depth + 1) // 2)
+    rooms: list[Area] = []
     if depth <= 0:
-        grid = generate_forest(map_entity)
+        grid, parts = generate_forest(seed, shape)
     else:
-        grid = generate_dungeon(map_entity)
+        grid, upstairs, rooms, parts = generate_dungeon(seed, depth, upstairs, shape)
     room_floor = grid == db.tile_id["floor"]
-    map_entity.components[comp.Tiles] = grid
-    map_entity.components[comp.Explored] = np.full(grid.shape, False)
+    walkable = db.walkable[grid]
+    graph = room_graph(parts, walkable, door_cells(walkable, room_floor))
     # Post processing
     grid = update_bitmasks(grid)
+    return Layout(seed, grid, room_floor, upstairs, rooms, graph)
+
+
+def area_scale(shape: tuple[int, int]) -> float:
+    """Map area relative to the default map, to scale room and spawn counts."""
+    return shape[0] * shape[1] / (consts.MAP_SHAPE[0] * consts.MAP_SHAPE[1])
+
+
+def level_inputs(map_entity: ecs.Entity, depth: int) -> tuple:
+    """Everything generate_layout needs, the key of pregenerated and cached levels."""
+    reg = map_entity.registry
+    if comp.Seed not in map_entity.components:
+        map_entity.components[comp.Seed] = new_seed_id(reg)
+    seed_id = map_entity.components[comp.Seed]
+    shape = reg[None].components.get(comp.MapShape, consts.MAP_SHAPE)
+    return (seed_id, depth, upstairs_points(reg, depth), shape)
+
+
+def new_seed_id(reg: ecs.Registry) -> int:
+    world_seed = reg[None].components[np.random.RandomState]
+    return world_seed.randint(1, 999999)
+
+
+def generate(map_entity: ecs.Entity):
+    depth = map_entity.components[comp.Depth]
+    inputs = level_inputs(map_entity, depth)
+    cache_path = saves.level_cache_path(map_entity.registry, inputs)
+    if saves.load_cached_level(map_entity, cache_path):
+        if map_entity in _pending:
+            _pending.pop(map_entity)[1].cancel()
+        return
+    layout = None
+    if map_entity in _pending:
+        pending_inputs, future = _pending.pop(map_entity)
+        try:
+            if pending_inputs == inputs:
+                layout = future.result()
+        except (BrokenExecutor, CancelledError):
+            shutdown_pregeneration()
+    if layout is None:
+        layout = generate_layout(*inputs)
     # Save generated map
+    grid = layout.grid
+    map_entity.components[np.random.RandomState] = layout.seed
+    if depth > 0:
+        map_entity.components[comp.XPGain] = 5 * ((depth + 1) // 2)
     map_entity.components[comp.Tiles] = grid
+    map_entity.components[comp.Explored] = np.full(grid.shape, False)
+    map_entity.components[comp.Rooms] = layout.graph
+    for point in layout.upstairs:
+        spawn_prop(map_entity, "Upstairs", point)
+    decorate_rooms(map_entity, layout.rooms)
     # Add props
+    room_floor = layout.room_floor
+    scale = area_scale(grid.shape)
     add_doors(map_entity, room_floor)
-    add_torches(map_entity, condition=funcs.moore(room_floor) > 0)
-    add_traps(map_entity)
-    add_boulders(map_entity, condition=grid == db.tile_id["cavefloor"])
+    add_torches(map_entity, int(30 * scale), condition=funcs.moore(room_floor) > 0)
+    add_traps(map_entity, max_count=int(10 * scale))
+    add_boulders(
+        map_entity,
+        max_count=int(20 * scale),
+        condition=grid == db.tile_id["cavefloor"],
+    )
     add_chests(map_entity, room_floor)
     add_downstairs(map_entity, room_floor, max_count=1 + (depth > 0))
     spawn_items(map_entity)
-    spawn_enemies(map_entity, consts.ENEMY_RADIUS, consts.N_ENEMIES)
+    spawn_enemies(map_entity, consts.ENEMY_RADIUS, int(consts.N_ENEMIES * scale))
+    saves.cache_level(map_entity, cache_path)
+
+
+_executor: ProcessPoolExecutor | None = None
+_pending: dict[ecs.Entity, tuple[tuple, Future[Layout]]] = {}
+# Map whose next depth was last considered, it only changes with the depth
+_pregenerated_from: ecs.Entity | None = None
+
+
+def pregenerate(map_entity: ecs.Entity):
+    """Lay out the next depth in a worker process, to be filled on descending."""
+    global _executor, _pregenerated_from
+    if map_entity is _pregenerated_from:
+        return
+    _pregenerated_from = map_entity
+    reg = map_entity.registry
+    for e in [e for e in _pending if e.registry is not reg]:
+        _pending.pop(e)[1].cancel()
+    depth = map_entity.components[comp.Depth]
+    next_map = reg[(comp.Map, depth + 1)]
+    chunks = reg[None].components.get(comp.SaveChunks)
+    if (
+        comp.Depth in next_map.components
+        or next_map in _pending
+        or (chunks is not None and depth + 1 in chunks.unloaded)
+    ):
+        return
+    # Drawing the seed now keeps the world seed sequence the same
+    inputs = level_inputs(next_map, depth + 1)
+    cached = consts.LEVEL_CACHE_SIZE > 0
+    if cached and saves.level_cache_path(reg, inputs).exists():
+        return
+    if _executor is None:
+        context = multiprocessing.get_context("spawn")
+        _executor = ProcessPoolExecutor(1, context, initializer=db.load_tiles)
+    try:
+        _pending[next_map] = (inputs, _executor.submit(generate_layout, *inputs))
+    except BrokenExecutor:
+        shutdown_pregeneration()
+
+
+def shutdown_pregeneration():
+    global _executor, _pregenerated_from
+    for _, future in _pending.values():
+        future.cancel()
+    _pending.clear()
+    _pregenerated_from = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
 
 
 def random_lake(
@@ -805,9 +1106,10 @@ def random_lake(
     return cellular_automata(area, seed)
 
 
-def generate_forest(map_entity: ecs.Entity) -> NDArray[np.int8]:
-    grid = np.zeros(consts.MAP_SHAPE, np.int8)
-    seed = map_entity.components[np.random.RandomState]
+def generate_forest(
+    seed: np.random.RandomState, shape: tuple[int, int] = consts.MAP_SHAPE
+) -> tuple[NDArray[np.int8], dict[str, NDArray[np.bool_]]]:
+    grid = np.zeros(shape, np.int8)
     # Create ruins
     ruins = random_rect_room(grid != 0, seed, max_iter=100)
     if ruins is None:
@@ -824,11 +1126,12 @@ def generate_forest(map_entity: ecs.Entity) -> NDArray[np.int8]:
     # Create forest
     grass |= cellular_automata(~(ruins | walls | lake), seed, density=0.5)
     # Combine areas
-    areas = disjoint_areas(grass | ruins)
+    areas = label_areas(grass | ruins)
     if len(areas) > 2:
         conn = delaunay_corridors(grass | ruins | lake, areas, seed, 10, 0.4)
     elif len(areas) == 2:
-        conn = corridor(grass | ruins | lake, areas[0], areas[1], seed, 10)
+        area1, area2 = (area.full(shape) for area in areas)
+        conn = corridor(grass | ruins | lake, area1, area2, seed, 10)
     #
     grass |= conn & ~walls
     ruins |= conn & walls
@@ -845,15 +1148,25 @@ def generate_forest(map_entity: ecs.Entity) -> NDArray[np.int8]:
     grid[lake] = db.tile_id["water"]
     grid[walls] = db.tile_id["wall"]
     grid[ruins] = db.tile_id["floor"]
-    return grid
+    return grid, {"room": ruins, "clearing": grass & ~trees}
 
 
-def generate_dungeon(map_entity: ecs.Entity) -> NDArray[np.int8]:
-    grid = np.zeros(consts.MAP_SHAPE, np.int8)
-    seed = map_entity.components[np.random.RandomState]
+def generate_dungeon(
+    seed: np.random.RandomState,
+    depth: int,
+    upstairs: list[tuple[int, int]],
+    shape: tuple[int, int] = consts.MAP_SHAPE,
+) -> tuple[
+    NDArray[np.int8],
+    list[tuple[int, int]],
+    list[Area],
+    dict[str, NDArray[np.bool_]],
+]:
+    grid = np.zeros(shape, np.int8)
+    scale = area_scale(shape)
     # Create room for upstairs
-    upstairs_room = add_upstairs_room(map_entity)
-    room_grid = upstairs_room.copy()
+    upstairs_rooms, upstairs = upstairs_room(seed, depth, upstairs, shape)
+    room_grid = upstairs_rooms.copy()
     walls = funcs.moore(room_grid) > 0
     # Create lake
     lake = random_lake(~(room_grid | walls), seed)
@@ -869,12 +1182,15 @@ def generate_dungeon(map_entity: ecs.Entity) -> NDArray[np.int8]:
 
     # Create random rooms
     room_grid = room_grid | random_rooms(
-        ~(room_grid | lake | cave_grid), seed, max_rooms=consts.NUM_ROOMS - 1
+        ~(room_grid | lake | cave_grid),
+        seed,
+        max_rooms=int(consts.NUM_ROOMS * scale) - 1,
+        max_iter=int(100 * scale),
     )
     # Create caves
     cave_grid |= prune(cellular_automata(~(room_grid | lake | cave_grid), seed))
     # Create corridors
-    area_list = disjoint_areas(cave_grid | room_grid)
+    area_list = label_areas(cave_grid | room_grid)
     corridors = delaunay_corridors(
         room_grid | cave_grid, area_list, seed, noise=5, nomst_prob=0.15
     )
@@ -891,18 +1207,18 @@ def generate_dungeon(map_entity: ecs.Entity) -> NDArray[np.int8]:
     near_room = funcs.moore(room_grid) > 0
     grid[room_grid | (corridors & near_room)] = db.tile_id["floor"]
     #
-    room_list = disjoint_areas(room_grid & ~upstairs_room)
-    decorate_rooms(map_entity, room_list)
-    return grid
+    room_list = label_areas(room_grid & ~upstairs_rooms)
+    parts = {"room": room_grid, "cave": cave_grid, "corridor": corridors}
+    return grid, upstairs, room_list, parts
 
 
-def decorate_rooms(map_entity: ecs.Entity, room_list: list[NDArray[np.bool_]]):
+def decorate_rooms(map_entity: ecs.Entity, room_list: list[Area]):
     seed = map_entity.components[np.random.RandomState]
     kinds = [dining_room, library_room, center_decor_room, storage_room, None, None]
     indices = [i for i in range(len(kinds))]
     weights = [10.0 for k in kinds]
     for room in room_list:
-        w, h = int(room.sum(axis=0).max()), int(room.sum(axis=1).max())
+        w, h = int(room.mask.sum(axis=0).max()), int(room.mask.sum(axis=1).max())
         if w <= consts.MIN_ROOM_SIZE or h <= consts.MIN_ROOM_SIZE:
             continue
         prob = [w / sum(weights) for w in weights]
@@ -913,23 +1229,24 @@ def decorate_rooms(map_entity: ecs.Entity, room_list: list[NDArray[np.bool_]]):
             decorate_fun(map_entity, room)
 
 
-def dining_room(map_entity: ecs.Entity, room: NDArray[np.bool_]):
+def dining_room(map_entity: ecs.Entity, room: Area):
     depth = map_entity.components[comp.Depth]
-    w, h = int(room.sum(axis=0).max()), int(room.sum(axis=1).max())
-    cx, cy = area_centroid(room)
-    rmoore = funcs.moore(room)
-    x_grid, y_grid = np.indices(room.shape)
+    mask = room.mask
+    w, h = int(mask.sum(axis=0).max()), int(mask.sum(axis=1).max())
+    cx, cy = room.centroid
+    rmoore = funcs.moore(mask)
+    x_grid, y_grid = room.indices()
     # Spawn tables
     if w > h:
         table = (y_grid == int(cy)) & (funcs.moore(rmoore >= 8) >= 8)
     else:
         table = (x_grid == int(cx)) & (funcs.moore(rmoore >= 8) >= 8)
-    all_x, all_y = np.where(table)
+    all_x, all_y = room.where(table)
     for x, y in zip(all_x, all_y):
         spawn_prop(map_entity, "Table", (x, y))
     # Spawn chairs
-    chairs = (funcs.moore(table, diagonals=False) > 0) & ~table & room
-    all_x, all_y = np.where(chairs)
+    chairs = (funcs.moore(table, diagonals=False) > 0) & ~table & mask
+    all_x, all_y = room.where(chairs)
     for x, y in zip(all_x, all_y):
         if x > cx:
             spawn_prop(map_entity, "Chair2", (x, y))
@@ -937,14 +1254,15 @@ def dining_room(map_entity: ecs.Entity, room: NDArray[np.bool_]):
             spawn_prop(map_entity, "Chair", (x, y))
 
 
-def library_room(map_entity: ecs.Entity, room: NDArray[np.bool_]):
+def library_room(map_entity: ecs.Entity, room: Area):
     depth = map_entity.components[comp.Depth]
     seed = map_entity.components[np.random.RandomState]
-    w, h = int(room.sum(axis=0).max()), int(room.sum(axis=1).max())
-    cx, cy = area_centroid(room)
-    rmoore = funcs.moore(room)
-    x_grid, y_grid = np.indices(room.shape)
-    shelf = room & (rmoore == 8)
+    mask = room.mask
+    w, h = int(mask.sum(axis=0).max()), int(mask.sum(axis=1).max())
+    cx, cy = room.centroid
+    rmoore = funcs.moore(mask)
+    x_grid, y_grid = room.indices()
+    shelf = mask & (rmoore == 8)
     if w > h:
         shelf &= np.abs(x_grid - int(cx)) % 2 == 0
         if h >= 7:
@@ -954,16 +1272,17 @@ def library_room(map_entity: ecs.Entity, room: NDArray[np.bool_]):
         if w >= 7:
             shelf &= x_grid != int(cx)
     #
-    books = list(
+    books = sorted(
         map_entity.registry.Q.all_of(components=[comp.Text], tags=["books"])
         .none_of(
             components=[comp.Position],
             relations=[(comp.Map, ...), (comp.Inventory, ...)],
         )
-        .get_entities()
+        .get_entities(),
+        key=lambda e: str(e.uid),
     )
     #
-    all_x, all_y = np.where(shelf)
+    all_x, all_y = room.where(shelf)
     for x, y in zip(all_x, all_y):
         if seed.randint(0, 10) < 5:
             prop = "Empty Shelf"
@@ -977,38 +1296,40 @@ def library_room(map_entity: ecs.Entity, room: NDArray[np.bool_]):
         items.add_item(shelf, kind, 1)
 
 
-def center_decor_room(map_entity: ecs.Entity, room: NDArray[np.bool_]):
+def center_decor_room(map_entity: ecs.Entity, room: Area):
     choices = ["Altar", "Statue", "Fountain", "Plaque", "Coffin", "Throne"]
     seed = map_entity.components[np.random.RandomState]
     depth = map_entity.components[comp.Depth]
-    w, h = int(room.sum(axis=0).max()), int(room.sum(axis=1).max())
+    mask = room.mask
+    w, h = int(mask.sum(axis=0).max()), int(mask.sum(axis=1).max())
     #
-    cx, cy = area_centroid(room)
+    cx, cy = room.centroid
     prop = choices[seed.randint(0, len(choices))]
     spawn_prop(map_entity, prop, (cx, cy))
     #
     if min(w, h) <= consts.MIN_ROOM_SIZE + 2:
         return
-    rmoore8 = funcs.moore(room) >= 8
-    statues = room & rmoore8 & (funcs.moore(rmoore8) == 3)
-    all_x, all_y = np.where(statues)
+    rmoore8 = funcs.moore(mask) >= 8
+    statues = mask & rmoore8 & (funcs.moore(rmoore8) == 3)
+    all_x, all_y = room.where(statues)
     for x, y in zip(all_x, all_y):
         spawn_prop(map_entity, "Statue", (x, y))
 
 
-def storage_room(map_entity: ecs.Entity, room: NDArray[np.bool_], prob: float = 0.5):
+def storage_room(map_entity: ecs.Entity, room: Area, prob: float = 0.5):
     seed = map_entity.components[np.random.RandomState]
-    rmoore = funcs.moore(room)
-    cx, cy = area_centroid(room)
-    x_grid, y_grid = np.indices(room.shape)
-    w, h = int(room.sum(axis=0).max()), int(room.sum(axis=1).max())
-    rand = seed.random(room.shape)
-    points = room & (rmoore >= 8) & (rand <= prob)
+    mask = room.mask
+    rmoore = funcs.moore(mask)
+    cx, cy = room.centroid
+    x_grid, y_grid = room.indices()
+    w, h = int(mask.sum(axis=0).max()), int(mask.sum(axis=1).max())
+    rand = seed.random(mask.shape)
+    points = mask & (rmoore >= 8) & (rand <= prob)
     if w > 6:
         points &= x_grid != int(cx)
     if h > 6:
         points &= y_grid != int(cy)
-    all_x, all_y = np.where(points)
+    all_x, all_y = room.where(points)
     props = ["Barrel", "Barrel", "Vase", "Logs"]
     for x, y in zip(all_x, all_y):
         k = seed.randint(0, len(props))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Time each level generation stage over a range of world seeds.
+
+Every world is generated from depth 0 down to --depth. Besides the timings,
+each level is checked for a few invariants: stairs exist and share one
+walkable region, creatures and items were spawned and the floor ratio is in
+range. Stage percentiles and failing seeds are written as JSON.
+"""
+
+import argparse
+import functools
+import json
+import os
+import pathlib
+import time
+from collections import defaultdict
+from typing import Callable
+
+import comp
+import consts
+import game_interface
+import keybinds  # must be here to avoid circular import
+import states
+
+import numpy as np
+import scipy.ndimage  # type: ignore
+import tcod.ecs as ecs
+
+import db
+import game_logic
+import maps
+import procgen
+
+STAGES = [
+    "generate",
+    "generate_layout",
+    "generate_forest",
+    "generate_dungeon",
+    "random_rooms",
+    "cellular_automata",
+    "delaunay_corridors",
+    "update_bitmasks",
+    "decorate_rooms",
+    "add_doors",
+    "add_torches",
+    "add_traps",
+    "add_boulders",
+    "add_chests",
+    "add_downstairs",
+    "spawn_items",
+    "spawn_enemies",
+]
+
+
+def instrument(timings: dict[str, float]):
+    """Wrap the procgen stages so their time accumulates in timings."""
+
+    def timed(name: str, fun: Callable) -> Callable:
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+
+        return wrapper
+
+    for name in STAGES:
+        setattr(procgen, name, timed(name, getattr(procgen, name)))
+
+
+def check_level(
+    map_entity: ecs.Entity, min_floor: float, max_floor: float
+) -> tuple[dict[str, float], list[str]]:
+    reg = map_entity.registry
+    depth = map_entity.components[comp.Depth]
+    walkable = db.walkable[map_entity.components[comp.Tiles]]
+
+    def positions(tag: str) -> list[tuple[int, int]]:
+        query = reg.Q.all_of(
+            components=[comp.Position], tags=[tag], relations=[(comp.Map, map_entity)]
+        )
+        return [e.components[comp.Position].xy for e in query]
+
+    upstairs = positions(comp.Upstairs)
+    downstairs = positions(comp.Downstairs)
+    creatures = reg.Q.all_of(
+        components=[comp.Position, comp.Initiative],
+        relations=[(comp.Map, map_entity)],
+    )
+    floor_items = reg.Q.all_of(
+        components=[comp.Position], tags=["items"], relations=[(comp.Map, map_entity)]
+    )
+    stats = {
+        "floor_ratio": float(walkable.mean()),
+        "creatures": len(list(creatures)),
+        "items": len(list(floor_items)),
+        "upstairs": len(upstairs),
+        "downstairs": len(downstairs),
+    }
+    failures = []
+    if len(downstairs) < 1:
+        failures.append("no downstairs")
+    if depth > 0 and len(upstairs) < 1:
+        failures.append("no upstairs")
+    # Tiles only, props such as doors and boulders can be moved out of the way
+    labels, count = scipy.ndimage.label(walkable, np.ones((3, 3)))
+    stairs = upstairs + downstairs
+    regions = {labels[xy] for xy in stairs}
+    if 0 in regions or len(regions) > 1:
+        failures.append("stairs not connected")
+    if stats["creatures"] < 1:
+        failures.append("no creatures")
+    if stats["items"] < 1:
+        failures.append("no items")
+    if not min_floor <= stats["floor_ratio"] <= max_floor:
+        failures.append(f"floor ratio {stats['floor_ratio']:.2f}")
+    return stats, failures
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    arr = np.asarray(values)
+    return {
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p90": float(np.percentile(arr, 90)),
+        "p99": float(np.percentile(arr, 99)),
+        "max": float(arr.max()),
+    }
+
+
+def benchmark(
+    seeds: range,
+    max_depth: int,
+    min_floor: float,
+    max_floor: float,
+    shape: tuple[int, int] | None = None,
+) -> dict:
+    timings: dict[str, float] = defaultdict(float)
+    instrument(timings)
+    stage_times: dict[str, list[float]] = defaultdict(list)
+    level_stats: dict[str, list[float]] = defaultdict(list)
+    failing = []
+    logic = game_logic.GameLogic()
+    for seed in seeds:
+        timings.clear()
+        logic.new_world(seed, shape)
+        for depth in range(max_depth + 1):
+            if depth > 0:
+                timings.clear()
+            map_entity = maps.get_map(logic.reg, depth)
+            for name, elapsed in timings.items():
+                stage_times[name].append(elapsed * 1000)
+            stats, failures = check_level(map_entity, min_floor, max_floor)
+            for name, value in stats.items():
+                level_stats[name].append(value)
+            if failures:
+                failing.append({"seed": seed, "depth": depth, "failures": failures})
+    return {
+        "stages_ms": {
+            name: percentiles(stage_times[name])
+            for name in STAGES
+            if name in stage_times
+        },
+        "levels": {name: percentiles(values) for name, values in level_stats.items()},
+        "failing": failing,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seeds", type=int, default=100, help="number of seeds")
+    parser.add_argument("--first-seed", type=int, default=1, help="first world seed")
+    parser.add_argument("--depth", type=int, default=3, help="deepest level")
+    parser.add_argument(
+        "--shape", type=int, nargs=2, metavar=("W", "H"), help="map size"
+    )
+    parser.add_argument("--min-floor", type=float, default=0.15)
+    parser.add_argument("--max-floor", type=float, default=0.9)
+    parser.add_argument(
+        "--level-cache",
+        type=int,
+        default=0,
+        metavar="N",
+        help="keep N generated levels on disk, to time materializing them",
+    )
+    parser.add_argument("--output", default="procgen_benchmark.json", help="JSON file")
+    args = parser.parse_args()
+    output = pathlib.Path(args.output).absolute()
+    os.chdir(consts.GAME_PATH)
+    db.load_tiles()
+    # Off by default, to time the generation itself
+    consts.LEVEL_CACHE_SIZE = args.level_cache
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    shape = tuple(args.shape) if args.shape else None
+    results = benchmark(seeds, args.depth, args.min_floor, args.max_floor, shape)
+    print(f"{'stage':20} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, p in results["stages_ms"].items():
+        values = " ".join(f"{p[k]:8.2f}" for k in ("mean", "p50", "p90", "p99", "max"))
+        print(f"{name:20} {values}")
+    for failure in results["failing"]:
+        print(f"seed {failure['seed']} depth {failure['depth']}: {failure['failures']}")
+    with open(output, "w") as f:
+        json.dump(
+            {"seeds": [seeds.start, seeds.stop], "depth": args.depth, "shape": shape}
+            | results,
+            f,
+            indent=2,
+        )
+    print(f"Results written to {output}")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Measure save and load cost of games that reach increasing depths.
+
+Runs headless: the player is teleported onto each level's downstairs, descends
+and waits a few turns, then the game is saved and loaded again. Results,
+including a size breakdown by component type, are written as JSON.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import pickle
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+import comp
+import consts
+import game_interface
+import keybinds  # must be here to avoid circular import
+import states
+
+import actions
+import db
+import game_logic
+import maps
+import saves
+
+
+def measure(
+    fun: Callable[[], object], setup: Callable[[], object] | None = None
+) -> tuple[float, int]:
+    if setup is not None:
+        setup()
+    start = time.perf_counter()
+    fun()
+    elapsed = time.perf_counter() - start
+    # Run again under tracemalloc, which slows it down too much to time it
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    fun()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def key_name(key: object) -> str:
+    if isinstance(key, tuple) and isinstance(key[0], str):
+        return key[0]
+    if isinstance(key, type):
+        return key.__name__
+    return str(key)
+
+
+def component_sizes(logic: game_logic.GameLogic) -> dict[str, dict[str, int]]:
+    reg = logic.reg
+    chunks = reg[None].components.get(comp.SaveChunks, comp.SaveChunks())
+    state = reg.__getstate__()
+    sizes = {}
+    for key, values in state["_components_by_type"].items():
+        if key == comp.SaveChunks:
+            continue
+        data = saves.dump_chunk(reg, chunks, list(values.values()))
+        sizes[key_name(key)] = {"count": len(values), "bytes": len(data)}
+    for name in ("_tags_by_entity", "_relation_tags_by_entity"):
+        data = saves.dump_chunk(reg, chunks, state[name])
+        sizes[name.strip("_")] = {"count": len(state[name]), "bytes": len(data)}
+    return dict(sorted(sizes.items(), key=lambda kv: -kv[1]["bytes"]))
+
+
+def entity_counts(logic: game_logic.GameLogic) -> dict[str, int]:
+    reg = logic.reg
+    counts = {}
+    for map_entity in reg.Q.all_of(components=[comp.Depth, comp.Tiles], traverse=[]):
+        depth = map_entity.components[comp.Depth]
+        counts[str(depth)] = len(saves.level_entities(map_entity))
+    return dict(sorted(counts.items(), key=lambda kv: int(kv[0])))
+
+
+def descend(logic: game_logic.GameLogic, turns: int):
+    player = logic.player
+    stairs = next(
+        iter(
+            logic.reg.Q.all_of(
+                components=[comp.Position],
+                tags=[comp.Downstairs],
+                relations=[(comp.Map, logic.map)],
+            )
+        )
+    )
+    player.components[comp.Position] = stairs.components[comp.Position]
+    logic.push_action(actions.Descend(player, stairs))
+    for _ in range(turns):
+        # Keep the player alive, only the state it leaves behind matters
+        player.components[comp.HP] = player.components[comp.MaxHP]
+        logic.input_action = actions.WaitAction(player)
+        logic.update()
+
+
+def benchmark(max_depth: int, seed: int, turns: int) -> list[dict]:
+    logic = game_logic.GameLogic()
+    logic.new_world(seed)
+    logic.init_player()
+    logic.next_turn()
+    logic.active = True
+    results = []
+    for depth in range(max_depth + 1):
+        if depth > 0:
+            descend(logic, turns)
+
+        def delete():
+            if comp.Filename in logic.reg[None].components:
+                logic.delete_game(logic.reg[None].components[comp.Filename])
+
+        save_full, save_full_peak = measure(logic.save_game, delete)
+        filename = logic.reg[None].components[comp.Filename]
+        path = game_logic.save_path(filename)
+        file_bytes = os.path.getsize(path)
+        save_delta, save_delta_peak = measure(logic.save_game)
+        journal = saves.journal_path(path)
+        journal_bytes = os.path.getsize(journal) if os.path.exists(journal) else 0
+        load, load_peak = measure(lambda: logic.load_game(filename))
+
+        def load_all():
+            logic.load_game(filename)
+            for i in range(logic.reg[None].components.get(comp.MaxDepth, 0) + 1):
+                maps.get_map(logic.reg, i)
+
+        load_levels, load_levels_peak = measure(load_all)
+        results.append(
+            {
+                "depth": depth,
+                "save_full_s": save_full,
+                "save_full_peak_bytes": save_full_peak,
+                "save_delta_s": save_delta,
+                "save_delta_peak_bytes": save_delta_peak,
+                "load_s": load,
+                "load_peak_bytes": load_peak,
+                "load_all_levels_s": load_levels,
+                "load_all_levels_peak_bytes": load_levels_peak,
+                "file_bytes": file_bytes,
+                "journal_bytes": journal_bytes,
+                "registry_bytes": len(pickle.dumps(logic.reg)),
+                "entities": entity_counts(logic),
+                "components": component_sizes(logic),
+            }
+        )
+        print(
+            f"depth {depth}: save {save_full:.3f}s (delta {save_delta:.3f}s) "
+            f"load {load:.3f}s (all levels {load_levels:.3f}s) {file_bytes} bytes"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depth", type=int, default=10, help="deepest level")
+    parser.add_argument("--seed", type=int, default=1, help="world seed")
+    parser.add_argument("--turns", type=int, default=20, help="turns per level")
+    parser.add_argument("--output", default="save_benchmark.json", help="JSON file")
+    args = parser.parse_args()
+    output = pathlib.Path(args.output).absolute()
+    os.chdir(consts.GAME_PATH)
+    db.load_tiles()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep benchmark saves out of the player's save folder
+        consts.SAVE_PATH = pathlib.Path(tmp)
+        results = benchmark(args.depth, args.seed, args.turns)
+    with open(output, "w") as f:
+        json.dump(
+            {"depth": args.depth, "seed": args.seed, "results": results}, f, indent=2
+        )
+    print(f"Results written to {output}")
@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import io
+import os
+import pathlib
+import pickle
+import struct
+import zipfile
+import zlib
+from typing import Any
+
+import tcod.ecs as ecs
+
+import comp
+import consts
+
+METADATA_CHUNK = "metadata.pickle"
+GLOBAL_CHUNK = "global.pickle"
+MANIFEST_CHUNK = "manifest.pickle"
+# Base file generation, payload size and checksum
+JOURNAL_HEADER = struct.Struct("<III")
+
+# Registry state as returned by ecs.Registry.__getstate__
+State = dict[str, Any]
+# Parts of that state held per entity, besides components which are by type
+ENTITY_STATE_KEYS = (
+    "_tags_by_entity",
+    "_relation_tags_by_entity",
+    "_relation_components_by_entity",
+)
+# Entity names, which the game doesn't use
+IGNORED_STATE_KEYS = frozenset({"_names_by_name"})
+
+
+def level_chunk(depth: int) -> str:
+    return f"level{depth}.pickle"
+
+
+class ChunkPickler(pickle.Pickler):
+    """Pickle entity state, storing anonymous entity uids as stable ids."""
+
+    def __init__(self, file: io.BytesIO, reg: ecs.Registry, chunks: comp.SaveChunks):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.reg = reg
+        self.chunks = chunks
+
+    def persistent_id(self, obj: object) -> object:
+        if obj is self.reg:
+            return "registry"
+        if type(obj) is object:
+            return self.chunks.id_of(obj)
+        return None
+
+
+class ChunkUnpickler(pickle.Unpickler):
+    def __init__(self, file: io.BytesIO, reg: ecs.Registry, chunks: comp.SaveChunks):
+        super().__init__(file)
+        self.reg = reg
+        self.chunks = chunks
+
+    def persistent_load(self, pid: object) -> object:
+        if pid == "registry":
+            return self.reg
+        assert isinstance(pid, int)
+        return self.chunks.object_of(pid)
+
+
+def dump_chunk(reg: ecs.Registry, chunks: comp.SaveChunks, data: object) -> bytes:
+    f = io.BytesIO()
+    ChunkPickler(f, reg, chunks).dump(data)
+    return f.getvalue()
+
+
+def load_chunk(reg: ecs.Registry, chunks: comp.SaveChunks, data: bytes) -> Any:
+    return ChunkUnpickler(io.BytesIO(data), reg, chunks).load()
+
+
+def level_entities(
+    map_entity: ecs.Entity, carried: Carried | None = None
+) -> set[ecs.Entity]:
+    reg = map_entity.registry
+    player = reg[comp.Player]
+    found = set(reg.Q.all_of(relations=[(comp.Map, map_entity)], traverse=[]))
+    found.discard(player)
+    return with_inventories(reg, found | {map_entity}, carried)
+
+
+# Items by the entity whose inventory they are in
+Carried = dict[ecs.Entity, list[ecs.Entity]]
+
+
+def carried_items(reg: ecs.Registry) -> Carried:
+    carried: Carried = {}
+    for e in reg.Q.all_of(relations=[(comp.Inventory, ...)], traverse=[]):
+        carried.setdefault(e.relation_tag[comp.Inventory], []).append(e)
+    return carried
+
+
+def with_inventories(
+    reg: ecs.Registry, holders: set[ecs.Entity], carried: Carried | None = None
+) -> set[ecs.Entity]:
+    if carried is None:
+        carried = carried_items(reg)
+    found: set[ecs.Entity] = set()
+    new = holders
+    # Follow inventories, so whatever creatures and chests carry stays with them
+    while new:
+        found |= new
+        new = {e for holder in new for e in carried.get(holder, ())} - found
+    return found
+
+
+def check_state(state: State):
+    """Fail on registry state this module doesn't know, rather than drop it."""
+    known = {"_components_by_type", *ENTITY_STATE_KEYS} | IGNORED_STATE_KEYS
+    unknown = state.keys() - known
+    if unknown:
+        raise ValueError(f"Unknown registry state {sorted(unknown)}, check tcod-ecs")
+    if state.get("_names_by_name"):
+        raise ValueError("Named entities can't be saved in chunks")
+
+
+def split_state(state: State, owner: dict[ecs.Entity, int]) -> dict[int | None, State]:
+    check_state(state)
+    parts: dict[int | None, State] = {}
+
+    def part(entity: ecs.Entity) -> State:
+        key = owner.get(entity)
+        if key not in parts:
+            parts[key] = {"_components_by_type": {}}
+            parts[key] |= {name: {} for name in ENTITY_STATE_KEYS}
+        return parts[key]
+
+    for key, values in state["_components_by_type"].items():
+        for entity, value in values.items():
+            part(entity)["_components_by_type"].setdefault(key, {})[entity] = value
+    for name in ENTITY_STATE_KEYS:
+        for entity, value in state[name].items():
+            part(entity)[name][entity] = value
+    return parts
+
+
+def merge_state(state: State):
+    check_state(state)
+    for key, values in state["_components_by_type"].items():
+        for entity, value in values.items():
+            entity.components[key] = value
+    for entity, tags in state["_tags_by_entity"].items():
+        entity.tags |= tags
+    for entity, relation_tags in state["_relation_tags_by_entity"].items():
+        for tag, targets in relation_tags.items():
+            for target in targets:
+                entity.relation_tags_many[tag].add(target)
+    for entity, relations in state["_relation_components_by_entity"].items():
+        for key, targets in relations.items():
+            for target, value in targets.items():
+                entity.relation_components[key][target] = value
+
+
+def snapshot(reg: ecs.Registry, path: str) -> dict[str, bytes]:
+    """Pickle the global chunk and the levels changed since they were last saved."""
+    chunks = reg[None].components.setdefault(comp.SaveChunks, comp.SaveChunks())
+    if chunks.path != path or not os.path.exists(path):
+        # Nothing on disk to build on, levels never loaded are generated anew
+        chunks.unloaded.clear()
+        chunks.saved.clear()
+    chunks.path = path
+    chunks.dirty.add(reg[comp.Player].components[comp.Position].depth)
+    owner: dict[ecs.Entity, int] = {}
+    carried = carried_items(reg)
+    for map_entity in reg.Q.all_of(components=[comp.Depth, comp.Tiles], traverse=[]):
+        depth = map_entity.components[comp.Depth]
+        for e in level_entities(map_entity, carried):
+            owner[e] = depth
+    state = reg.__getstate__()
+    state["_components_by_type"].pop(comp.SaveChunks, None)
+    state["_components_by_type"].pop(comp.SpriteChanges, None)
+    parts = split_state(state, owner)
+    data: dict[str, bytes] = {}
+    for depth, part in parts.items():
+        if depth is not None and (depth in chunks.dirty or depth not in chunks.saved):
+            data[level_chunk(depth)] = dump_chunk(reg, chunks, part)
+    if None in parts:
+        data[GLOBAL_CHUNK] = dump_chunk(reg, chunks, parts[None])
+    chunks.saved |= parts.keys() - {None}
+    chunks.dirty.clear()
+    # Written last, as pickling the chunks may hand out new ids
+    manifest = {"levels": sorted(chunks.saved), "next_id": chunks.next_id}
+    data[MANIFEST_CHUNK] = pickle.dumps(manifest, pickle.HIGHEST_PROTOCOL)
+    return data
+
+
+def journal_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".journal"
+
+
+def scan_journal(path: str) -> tuple[list[tuple[int, bytes]], int]:
+    """Generation and payload of the whole journal records, and where they end."""
+    records: list[tuple[int, bytes]] = []
+    end = 0
+    try:
+        f = open(journal_path(path), "rb")
+    except FileNotFoundError:
+        return records, end
+    with f:
+        while header := f.read(JOURNAL_HEADER.size):
+            if len(header) < JOURNAL_HEADER.size:
+                break
+            record_generation, size, crc = JOURNAL_HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                break  # Torn write, everything before it is still good
+            records.append((record_generation, payload))
+            end = f.tell()
+    return records, end
+
+
+def read_journal(path: str, generation: int) -> dict[str, bytes]:
+    """Return the newest journalled chunks written on top of this base file."""
+    data: dict[str, bytes] = {}
+    for record_generation, payload in scan_journal(path)[0]:
+        if record_generation == generation:
+            data |= pickle.loads(zlib.decompress(payload))
+    return data
+
+
+@functools.lru_cache(maxsize=1)
+def cached_journal(
+    path: str, generation: int, size: int, mtime: int
+) -> dict[str, bytes]:
+    # Keyed by the size and time of the journal, any write makes a new entry
+    return read_journal(path, generation)
+
+
+def journal_chunks(path: str, generation: int) -> dict[str, bytes]:
+    try:
+        stat = os.stat(journal_path(path))
+    except FileNotFoundError:
+        return {}
+    return cached_journal(path, generation, stat.st_size, stat.st_mtime_ns)
+
+
+def write_save(path: str, data: dict[str, bytes]):
+    """Append the chunks to the journal, or fold everything into a new base file."""
+    generation = 0
+    base: zipfile.ZipFile | None = None
+    if os.path.exists(path):
+        base = zipfile.ZipFile(path)
+        generation = pickle.loads(base.read(MANIFEST_CHUNK)).get("generation", 0)
+    journal = journal_path(path)
+    journal_size = os.path.getsize(journal) if os.path.exists(journal) else 0
+    if base is not None and journal_size < consts.SAVE_JOURNAL_LIMIT:
+        base.close()
+        payload = zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL), 1)
+        header = JOURNAL_HEADER.pack(generation, len(payload), zlib.crc32(payload))
+        # Cut off a torn record, records after it could never be read
+        end = scan_journal(path)[1]
+        with open(journal, "ab") as f:
+            if end < journal_size:
+                f.truncate(end)
+            f.write(header + payload)
+            f.flush()
+            os.fsync(f.fileno())
+        return
+    # Compaction
+    chunks: dict[str, bytes] = {}
+    if base is not None:
+        with base:
+            chunks = {name: base.read(name) for name in base.namelist()}
+        chunks |= read_journal(path, generation)
+    chunks |= data
+    manifest = pickle.loads(chunks[MANIFEST_CHUNK])
+    manifest["generation"] = generation + 1
+    chunks[MANIFEST_CHUNK] = pickle.dumps(manifest, pickle.HIGHEST_PROTOCOL)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as z:
+            for name, chunk in chunks.items():
+                z.writestr(name, chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # Records left behind by a crash here belong to the old generation
+    if os.path.exists(journal):
+        os.remove(journal)
+
+
+def read_chunk(path: str, name: str) -> bytes:
+    with zipfile.ZipFile(path) as z:
+        manifest = pickle.loads(z.read(MANIFEST_CHUNK))
+        journal = journal_chunks(path, manifest.get("generation", 0))
+        if name in journal:
+            return journal[name]
+        return z.read(name)
+
+
+def read_metadata(path: str) -> dict:
+    return pickle.loads(read_chunk(path, METADATA_CHUNK))
+
+
+def load_registry(path: str) -> ecs.Registry:
+    reg = ecs.Registry()
+    manifest = pickle.loads(read_chunk(path, MANIFEST_CHUNK))
+    chunks = comp.SaveChunks(path, next_id=manifest["next_id"])
+    chunks.unloaded = set(manifest["levels"])
+    chunks.saved = set(manifest["levels"])
+    merge_state(load_chunk(reg, chunks, read_chunk(path, GLOBAL_CHUNK)))
+    reg[None].components[comp.SaveChunks] = chunks
+    load_level(reg, reg[comp.Player].components[comp.Position].depth)
+    return reg
+
+
+def load_level(reg: ecs.Registry, depth: int):
+    chunks = reg[None].components.get(comp.SaveChunks)
+    if chunks is None or depth not in chunks.unloaded:
+        return
+    assert chunks.path is not None
+    state = load_chunk(reg, chunks, read_chunk(chunks.path, level_chunk(depth)))
+    chunks.unloaded.discard(depth)
+    merge_state(state)
+    chunks.dirty.discard(depth)
+
+
+@functools.cache
+def code_hash() -> str:
+    """Hash of the code and data levels are generated from."""
+    h = hashlib.sha256()
+    paths = sorted(consts.GAME_PATH.glob("*.py"))
+    paths += sorted((consts.GAME_PATH / "data").rglob("*.yml"))
+    for path in paths:
+        h.update(str(path.relative_to(consts.GAME_PATH)).encode())
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def level_cache_path(reg: ecs.Registry, inputs: tuple) -> pathlib.Path:
+    """Cache file of a level generated from the given procgen inputs."""
+    world_seed = reg[None].components.get(comp.Seed)
+    depth = inputs[1]
+    key = hashlib.sha256(f"{code_hash()} {inputs!r}".encode()).hexdigest()[:16]
+    return consts.LEVEL_CACHE_PATH / f"{world_seed}_{depth}_{key}.level"
+
+
+def dump_entities(reg: ecs.Registry, group: set[ecs.Entity]) -> bytes | None:
+    """Compressed state of a group of entities, None if it refers to others."""
+    state = split_state(reg.__getstate__(), {e: 0 for e in group})[0]
+    # Ids local to the group, new uids are handed out when it is loaded
+    ids = comp.SaveChunks()
+    data = zlib.compress(dump_chunk(reg, ids, state), 1)
+    if not set(ids.objects.values()) <= {e.uid for e in group}:
+        return None
+    return data
+
+
+def cache_level(map_entity: ecs.Entity, path: pathlib.Path):
+    """Store a freshly generated level, so it can be materialized without procgen."""
+    if consts.LEVEL_CACHE_SIZE < 1:
+        return
+    data = dump_entities(map_entity.registry, level_entities(map_entity))
+    if data is None:
+        return  # Refers to anonymous entities of another level, can't be shared
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        cached = sorted(path.parent.glob("*.level"), key=os.path.getmtime)
+        for old in cached[: -consts.LEVEL_CACHE_SIZE]:
+            old.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Could not cache level: {e}")
+
+
+def load_cached_level(map_entity: ecs.Entity, path: pathlib.Path) -> bool:
+    if consts.LEVEL_CACHE_SIZE < 1:
+        return False
+    try:
+        data = zlib.decompress(path.read_bytes())
+        state = load_chunk(map_entity.registry, comp.SaveChunks(), data)
+        os.utime(path)  # Least recently used files are pruned first
+    except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+        return False
+    merge_state(state)
+    return True
@@ -1,3 +1,4 @@
+import functools
 import os
 
 import pygame as pg
@@ -62,8 +63,10 @@ class InGameState(game_interface.State):
         )
         self.log = ui_elements.MessageLog(self.ui_group, self.logic, font)
         self.minimap = ui_elements.Minimap(self.ui_group, self.logic)
+        self.save_indicator = ui_elements.SaveIndicator(self.ui_group, font, self.logic)
         self.map_renderer = map_renderer.MapRenderer(self.interface)
         self.map_renderer.center = self.logic.player.components[comp.Position].xy
+        self.dirty_rects = gui_elements.DirtyRects(self.interface.screen.size)
         self.preview = ui_elements.PathPreview(self.map_renderer)
         self.hud = ui_elements.StatsHUD(
             self.ui_group,
@@ -81,8 +84,10 @@ class InGameState(game_interface.State):
                 "FPS": lambda: int(self.interface.clock.get_fps()),
             },
         )
+        self.stairs_autosave = False
         self.register_callbacks()
         self.update_bgm()
+        self.logic.visual_metadata = self.visual_metadata
 
     def handle_event(self, event: pg.Event):
         action: actions.Action
@@ -100,6 +105,8 @@ class InGameState(game_interface.State):
             elif event.key == pg.K_ESCAPE and self.logic.continuous_action is not None:
                 self.logic.input_action = None
                 self.logic.continuous_action = None
+            elif event.key == pg.K_F3:
+                self.dirty_rects.overlay = not self.dirty_rects.overlay
             elif event.mod & pg.KMOD_SHIFT and event.key in keybinds.ACTION_SHIFT_KEYS:
                 self.logic.continuous_action = None
                 action_class = keybinds.ACTION_SHIFT_KEYS[event.key]
@@ -162,6 +169,12 @@ class InGameState(game_interface.State):
         if not entities.is_alive(self.logic.player):
             self.interface.push(GameOverState(self))
             return
+        # The thumbnail is drawn by the renderer, wait until it shows this map
+        view = self.map_renderer.view
+        if view is not None and view[1] is self.logic.map:
+            if self.stairs_autosave or self.logic.autosave_due():
+                self.stairs_autosave = False
+                self.logic.autosave()
         if (
             isinstance(self.logic.last_action, actions.ActorAction)
             and self.logic.last_action.actor == self.logic.player
@@ -182,6 +195,11 @@ class InGameState(game_interface.State):
     def stairs_callback(self, actions: actions.Descend | actions.Ascend):
         self.update_bgm()
 
+    def autosave_callback(self, action: actions.Descend | actions.Ascend):
+        if action.actor == self.logic.player:
+            # Once the new level is rendered, for the thumbnail to show it
+            self.stairs_autosave = True
+
     def container_callback(self, action: actions.OpenContainer):
         if action.target is not None:
             self.interface.push(ContainerState(self, action.target))
@@ -207,17 +225,46 @@ class InGameState(game_interface.State):
         for action_class in audio.ACTION_SFX.keys():
             self.logic.register_callback(action_class, self.sfx_callback)
         self.logic.register_callback(actions.Read, self.read_callback)
+        self.logic.register_callback(actions.Descend, self.autosave_callback)
+        self.logic.register_callback(actions.Ascend, self.autosave_callback)
 
-    def render(self, screen: pg.Surface):
+    def render(self, screen: pg.Surface) -> list[pg.Rect] | None:
         self.log.rect.bottomleft = (8, screen.height - 8)
         self.map_renderer.update()
         self.ui_group.update()
-        screen.fill(consts.BACKGROUND_COLOR)
-        self.map_renderer.draw(screen)
-        self.interface.logic.visual_metadata["screenshot"] = pg.surfarray.array2d(
-            screen
+        sprites = self.map_renderer.sprites() + self.ui_group.sprites()
+        # States drawn over this one expect the whole screen to be redrawn
+        full = (
+            not consts.DIRTY_RECTS
+            or self.interface.state is not self
+            or self.interface.rendered_state is not self
+            or self.map_renderer.moved
         )
-        self.ui_group.draw(screen)
+        redrawn = self.map_renderer.tile_layer.redrawn
+        if consts.LIGHTMAP:
+            redrawn = redrawn + self.map_renderer.lightmap.redrawn
+        rects = self.dirty_rects.collect(sprites, redrawn, full)
+        # Lit sprites are drawn with the background, under the lightmap
+        unlit = self.map_renderer.unlit_sprites() + self.ui_group.sprites()
+        self.dirty_rects.draw(screen, rects, self.draw_background, unlit)
+        if self.dirty_rects.overlay:
+            rects.append(self.dirty_rects.draw_overlay(screen, rects))
+        if full:
+            return None
+        return rects
+
+    def draw_background(self, screen: pg.Surface):
+        screen.fill(consts.BACKGROUND_COLOR)
+        self.map_renderer.draw_lit(screen)
+
+    def visual_metadata(self) -> dict:
+        # Map view without the HUD, captured only when the game is saved
+        surface = pg.Surface(self.interface.screen.size)
+        surface.fill(consts.BACKGROUND_COLOR)
+        self.map_renderer.draw(surface)
+        thumbnail = pg.transform.scale(surface, consts.THUMBNAIL_SHAPE)
+        # Encoded by the save thread
+        return {"thumbnail": functools.partial(assets.encode_png, thumbnail)}
 
 
 class GameOverState(game_interface.State):
@@ -291,10 +338,14 @@ class MapState(game_interface.State):
             self.ui_group, [f"Level {i}" for i in range(max_depth + 1)], 16
         )
         self.menu.rect.x = consts.TILE_SIZE // 2
-        scale = min(
-            (consts.SCREEN_SHAPE[0] - consts.TILE_SIZE - self.menu.width)
-            // consts.MAP_SHAPE[0],
-            (consts.SCREEN_SHAPE[1] - consts.TILE_SIZE) // consts.MAP_SHAPE[1],
+        shape = self.logic.map.components[comp.Tiles].shape
+        scale = max(
+            1,
+            min(
+                (consts.SCREEN_SHAPE[0] - consts.TILE_SIZE - self.menu.width)
+                // shape[0],
+                (consts.SCREEN_SHAPE[1] - consts.TILE_SIZE) // shape[1],
+            ),
         )
         self.map = ui_elements.Minimap(
             self.ui_group,
@@ -730,21 +781,41 @@ class LoadGameState(game_interface.State):
     def __init__(self, parent: game_interface.State):
         super().__init__(parent)
         self.ui_group: pg.sprite.Group = pg.sprite.Group()
-        self.files = self.interface.logic.list_savefiles()
+        self.read_index()
         text, icons = self.item_lists()
         self.menu = gui_elements.Menu(
             self.ui_group, text, 6, 224, icons, lines_per_item=4, title="Load Game"
         )
         self.filename = ""
         self.background = pg.Surface(consts.SCREEN_SHAPE)
+        self.thumbnails: dict[str, pg.Surface] = {}
         self.load_btn = gui_elements.Button(self.ui_group, "Load", 224 // 3)
         self.delete_btn = gui_elements.Button(self.ui_group, "Delete", 224 // 3)
 
+    def read_index(self):
+        self.index = self.interface.logic.read_save_index()
+        self.files = sorted(
+            self.index.keys(),
+            key=lambda f: self.index[f]["last_played"],
+            reverse=True,
+        )
+
+    def thumbnail(self, filename: str) -> pg.Surface | None:
+        if filename in self.thumbnails:
+            return self.thumbnails[filename]
+        metadata = self.index[filename]
+        if "thumbnail" not in metadata:
+            return None
+        surf = assets.decode_png(metadata["thumbnail"])
+        surf = pg.transform.scale(surf, consts.SCREEN_SHAPE)
+        self.thumbnails[filename] = surf
+        return surf
+
     def item_lists(self) -> tuple[list[str], list[pg.Surface | None]]:
         text_list: list[str] = []
         surf_list: list[pg.Surface | None] = []
         for fn in self.files:
-            metadata = self.interface.logic.file_metadata(fn)
+            metadata = self.index[fn]
             last_played = metadata["last_played"]
             depth = metadata["depth"]
             level = metadata["player_level"]
@@ -777,10 +848,11 @@ class LoadGameState(game_interface.State):
         self.delete_btn.rect.topleft = self.load_btn.rect.topright
         filename = self.files[self.menu.selected_index]
         if filename != self.filename:
-            self.metadata = self.interface.logic.file_metadata(filename)
+            self.metadata = self.index[filename]
             self.filename = filename
-            if "screenshot" in self.metadata:
-                pg.surfarray.blit_array(self.background, self.metadata["screenshot"])
+            thumbnail = self.thumbnail(filename)
+            if thumbnail is not None:
+                self.background.blit(thumbnail, (0, 0))
             else:
                 self.background.fill(consts.BACKGROUND_COLOR)
         self.ui_group.update()
@@ -816,8 +888,8 @@ class LoadGameState(game_interface.State):
     def delete_file(self):
         filename = self.files[self.menu.selected_index]
         self.interface.logic.delete_game(filename)
-
-        self.files = self.interface.logic.list_savefiles()
+        self.thumbnails.pop(filename, None)
+        self.read_index()
         text, icons = self.item_lists()
         if len(self.files) < 1:
             return self.interface.pop()
@@ -0,0 +1,21 @@
+import os
+import pathlib
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
+import comp
+import consts
+import game_interface
+import keybinds  # must be here to avoid circular import
+import states
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def game_path(monkeypatch: pytest.MonkeyPatch):
+    # Data files are loaded relative to the game directory
+    monkeypatch.chdir(consts.GAME_PATH)
@@ -0,0 +1,33 @@
+import pygame as pg
+import pytest
+
+import assets
+import consts
+
+
+@pytest.fixture(autouse=True)
+def display():
+    pg.display.set_mode((1, 1))
+    assets.sprite_cache.clear()
+    assets.sprite_bytes = 0
+    yield
+    assets.sprite_cache.clear()
+    assets.sprite_bytes = 0
+
+
+def test_sprite_variants_are_shared():
+    a = assets.sprite("Characters/Rodent0", (0, 1), 1, 90, (128, 128, 128), True)
+    b = assets.sprite("Characters/Rodent0", (0, 1), 1, 90, (128, 128, 128), True)
+    assert a is b
+
+
+def test_sprite_cache_keeps_to_its_byte_limit(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(consts, "SPRITE_CACHE_BYTES", 64 * 1024)
+    for angle in range(0, 360, 5):
+        for flip in (False, True):
+            assets.sprite("Characters/Rodent0", (0, 1), 0, angle, None, flip)
+            assert assets.sprite_bytes <= consts.SPRITE_CACHE_BYTES
+    assert assets.sprite_bytes == sum(
+        map(assets.surface_bytes, assets.sprite_cache.values())
+    )
+    assert len(assets.sprite_cache) < 2 * 71
@@ -0,0 +1,30 @@
+import tcod.ecs as ecs
+
+import comp
+import entities
+import items
+
+
+def test_blueprint_follows_item_template_changes():
+    reg = ecs.Registry()
+    arrows = reg[("items", "Arrow")]
+    arrows.components[comp.EquipSlot] = comp.EquipSlot.Quiver
+    arrows.components[comp.SpawnCount] = "1d4"
+    archer = reg[("creatures", "Archer")]
+    archer.components[comp.TempEquipment] = ["Arrow"]
+    assert entities.creature_blueprint(archer).equipment == ((arrows, "1d4"),)
+    arrows.components[comp.SpawnCount] = "2d6"
+    assert entities.creature_blueprint(archer).equipment == ((arrows, "2d6"),)
+    assert not entities.creature_blueprint(archer).lit
+    arrows.components[comp.LightRadius] = 3
+    assert entities.creature_blueprint(archer).lit
+
+
+def test_spawn_item_without_count_spawns_nothing():
+    reg = ecs.Registry()
+    map_entity = reg[(comp.Map, 0)]
+    map_entity.components[comp.Depth] = 0
+    kind = reg[("items", "Gold")]
+    assert items.spawn_item(map_entity, (1, 1), kind, 0) is None
+    assert not list(reg.Q.all_of(components=[comp.Position]))
+    assert items.spawn_item(map_entity, (1, 1), kind, 2) is not None
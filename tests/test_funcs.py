@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import scipy.signal
+
+import funcs
+
+
+def sample_alias(prob, alias, rng: np.random.RandomState, n: int):
+    u = rng.random(n) * len(prob)
+    i = u.astype(np.intp)
+    return np.where(u - i >= prob[i], alias[i], i)
+
+
+@pytest.mark.parametrize(
+    "weights",
+    [[1.0], [1.0, 1.0, 2.0], [5.0, 0.0, 1.0, 0.5], [0.01, 10.0, 3.0, 3.0, 0.2]],
+)
+def test_alias_table_probabilities(weights: list[float]):
+    prob, alias = funcs.alias_table(weights)
+    expected = np.asarray(weights) / np.sum(weights)
+    # Exact: each bucket gives 1/n of its mass to itself, the rest to its alias
+    n = len(weights)
+    exact = np.zeros(n)
+    np.add.at(exact, np.arange(n), prob / n)
+    np.add.at(exact, alias, (1 - prob) / n)
+    np.testing.assert_allclose(exact, expected, atol=1e-12)
+    picks = sample_alias(prob, alias, np.random.RandomState(1), 200_000)
+    freq = np.bincount(picks, minlength=n) / len(picks)
+    np.testing.assert_allclose(freq, expected, atol=0.005)
+
+
+@pytest.mark.parametrize("weights", [[], [0.0], [0.0, 0.0]])
+def test_alias_table_without_weight(weights: list[float]):
+    with pytest.raises(ValueError):
+        funcs.alias_table(weights)
+
+
+@pytest.mark.parametrize("radius", [0, 1, 3, 6])
+def test_disk_sampler_keeps_minimum_distance(radius: int):
+    rng = np.random.RandomState(radius)
+    available = rng.random((40, 30)) < 0.6
+    sampler = funcs.DiskSampler(available, radius)
+    picks = []
+    while len(sampler) > 0:
+        xy = sampler[rng.randint(0, len(sampler))]
+        assert available[xy]
+        picks.append(xy)
+        sampler.exclude(xy)
+    points = np.array(picks)
+    d2 = ((points[:, None] - points[None]) ** 2).sum(-1)
+    np.fill_diagonal(d2, radius**2 + 1)
+    assert (d2 > radius**2).all()
+    # Exhausted, every available cell is within radius of a pick
+    cells = np.argwhere(available)
+    nearest = ((cells[:, None] - points[None]) ** 2).sum(-1).min(1)
+    assert (nearest <= radius**2).all()
+
+
+def convolved_bitmask(array, diagonals=False):
+    """funcs.bitmask as it was, one convolution per distinct value."""
+    if diagonals:
+        mask = np.array([[32, 64, 128], [16, 0, 8], [1, 2, 4]], dtype=np.int16).T
+    else:
+        mask = np.array([[0, 8, 0], [4, 0, 2], [0, 1, 0]], dtype=np.int8).T
+    grid = np.zeros(array.shape, dtype=mask.dtype)
+    for k in np.unique(array):
+        bmk = scipy.signal.convolve((array == k), mask, mode="same", method="direct")
+        grid[array == k] = bmk[array == k]
+    return grid
+
+
+@pytest.mark.parametrize("diagonals", [False, True])
+@pytest.mark.parametrize("values", [2, 5])
+def test_bitmask_matches_convolution(diagonals: bool, values: int):
+    array = np.random.RandomState(values).randint(0, values, (37, 23))
+    expected = convolved_bitmask(array, diagonals)
+    assert np.array_equal(funcs.bitmask(array, diagonals), expected)
@@ -0,0 +1,104 @@
+import os
+import pathlib
+import pickle
+
+import pytest
+
+import comp
+import consts
+import db
+import game_logic
+import maps
+import saves
+
+
+@pytest.fixture
+def logic(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path):
+    monkeypatch.setattr(consts, "SAVE_PATH", tmp_path)
+    saves.cached_journal.cache_clear()
+    db.load_tiles()
+    logic = game_logic.GameLogic()
+    logic.new_game(3)
+    logic.next_turn()
+    return logic
+
+
+def level_state(logic: game_logic.GameLogic, depth: int) -> list:
+    map_entity = maps.get_map(logic.reg, depth)
+    query = logic.reg.Q.all_of(
+        components=[comp.Position], relations=[(comp.Map, map_entity)]
+    )
+    return sorted(
+        (e.components[comp.Position].xy, e.components.get(comp.Name, ""))
+        for e in query
+    )
+
+
+def player_state(logic: game_logic.GameLogic) -> tuple:
+    player = logic.player
+    return (
+        player.components[comp.Position],
+        player.components[comp.HP],
+        logic.turn_count,
+    )
+
+
+def test_save_load_roundtrip(logic: game_logic.GameLogic):
+    maps.get_map(logic.reg, 1)
+    logic.save_game()
+    filename = logic.reg[None].components[comp.Filename]
+    path = game_logic.save_path(filename)
+    # A second save goes to the journal
+    logic.player.components[comp.HP] -= 1
+    logic.next_turn()
+    logic.save_game()
+    assert os.path.exists(saves.journal_path(path))
+    expected = player_state(logic), level_state(logic, 0), level_state(logic, 1)
+    logic.load_game(filename)
+    assert player_state(logic) == expected[0]
+    assert level_state(logic, 0) == expected[1]
+    assert level_state(logic, 1) == expected[2]
+
+
+def test_load_after_torn_journal_record(logic: game_logic.GameLogic):
+    logic.save_game()
+    filename = logic.reg[None].components[comp.Filename]
+    path = game_logic.save_path(filename)
+    logic.player.components[comp.HP] -= 1
+    logic.save_game()
+    expected = player_state(logic)
+    assert os.path.exists(saves.journal_path(path))
+    # A save cut short while appending its record
+    with open(saves.journal_path(path), "ab") as f:
+        f.write(saves.JOURNAL_HEADER.pack(0, 1000, 0) + b"torn")
+    logic.load_game(filename)
+    assert player_state(logic) == expected
+    logic.player.components[comp.HP] -= 1
+    logic.save_game()
+    expected = player_state(logic)
+    logic.load_game(filename)
+    assert player_state(logic) == expected
+
+
+def test_old_single_pickle_save_is_migrated(logic: game_logic.GameLogic):
+    logic.player.components[comp.HP] -= 1
+    expected = player_state(logic), level_state(logic, 0)
+    old_path = consts.SAVE_PATH / "game1.pickle"
+    with open(old_path, "wb") as f:
+        pickle.dump(logic.metadata(), f)
+        pickle.dump(logic.reg, f)
+    assert logic.list_savefiles() == ["game1"]
+    assert not old_path.exists()
+    logic.load_game("game1")
+    assert player_state(logic) == expected[0]
+    assert level_state(logic, 0) == expected[1]
+
+
+def test_unreadable_old_save_is_reported(
+    logic: game_logic.GameLogic, capsys: pytest.CaptureFixture
+):
+    old_path = consts.SAVE_PATH / "game1.pickle"
+    old_path.write_bytes(b"not a save")
+    assert logic.list_savefiles() == []
+    assert "Incompatible save" in capsys.readouterr().out
+    assert old_path.exists()
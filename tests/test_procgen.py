@@ -0,0 +1,168 @@
+import pathlib
+
+import numpy as np
+import pytest
+import scipy.ndimage
+import tcod.ecs as ecs
+
+import comp
+import consts
+import db
+import funcs
+import game_logic
+import maps
+import procgen
+
+
+def test_spawn_table_skips_kinds_without_weight():
+    reg = ecs.Registry()
+    for name, weight in [("rat", 0.0), ("bat", 2.0)]:
+        kind = reg[("creatures", name)]
+        kind.tags.add("creatures")
+        kind.components[comp.SpawnWeight] = weight
+    table = procgen.compile_spawn_table(reg, 1, ["creatures"])
+    assert table.kinds == (reg[("creatures", "bat")],)
+    assert table.sample(np.random.RandomState(1)) == reg[("creatures", "bat")]
+
+
+def test_empty_spawn_table_samples_nothing():
+    reg = ecs.Registry()
+    kind = reg[("creatures", "rat")]
+    kind.tags.add("creatures")
+    kind.components[comp.SpawnWeight] = 0.0
+    table = procgen.compile_spawn_table(reg, 1, ["creatures"])
+    assert table.kinds == ()
+    assert table.sample(np.random.RandomState(1)) is None
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_corridors_connect_every_area(seed: int):
+    rng = np.random.RandomState(seed)
+    condition = np.full((80, 60), False)
+    condition[1:-1, 1:-1] = True
+    rooms = procgen.random_rooms(condition, rng, max_rooms=12)
+    areas = procgen.label_areas(rooms)
+    assert len(areas) > 2
+    corridors = procgen.delaunay_corridors(rooms, areas, rng, 10, 0.3)
+    assert not (corridors & rooms).any()
+    assert scipy.ndimage.label(rooms | corridors)[1] == 1
+
+
+def test_corridor_too_long_is_retried_as_delaunay_edge(monkeypatch: pytest.MonkeyPatch):
+    rng = np.random.RandomState(5)
+    condition = np.full((80, 60), False)
+    condition[1:-1, 1:-1] = True
+    rooms = procgen.random_rooms(condition, rng, max_rooms=12)
+    areas = procgen.label_areas(rooms)
+    route = procgen.CorridorRouter.route
+    routed = []
+
+    def failing_route(self, dijkstra, area, max_size=0):
+        path = route(self, dijkstra, area, max_size)
+        routed.append((int(np.argmin(dijkstra)), int(np.argmax(area))))
+        if len(routed) == 1:
+            path = np.full(path.shape, True)  # Longer than any max_size
+        return path
+
+    monkeypatch.setattr(procgen.CorridorRouter, "route", failing_route)
+    procgen.delaunay_corridors(rooms, areas, rng, 10, 1.0, max_size=1000)
+    assert routed.count(routed[0]) == 2
+
+
+def new_world(seed: int) -> game_logic.GameLogic:
+    db.load_tiles()
+    logic = game_logic.GameLogic()
+    logic.new_game(seed)
+    return logic
+
+
+def level_state(map_entity: ecs.Entity) -> tuple:
+    query = map_entity.registry.Q.all_of(
+        components=[comp.Position], relations=[(comp.Map, map_entity)]
+    )
+    entities = sorted(
+        (e.components[comp.Position].xy, e.components.get(comp.Name, ""))
+        for e in query
+    )
+    return map_entity.components[comp.Tiles].tolist(), entities
+
+
+@pytest.mark.parametrize("seed", [2, 9])
+def test_pregenerated_level_equals_generated_level(seed: int):
+    logic = new_world(seed)
+    try:
+        procgen.pregenerate(logic.map)
+        next_map = logic.reg[(comp.Map, 1)]
+        assert next_map in procgen._pending
+        procgen._pending[next_map][1].result(timeout=60)
+        pregenerated = level_state(maps.get_map(logic.reg, 1))
+        assert next_map not in procgen._pending
+    finally:
+        procgen.shutdown_pregeneration()
+    generated = level_state(maps.get_map(new_world(seed).reg, 1))
+    assert pregenerated == generated
+
+
+def test_cached_level_equals_generated_level(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+):
+    def cached_state(map_entity: ecs.Entity) -> tuple:
+        # Respawns go on drawing from the level's random state
+        seed = map_entity.components[np.random.RandomState]
+        return level_state(map_entity), seed.randint(0, 2**31, 8).tolist()
+
+    generated = cached_state(maps.get_map(new_world(4).reg, 1))
+    monkeypatch.setattr(consts, "LEVEL_CACHE_PATH", tmp_path)
+    monkeypatch.setattr(consts, "LEVEL_CACHE_SIZE", 8)
+    maps.get_map(new_world(4).reg, 1)
+    assert len(list(tmp_path.glob("*.level"))) == 2
+
+    def no_layout(*args):
+        raise AssertionError("level not taken from the cache")
+
+    monkeypatch.setattr(procgen, "generate_layout", no_layout)
+    assert cached_state(maps.get_map(new_world(4).reg, 1)) == generated
+
+
+def named_variants_autotiled(grid):
+    """procgen.update_bitmasks as it was, looking variants up by name."""
+    bm = funcs.bitmask(grid)
+    for tile_name, tile_id in db.tile_id.items():
+        if tile_name[-1] in "1234567890":
+            continue
+        for j in range(16):
+            if f"{tile_name}{j}" in db.tile_names:
+                grid[(grid == tile_id) & (bm == j)] = db.tile_id[f"{tile_name}{j}"]
+    return grid
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_autotile_table_matches_named_variants(seed: int):
+    db.load_tiles()
+    bases = [i for i, name in enumerate(db.tile_names) if not name[-1].isdigit()]
+    grid = np.random.RandomState(seed).choice(bases, (40, 30)).astype(np.int8)
+    expected = named_variants_autotiled(grid.copy())
+    assert np.array_equal(procgen.update_bitmasks(grid), expected)
+    # Autotiled grids autotile to themselves
+    assert np.array_equal(procgen.update_bitmasks(expected), expected)
+
+
+def test_room_graph_of_two_rooms_and_a_corridor():
+    rooms = np.full((13, 7), False)
+    rooms[1:4, 1:5] = True
+    rooms[9:12, 1:6] = True
+    corridor = np.full((13, 7), False)
+    corridor[4:9, 2] = True
+    walkable = rooms | corridor
+    doors = procgen.door_cells(walkable, corridor)
+    graph = procgen.room_graph({"room": rooms, "corridor": corridor}, walkable, doors)
+    assert graph.kinds == ["room", "room", "corridor"]
+    assert np.array_equal(graph.area == 0, rooms & (np.arange(13) < 4)[:, None])
+    assert np.array_equal(graph.area == 1, rooms & (np.arange(13) > 8)[:, None])
+    assert np.array_equal(graph.area == 2, corridor)
+    assert np.all(graph.area[~walkable] == -1)
+    assert graph.adjacency == [[2], [2], [0, 1]]
+    assert graph.doors == {(4, 2): (0, 2), (8, 2): (2, 1)}
+    assert [graph.area_at(xy) for xy in graph.centroids] == [0, 1, 2]
+    assert graph.neighbors((10, 5)) == [2]
+    assert graph.neighbors((0, 0)) == []
@@ -0,0 +1,128 @@
+import pathlib
+
+import numpy as np
+import pygame as pg
+import pytest
+
+import actions
+import comp
+import consts
+import db
+import game_interface
+import states
+import ui_elements
+
+
+@pytest.fixture(autouse=True)
+def save_path(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path):
+    # Playing autosaves, and levels are cached on the way
+    monkeypatch.setattr(consts, "SAVE_PATH", tmp_path)
+    monkeypatch.setattr(consts, "LEVEL_CACHE_PATH", tmp_path / "levels")
+
+
+@pytest.mark.parametrize("seed", [7, 11])
+def test_dirty_rects_match_full_redraw(seed: int):
+    iface = game_interface.GameInterface()
+    logic = iface.logic
+    logic.new_world(seed)
+    logic.init_player()
+    logic.next_turn()
+    logic.active = True
+    state = states.InGameState(iface)
+    iface.push(state)
+    state.update()
+    assert consts.DIRTY_RECTS
+    moves = [(1, 0)] * 3 + [(0, 1)] * 3 + [(-1, 0)] * 3
+    for direction in moves:
+        action = actions.MoveAction(logic.player, direction)
+        if action.can():
+            action.perform()
+        logic.next_turn()
+        # Frames in between turns animate sprites and the interface
+        for _ in range(10):
+            state.update()
+            iface.render()
+            full = pg.Surface(iface.screen.size)
+            full.fill(consts.BACKGROUND_COLOR)
+            state.map_renderer.draw(full)
+            state.ui_group.draw(full)
+            assert np.array_equal(
+                pg.surfarray.array2d(iface.screen), pg.surfarray.array2d(full)
+            )
+
+
+def summed_minimap_colors(map_, window, fov):
+    """Minimap colours as they were, before tiles were looked up in a table."""
+    player_col = np.asarray(pg.Color(consts.MINIMAP_PLAYER_COLOR))[0:3]
+    interact_col = np.asarray(pg.Color(consts.MINIMAP_INTERACT_COLOR))[0:3]
+    creature_col = np.asarray(pg.Color(consts.MINIMAP_CREATURE_COLOR))[0:3]
+    x0, y0 = window[0].start, window[1].start
+    grid = map_.components[comp.Tiles][window]
+    walkable = db.walkable[grid]
+    transparent = db.transparency[grid]
+    explored = map_.components[comp.Explored][window]
+    shape = grid.shape
+    grid = np.ones((shape[0], shape[1], 3))
+    for k in range(3):
+        grid[:, :, k] += 100 * explored * walkable
+        grid[:, :, k] += 100 * explored * walkable * fov
+        grid[:, :, k] += 40 * explored * transparent * (1 - walkable)
+        grid[:, :, k] += 40 * explored * transparent * (1 - walkable) * fov
+        grid[:, :, k] += 30 * explored * (~walkable)
+        grid[:, :, k] += 30 * explored * (~walkable) * fov
+    query = (
+        map_.registry.Q.all_of(
+            components=[comp.Position, comp.HP],
+            relations=[(comp.Map, map_)],
+        ).get_entities()
+        | map_.registry.Q.all_of(
+            components=[comp.Position, comp.Interaction],
+            relations=[(comp.Map, map_)],
+        )
+        .none_of(tags=[comp.Trap])
+        .get_entities()
+    )
+    for e in query:
+        ex, ey = e.components[comp.Position].xy
+        ex, ey = ex - x0, ey - y0
+        if not (0 <= ex < shape[0] and 0 <= ey < shape[1]):
+            continue
+        if explored[ex, ey]:
+            fov_mult = 0.75 ** (1 - fov[ex, ey])
+            if comp.Player in e.tags:
+                grid[ex, ey, :] = player_col * fov_mult
+            elif comp.Interaction in e.components and not comp.HP in e.components:
+                grid[ex, ey, :] = interact_col * fov_mult
+            elif fov[ex, ey] and comp.HP in e.components:
+                grid[ex, ey, :] = creature_col * fov_mult
+    return grid.astype(np.uint8)
+
+
+@pytest.mark.parametrize("seed", [3, 5])
+def test_minimap_matches_summed_colors(seed: int):
+    iface = game_interface.GameInterface()
+    logic = iface.logic
+    logic.new_world(seed)
+    logic.init_player()
+    logic.next_turn()
+    logic.active = True
+    state = states.InGameState(iface)
+    iface.push(state)
+    rng = np.random.RandomState(seed)
+    directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+    for _ in range(40):
+        state.update()
+        iface.render()
+        minimap = state.minimap
+        map_ = logic.player.relation_tag[comp.Map]
+        window = minimap.window_slices
+        assert window is not None and minimap.fov is not None
+        expected = summed_minimap_colors(map_, window, minimap.fov)
+        assert np.array_equal(minimap.colors, expected)
+        assert np.array_equal(
+            ui_elements.minimap_colors(map_, window, minimap.fov), expected
+        )
+        action = actions.MoveAction(logic.player, directions[rng.randint(4)])
+        if action.can():
+            action.perform()
+        logic.next_turn()
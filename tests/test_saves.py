@@ -0,0 +1,81 @@
+import os
+import pickle
+
+import pytest
+import tcod.ecs as ecs
+
+import consts
+import saves
+
+
+def write(path: str, **chunks: bytes):
+    manifest = pickle.dumps({"levels": [], "next_id": 0})
+    saves.write_save(path, {saves.MANIFEST_CHUNK: manifest} | chunks)
+
+
+def tear_journal(path: str):
+    # A header promising more payload than was written before a crash
+    with open(saves.journal_path(path), "ab") as f:
+        f.write(saves.JOURNAL_HEADER.pack(1, 100, 0) + b"torn")
+
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    saves.cached_journal.cache_clear()
+    return str(tmp_path / "game1.zip")
+
+
+def test_journal_overrides_base(path: str):
+    write(path, a=b"base", b=b"base")
+    write(path, a=b"journal")
+    assert os.path.exists(saves.journal_path(path))
+    assert saves.read_chunk(path, "a") == b"journal"
+    assert saves.read_chunk(path, "b") == b"base"
+
+
+def test_saves_after_torn_record_are_kept(path: str):
+    write(path, a=b"base")
+    write(path, a=b"before")
+    tear_journal(path)
+    assert saves.read_chunk(path, "a") == b"before"
+    write(path, a=b"after", b=b"after")
+    assert saves.read_chunk(path, "a") == b"after"
+    assert saves.read_chunk(path, "b") == b"after"
+
+
+def test_compaction_after_torn_record(path: str, monkeypatch: pytest.MonkeyPatch):
+    write(path, a=b"base")
+    write(path, a=b"before")
+    tear_journal(path)
+    write(path, b=b"after")
+    monkeypatch.setattr(consts, "SAVE_JOURNAL_LIMIT", 0)
+    write(path, c=b"compacted")
+    assert not os.path.exists(saves.journal_path(path))
+    assert saves.read_chunk(path, "a") == b"before"
+    assert saves.read_chunk(path, "b") == b"after"
+    assert saves.read_chunk(path, "c") == b"compacted"
+
+
+def test_journal_parsed_once_per_write(path: str, monkeypatch: pytest.MonkeyPatch):
+    write(path, a=b"base", b=b"base")
+    write(path, a=b"journal")
+    calls = []
+    read_journal = saves.read_journal
+    monkeypatch.setattr(
+        saves, "read_journal", lambda *args: calls.append(args) or read_journal(*args)
+    )
+    for name in ("a", "b", saves.MANIFEST_CHUNK):
+        saves.read_chunk(path, name)
+    assert len(calls) == 1
+    write(path, b=b"journal")
+    assert saves.read_chunk(path, "b") == b"journal"
+    assert len(calls) == 2
+
+
+def test_unknown_registry_state_fails_loudly():
+    reg = ecs.Registry()
+    state = reg.__getstate__() | {"_components_by_kind": {}}
+    with pytest.raises(ValueError):
+        saves.merge_state(state)
+    with pytest.raises(ValueError):
+        saves.split_state(state, {})
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from typing import TYPE_CHECKING, Callable
 
 import numpy as np
 import pygame as pg
 import tcod.ecs as ecs
+from numpy.typing import NDArray
 
 import actions
 import assets
@@ -35,6 +37,8 @@ class MapHPBar(pg.sprite.Sprite):
         self.light = -1
         self.rect: pg.Rect = pg.Rect(0, -4, consts.TILE_SIZE, consts.FONTSIZE // 4)
         self.image = pg.Surface(self.rect.size).convert_alpha()
+        # Set when the image is drawn into
+        self.dirty = False
 
     def update(self):
         x, y = self.parent.rect.x, self.parent.rect.bottom
@@ -61,6 +65,7 @@ class MapHPBar(pg.sprite.Sprite):
         tint = map_renderer.light_tint(light)
         pg.draw.rect(self.image, color, pg.Rect(0, 0, self.fill, self.rect.height))
         self.image.fill(tint, special_flags=pg.BLEND_MULT)
+        self.dirty = True
 
 
 class Bar(pg.sprite.Sprite):
@@ -87,6 +92,7 @@ class Bar(pg.sprite.Sprite):
         self.rect: pg.Rect = pg.Rect(x, y, width, height)
         self.fill = None
         self.image = pg.Surface(self.rect.size).convert_alpha()
+        self.dirty = False
         self.current_fun = current_fun
         self.max_fun = max_fun
         self.text_fun = text_fun
@@ -121,6 +127,7 @@ class Bar(pg.sprite.Sprite):
         self.image.blit(
             surf, surf.get_rect(midright=(self.rect.width, self.rect.height // 2))
         )
+        self.dirty = True
 
 
 class MessageLog(pg.sprite.Sprite):
@@ -144,6 +151,8 @@ class MessageLog(pg.sprite.Sprite):
         last_text = log[-1]
         if last_text == self.last_text and log_len == self.log_len:
             return
+        self.last_text = last_text
+        self.log_len = log_len
         text = "\n".join(log[-min(11, log_len + 1) :])
         self.image = self.font.render(
             text, False, consts.LOG_TEXT_COLOR, None
@@ -184,6 +193,94 @@ class Popup(pg.sprite.Sprite):
         self.counter += 1
 
 
+# Minimap colour of each tile class, indexed by minimap_classes() plus one in FOV
+MINIMAP_LUT = np.array(
+    [(1, 1, 1)] + [(v, v, v) for v in (101, 201, 71, 141, 31, 61)], np.uint8
+)
+
+
+@lru_cache
+def minimap_classes() -> NDArray[np.uint8]:
+    """Minimap class of every tile: floor, see-through wall or wall."""
+    return np.where(db.walkable, 1, np.where(db.transparency, 3, 5)).astype(np.uint8)
+
+
+def minimap_base(
+    map_: ecs.Entity, window: tuple[slice, slice], fov: NDArray[np.bool_]
+) -> NDArray[np.uint8]:
+    """Minimap colours of the tiles of a map window, (1, 1, 1) where unexplored."""
+    classes = minimap_classes()[map_.components[comp.Tiles][window]]
+    explored = map_.components[comp.Explored][window]
+    return MINIMAP_LUT[(classes + fov) * explored]
+
+
+def minimap_entities(map_: ecs.Entity) -> list[ecs.Entity]:
+    """Creatures and interactables of a map, those with a minimap marker."""
+    query = (
+        map_.registry.Q.all_of(
+            components=[comp.Position, comp.HP],
+            relations=[(comp.Map, map_)],
+        ).get_entities()
+        | map_.registry.Q.all_of(
+            components=[comp.Position, comp.Interaction],
+            relations=[(comp.Map, map_)],
+        )
+        .none_of(tags=[comp.Trap])
+        .get_entities()
+    )
+    return list(query)
+
+
+def minimap_markers(
+    map_: ecs.Entity,
+    entities: list[ecs.Entity],
+    window: tuple[slice, slice],
+    fov: NDArray[np.bool_],
+) -> list[tuple[tuple[int, int], tuple[int, ...]]]:
+    """Window cells and colours of the markers of entities seen on the minimap."""
+    x0, y0 = window[0].start, window[1].start
+    depth = map_.components[comp.Depth]
+    explored = map_.components[comp.Explored][window]
+    markers = []
+    for e in entities:
+        pos = e.components.get(comp.Position)
+        # Entities listed earlier may have died or left the map since
+        if pos is None or pos.depth != depth:
+            continue
+        ex, ey = pos.xy
+        ex, ey = ex - x0, ey - y0
+        if not (0 <= ex < fov.shape[0] and 0 <= ey < fov.shape[1]):
+            continue
+        if not explored[ex, ey]:
+            continue
+        if comp.Player in e.tags:
+            color = consts.MINIMAP_PLAYER_COLOR
+        elif comp.Interaction in e.components and not comp.HP in e.components:
+            color = consts.MINIMAP_INTERACT_COLOR
+        elif fov[ex, ey] and comp.HP in e.components:
+            color = consts.MINIMAP_CREATURE_COLOR
+        else:
+            continue
+        markers.append(((ex, ey), marker_color(color, bool(fov[ex, ey]))))
+    return markers
+
+
+@lru_cache
+def marker_color(color: str, in_fov: bool) -> tuple[int, ...]:
+    fov_mult = 0.75 ** (1 - in_fov)
+    return tuple(int(c * fov_mult) for c in pg.Color(color)[0:3])
+
+
+def minimap_colors(
+    map_: ecs.Entity, window: tuple[slice, slice], fov: NDArray[np.bool_]
+) -> NDArray[np.uint8]:
+    """Minimap colours of a map window, (1, 1, 1) where it is unexplored."""
+    grid = minimap_base(map_, window, fov)
+    for xy, rgb in minimap_markers(map_, minimap_entities(map_), window, fov):
+        grid[xy] = rgb
+    return grid
+
+
 class Minimap(pg.sprite.Sprite):
     def __init__(
         self,
@@ -199,18 +296,43 @@ class Minimap(pg.sprite.Sprite):
         self.depth = logic.map.components[comp.Depth]
         self.scale = scale
         self.follow_player = follow_player
-        w = consts.MAP_SHAPE[0] * self.scale
-        h = consts.MAP_SHAPE[1] * self.scale
         self.x, self.y = x, y
+        self.rect: pg.Rect = self.place(logic.map.components[comp.Tiles].shape)
+        self.colors: NDArray[np.uint8] | None = None
+        # Tile colours, rebuilt when the map, window, FOV or explored cells change
+        self.base: NDArray[np.uint8] | None = None
+        self.base_sources: tuple = ()
+        self.window_slices: tuple[slice, slice] | None = None
+        self.explored: NDArray[np.bool_] | None = None
+        self.fov: NDArray[np.bool_] | None = None
+        # Entities with markers, listed again each turn or on another map
+        self.entities: list[ecs.Entity] = []
+        self.entities_key: tuple[ecs.Entity, int] | None = None
+        self.markers: list[tuple[tuple[int, int], tuple[int, ...]]] = []
+
+    def view_shape(self, shape: tuple[int, int]) -> tuple[int, int]:
+        if not self.follow_player:
+            return shape
+        # Maps larger than the default only show the part around the player
+        return min(shape[0], consts.MAP_SHAPE[0]), min(shape[1], consts.MAP_SHAPE[1])
+
+    def place(self, shape: tuple[int, int]) -> pg.Rect:
+        w, h = self.view_shape(shape)
+        w, h = w * self.scale, h * self.scale
+        x, y = self.x, self.y
         if x < 0:
             x = consts.SCREEN_SHAPE[0] - w + x
         if y < 0:
             y = consts.SCREEN_SHAPE[1] - h + y
-        self.rect: pg.Rect = pg.Rect(x, y, w, h)
+        return pg.Rect(x, y, w, h)
 
-        self.player_col = np.asarray(pg.Color(consts.MINIMAP_PLAYER_COLOR))[0:3]
-        self.interact_col = np.asarray(pg.Color(consts.MINIMAP_INTERACT_COLOR))[0:3]
-        self.creature_col = np.asarray(pg.Color(consts.MINIMAP_CREATURE_COLOR))[0:3]
+    def window(
+        self, shape: tuple[int, int], center: tuple[int, int]
+    ) -> tuple[slice, slice]:
+        w, h = self.view_shape(shape)
+        x = min(max(0, center[0] - w // 2), shape[0] - w)
+        y = min(max(0, center[1] - h // 2), shape[1] - h)
+        return slice(x, x + w), slice(y, y + h)
 
     def inc_depth(self, delta: int):
         depth = self.depth + delta
@@ -226,49 +348,45 @@ class Minimap(pg.sprite.Sprite):
             self.depth = map_.components[comp.Depth]
         else:
             map_ = maps.get_map(self.logic.reg, self.depth, generate=False)
+        grid = map_.components[comp.Tiles]
+        self.rect = self.place(grid.shape)
+        if not self.follow_player:
             screen = pg.display.get_surface().size
             self.rect.center = ((self.x + screen[0]) // 2, (self.y + screen[1]) // 2)
-        grid = map_.components[comp.Tiles]
-        walkable = db.walkable[grid]
-        transparent = db.transparency[grid]
-        explored = map_.components[comp.Explored]
-        shape = grid.shape
-        if comp.FOV in player.components and self.depth == pdepth:
-            fov = player.components[comp.FOV]
-        else:
-            fov = np.full(shape, False)
-        grid = np.ones((shape[0], shape[1], 3))
-        for k in range(3):
-            grid[:, :, k] += 100 * explored * walkable
-            grid[:, :, k] += 100 * explored * walkable * fov
-            grid[:, :, k] += 40 * explored * transparent * (1 - walkable)
-            grid[:, :, k] += 40 * explored * transparent * (1 - walkable) * fov
-            grid[:, :, k] += 30 * explored * (~walkable)
-            grid[:, :, k] += 30 * explored * (~walkable) * fov
-        #
-        query = (
-            map_.registry.Q.all_of(
-                components=[comp.Position, comp.HP],
-                relations=[(comp.Map, map_)],
-            ).get_entities()
-            | map_.registry.Q.all_of(
-                components=[comp.Position, comp.Interaction],
-                relations=[(comp.Map, map_)],
-            )
-            .none_of(tags=[comp.Trap])
-            .get_entities()
-        )
-        for e in query:
-            ex, ey = e.components[comp.Position].xy
-            if explored[ex, ey]:
-                fov_mult = 0.75 ** (1 - fov[ex, ey])
-                if comp.Player in e.tags:
-                    grid[ex, ey, :] = self.player_col * fov_mult
-                elif comp.Interaction in e.components and not comp.HP in e.components:
-                    grid[ex, ey, :] = self.interact_col * fov_mult
-                elif fov[ex, ey] and comp.HP in e.components:
-                    grid[ex, ey, :] = self.creature_col * fov_mult
-        self.image = pg.surfarray.make_surface(grid.astype(np.uint8))
+        window = self.window(grid.shape, player.components[comp.Position].xy)
+        fov_window = None
+        if self.depth == pdepth:
+            fov_window = player.components.get(comp.FOV)
+        explored = map_.components[comp.Explored][window]
+        sources = (map_, grid, fov_window)
+        if (
+            self.base is None
+            or any(a is not b for a, b in zip(sources, self.base_sources))
+            or window != self.window_slices
+            or not np.array_equal(explored, self.explored)
+        ):
+            if fov_window is not None:
+                self.fov = fov_window.full(grid.shape)[window]
+            else:
+                self.fov = np.full(grid[window].shape, False)
+            self.base = minimap_base(map_, window, self.fov)
+            self.base_sources = sources
+            self.window_slices = window
+            self.explored = explored.copy()
+            self.colors = None
+        entities_key = (map_, self.logic.turn_count)
+        if entities_key != self.entities_key:
+            self.entities = minimap_entities(map_)
+            self.entities_key = entities_key
+        assert self.fov is not None
+        markers = minimap_markers(map_, self.entities, window, self.fov)
+        if self.colors is not None and markers == self.markers:
+            return
+        self.markers = markers
+        self.colors = self.base.copy()
+        for xy, rgb in markers:
+            self.colors[xy] = rgb
+        self.image = pg.surfarray.make_surface(self.colors)
         self.image.set_colorkey((1, 1, 1))
         self.image = pg.transform.scale_by(self.image, self.scale)
 
@@ -320,6 +438,7 @@ class StatsHUD(pg.sprite.Sprite):
         text = " ".join([f"{k}:{v()}" for k, v in self.elements.items()])
         if self.text == text:
             return
+        self.text = text
         self.image = self.font.render(text, False, "#FFFFFF")
         if self.image.size != self.rect.size:
             self.rect = self.image.get_rect(topleft=self.rect.topleft)
@@ -391,12 +510,29 @@ class ConditionsHUD(pg.sprite.Sprite):
                 for k, v in conditions.affecting(self.logic.player).items()
             ]
         )
-        if text == self.text and self.image is None:
+        if text == self.text and self.image is not None:
             return
+        self.text = text
         self.image = self.font.render(text, False, "#FFFFFF")
         self.rect = self.image.get_rect(topleft=self.rect.topleft)
 
 
+class SaveIndicator(pg.sprite.Sprite):
+    def __init__(self, group: pg.sprite.Group, font: pg.Font, logic: GameLogic):
+        super().__init__(group)
+        self.logic = logic
+        self.saving_image = font.render("Saving...", False, consts.SAVING_TEXT_COLOR)
+        self.blank_image = pg.Surface((1, 1)).convert_alpha()
+        self.blank_image.fill("#00000000")
+        self.image = self.blank_image
+        self.rect = self.saving_image.get_rect(
+            bottomright=(consts.SCREEN_SHAPE[0] - 8, consts.SCREEN_SHAPE[1] - 8)
+        )
+
+    def update(self):
+        self.image = self.saving_image if self.logic.is_saving else self.blank_image
+
+
 class InventoryMenu(gui_elements.Menu):
     def __init__(
         self,